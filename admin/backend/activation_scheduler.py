@@ -0,0 +1,163 @@
+"""
+Планировщик активации товаров по датам начала и окончания.
+
+Вместо пересчета всей таблицы в полночь держит min-кучу ближайших границ (start_date / end_date)
+на горизонт ACTIVATION_HORIZON секунд, просыпается ровно к следующей границе и переключает
+только товары, у которых граница наступила. Границы берутся индексными запросами по start_date и end_date.
+
+API после изменения дат публикует id товара в канал SCHEDULE_CHANNEL, и планировщик сразу
+пересчитывает этот товар и добавляет его границы в кучу. На каждом новом горизонте выполняется
+полная сверка — она подбирает изменения, уведомление о которых потерялось.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from database import AsyncScopedSession
+from models import Goods
+
+logger = logging.getLogger('goods_activity_worker')
+
+SCHEDULE_CHANNEL = "goods:schedule"
+# На сколько секунд вперед загружаются границы; по истечении — полная сверка и перезагрузка
+ACTIVATION_HORIZON = int(os.getenv("ACTIVATION_HORIZON", "3600"))
+# Товар активен по end_date включительно, поэтому выключается сразу после нее
+END_GRACE = timedelta(milliseconds=1)
+
+ApplyActivity = Callable[[Optional[List[int]]], Awaitable[List[int]]]
+
+
+async def notify_schedule_changed(redis_client, goods_ids: Optional[Iterable[int]] = None):
+    """Сообщает планировщику об изменении дат товаров (None — перечитать все)"""
+    payload = ",".join(str(goods_id) for goods_id in goods_ids) if goods_ids is not None else "*"
+    try:
+        await redis_client.publish(SCHEDULE_CHANNEL, payload)
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить планировщик активации: {e}")
+
+
+async def load_transitions(since: datetime, until: datetime, goods_ids: Optional[List[int]] = None) -> List[Tuple[datetime, int]]:
+    """Границы в (since, until]: два диапазонных запроса по индексам start_date и end_date"""
+    starts = select(Goods.id, Goods.start_date).where(Goods.start_date > since, Goods.start_date <= until)
+    ends = select(Goods.id, Goods.end_date).where(Goods.end_date > since - END_GRACE, Goods.end_date <= until - END_GRACE)
+    if goods_ids is not None:
+        starts = starts.where(Goods.id.in_(goods_ids))
+        ends = ends.where(Goods.id.in_(goods_ids))
+    async with AsyncScopedSession() as db:
+        transitions = [(start_date, goods_id) for goods_id, start_date in (await db.execute(starts)).all()]
+        transitions.extend((end_date + END_GRACE, goods_id) for goods_id, end_date in (await db.execute(ends)).all())
+    return transitions
+
+
+class ActivationScheduler:
+    def __init__(self, apply: ApplyActivity, redis_client=None, horizon: int = ACTIVATION_HORIZON):
+        # apply(ids) переключает активность указанных товаров (None — всех) и возвращает измененные id
+        self.apply = apply
+        self.redis = redis_client
+        self.horizon = timedelta(seconds=horizon)
+        self.horizon_end = None
+        self._heap = []
+        self._pubsub = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def reload(self) -> None:
+        """Полная сверка и загрузка границ на следующий горизонт"""
+        now = datetime.now(timezone.utc)
+        self.horizon_end = now + self.horizon
+        await self.apply(None)
+        self._heap = await load_transitions(now, self.horizon_end)
+        heapq.heapify(self._heap)
+        logger.info(f"Загружено {len(self._heap)} границ активности до {self.horizon_end.isoformat()}")
+
+    async def refresh(self, goods_ids: List[int]) -> None:
+        """Пересчитывает товары после правки и добавляет их новые границы (устаревшие записи кучи безвредны)"""
+        now = datetime.now(timezone.utc)
+        await self.apply(goods_ids)
+        for transition in await load_transitions(now, self.horizon_end, goods_ids):
+            heapq.heappush(self._heap, transition)
+
+    async def run_due(self) -> List[int]:
+        """Переключает товары, чьи границы уже наступили"""
+        now = datetime.now(timezone.utc)
+        due = set()
+        while self._heap and self._heap[0][0] <= now:
+            due.add(heapq.heappop(self._heap)[1])
+        if not due:
+            return []
+        return await self.apply(sorted(due))
+
+    def next_wakeup(self) -> datetime:
+        if self._heap and self._heap[0][0] < self.horizon_end:
+            return self._heap[0][0]
+        return self.horizon_end
+
+    async def run(self) -> None:
+        await self._subscribe()
+        await self.reload()
+        while True:
+            if datetime.now(timezone.utc) >= self.horizon_end:
+                if self._pubsub is None:
+                    await self._subscribe()
+                await self.reload()
+                continue
+            await self.run_due()
+
+            timeout = (self.next_wakeup() - datetime.now(timezone.utc)).total_seconds()
+            changed = await self._wait(max(timeout, 0))
+            if changed is None:
+                continue
+            if changed == "*":
+                await self.reload()
+            else:
+                await self.refresh(changed)
+
+    async def _subscribe(self) -> None:
+        if self.redis is None:
+            return
+        try:
+            self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(SCHEDULE_CHANNEL)
+        except Exception as e:
+            logger.warning(f"Не удалось подписаться на {SCHEDULE_CHANNEL}, работаем только по горизонту: {e}")
+            self._pubsub = None
+
+    async def _wait(self, timeout: float):
+        """
+        Ждет timeout секунд или уведомления. Возвращает None, "*" или список id;
+        накопившиеся уведомления склеиваются в одно.
+        """
+        if self._pubsub is None:
+            await asyncio.sleep(timeout)
+            return None
+        try:
+            message = await self._pubsub.get_message(timeout=timeout)
+            changed = set()
+            while message is not None:
+                payload = message["data"]
+                if isinstance(payload, bytes):
+                    payload = payload.decode()
+                if payload == "*":
+                    return "*"
+                changed.update(int(goods_id) for goods_id in payload.split(",") if goods_id)
+                message = await self._pubsub.get_message(timeout=0)
+            return sorted(changed) or None
+        except Exception as e:
+            # Без подписки границы отрабатываются по времени, а правки подберет сверка на следующем горизонте
+            logger.warning(f"Подписка на {SCHEDULE_CHANNEL} потеряна: {e}")
+            self._pubsub = None
+            return None
+
+    async def close(self) -> None:
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.aclose()
+            except Exception:
+                pass
@@ -0,0 +1,31 @@
+"""Add goods start_date/end_date indexes for the activation scheduler
+
+Revision ID: d4f1a7b9c2e8
+Revises: c3e8f0a2b5d6
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import logging
+
+# revision identifiers, used by Alembic.
+revision = 'd4f1a7b9c2e8'
+down_revision = 'c3e8f0a2b5d6'
+branch_labels = None
+depends_on = None
+
+# Настраиваем логирование
+logger = logging.getLogger("alembic.migration")
+
+def upgrade():
+    # Планировщик активации выбирает ближайшие даты начала и окончания диапазонными запросами
+    op.execute("CREATE INDEX IF NOT EXISTS ix_goods_start_date ON goods (start_date)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_goods_end_date ON goods (end_date)")
+    logger.info("Созданы индексы по датам начала и окончания товаров")
+
+
+def downgrade():
+    """Отмена миграции"""
+    op.execute("DROP INDEX IF EXISTS ix_goods_end_date")
+    op.execute("DROP INDEX IF EXISTS ix_goods_start_date")
+    logger.info("Индексы по датам товаров удалены")
@@ -0,0 +1,33 @@
+"""Add pg_trgm GIN indexes for goods search
+
+Revision ID: c3e8f0a2b5d6
+Revises: b7c2d9e1f3a4
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import logging
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8f0a2b5d6'
+down_revision = 'b7c2d9e1f3a4'
+branch_labels = None
+depends_on = None
+
+# Настраиваем логирование
+logger = logging.getLogger("alembic.migration")
+
+def upgrade():
+    # pg_trgm — доверенное расширение (PG13+), владелец базы может его создать
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # GIN-индексы обслуживают ILIKE '%q%', оператор % и similarity() по названию и артикулу
+    op.execute("CREATE INDEX IF NOT EXISTS ix_goods_name_trgm ON goods USING gin (name gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_goods_article_trgm ON goods USING gin (article gin_trgm_ops)")
+    logger.info("Созданы триграммные индексы для поиска товаров")
+
+
+def downgrade():
+    """Отмена миграции (само расширение оставляем)"""
+    op.execute("DROP INDEX IF EXISTS ix_goods_article_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_goods_name_trgm")
+    logger.info("Триграммные индексы удалены")
@@ -0,0 +1,31 @@
+"""Add composite indexes for keyset pagination
+
+Revision ID: b7c2d9e1f3a4
+Revises: a5b1c3d4e5f6
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import logging
+
+# revision identifiers, used by Alembic.
+revision = 'b7c2d9e1f3a4'
+down_revision = 'a5b1c3d4e5f6'
+branch_labels = None
+depends_on = None
+
+# Настраиваем логирование
+logger = logging.getLogger("alembic.migration")
+
+def upgrade():
+    # Индексы под ORDER BY (date, id) и (reserved_at, id) для курсорной пагинации
+    op.execute("CREATE INDEX IF NOT EXISTS ix_daily_availability_date_id ON daily_availability (date, id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_reservations_reserved_at_id ON reservations (reserved_at, id)")
+    logger.info("Созданы индексы для курсорной пагинации")
+
+
+def downgrade():
+    """Отмена миграции"""
+    op.execute("DROP INDEX IF EXISTS ix_reservations_reserved_at_id")
+    op.execute("DROP INDEX IF EXISTS ix_daily_availability_date_id")
+    logger.info("Индексы для курсорной пагинации удалены")
@@ -0,0 +1,110 @@
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DailyAvailability
+
+logger = logging.getLogger('api')
+
+AVAILABILITY_COLUMNS = ["goods_id", "date", "available_quantity"]
+
+
+def availability_dates(start_date: Optional[datetime], end_date: Optional[datetime], today: datetime) -> List[datetime]:
+    """
+    Дни, на которые нужна доступность: без дат берется сегодня и +30 дней,
+    часовой пояс отбрасывается, начало не раньше сегодняшнего дня.
+    """
+    if not start_date:
+        start_date = today
+    if not end_date:
+        end_date = today + timedelta(days=30)
+    if start_date.tzinfo:
+        start_date = start_date.replace(tzinfo=None)
+    if end_date.tzinfo:
+        end_date = end_date.replace(tzinfo=None)
+    start_date = max(start_date, today)
+
+    days = (end_date - start_date).days + 1
+    return [start_date + timedelta(days=offset) for offset in range(max(days, 0))]
+
+
+def generate_quantities(count: int, min_daily: int, max_daily: int, rng: random.Random = random) -> List[int]:
+    """Количества на все дни диапазона одним вызовом вместо randint на каждый день"""
+    if min_daily > max_daily:
+        raise ValueError(f"min_daily ({min_daily}) больше max_daily ({max_daily})")
+    return rng.choices(range(min_daily, max_daily + 1), k=count)
+
+
+def build_availability_rows(goods_id: int, start_date: Optional[datetime], end_date: Optional[datetime],
+                            min_daily: int, max_daily: int, today: datetime) -> List[tuple]:
+    """Строки (goods_id, date, available_quantity) для одного товара"""
+    dates = availability_dates(start_date, end_date, today)
+    quantities = generate_quantities(len(dates), min_daily, max_daily)
+    return [(goods_id, date, quantity) for date, quantity in zip(dates, quantities)]
+
+
+async def copy_availability(db: AsyncSession, rows: Sequence[tuple]) -> int:
+    """Запись строк доступности через COPY (только asyncpg)"""
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        DailyAvailability.__tablename__,
+        records=rows,
+        columns=AVAILABILITY_COLUMNS
+    )
+    return len(rows)
+
+
+async def insert_availability(db: AsyncSession, rows: Sequence[tuple]) -> int:
+    """Запись строк доступности одним многострочным INSERT"""
+    await db.execute(
+        insert(DailyAvailability.__table__),
+        [dict(zip(AVAILABILITY_COLUMNS, row)) for row in rows]
+    )
+    return len(rows)
+
+
+async def write_availability(db: AsyncSession, rows: Sequence[tuple]) -> int:
+    """
+    Записывает строки доступности одной операцией: COPY через asyncpg,
+    для остальных драйверов — один многострочный INSERT.
+    """
+    if not rows:
+        return 0
+    conn = await db.connection()
+    if conn.dialect.driver == "asyncpg":
+        return await copy_availability(db, rows)
+    return await insert_availability(db, rows)
+
+
+async def regenerate_availability(db: AsyncSession, goods_list: Iterable) -> int:
+    """
+    Перегенерирует доступность с сегодняшнего дня для набора товаров в одной транзакции:
+    один DELETE будущих записей и одна запись всех новых строк.
+    goods_list — объекты или строки с полями id, start_date, end_date, min_daily, max_daily.
+    Коммит остается за вызывающим кодом.
+    """
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    goods_list = list(goods_list)
+    if not goods_list:
+        return 0
+
+    rows = []
+    for goods in goods_list:
+        rows.extend(build_availability_rows(
+            goods.id, goods.start_date, goods.end_date, goods.min_daily, goods.max_daily, today
+        ))
+
+    await db.execute(
+        delete(DailyAvailability).where(
+            DailyAvailability.goods_id.in_([goods.id for goods in goods_list]),
+            DailyAvailability.date >= today
+        )
+    )
+    count = await write_availability(db, rows)
+    logger.info(f"Сгенерировано {count} записей доступности для {len(goods_list)} товаров")
+    return count
@@ -0,0 +1,92 @@
+"""
+Обучаемый индекс vol -> basket-хост.
+
+Номера basket растут вместе с vol, поэтому две найденные точки с одинаковым хостом
+задают интервал: любой vol между ними лежит на том же basket и проверять его не нужно.
+Индекс хранит только концы таких интервалов (отсортированные списки, поиск через bisect)
+и сохраняется в Redis-хэше, чтобы переживать перезапуски.
+"""
+
+import bisect
+import logging
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+BASKET_INDEX_KEY = "basket:index"
+
+
+class BasketIndex:
+    def __init__(self):
+        self._vols = []
+        self._hosts = []
+        self.redis = None
+
+    def __len__(self):
+        return len(self._vols)
+
+    async def load(self, redis_client) -> None:
+        """Подключает Redis и загружает сохраненные точки"""
+        self.redis = redis_client
+        try:
+            stored = await redis_client.hgetall(BASKET_INDEX_KEY)
+        except RedisError as e:
+            logger.error(f"Не удалось загрузить индекс basket-хостов: {e}")
+            return
+        for vol, host in stored.items():
+            self._insert(int(vol), host)
+        logger.info(f"Индекс basket-хостов загружен: {len(self._vols)} точек")
+
+    def lookup(self, vol: int) -> Optional[str]:
+        """Хост для vol, если vol совпадает с точкой индекса или лежит внутри интервала одного хоста"""
+        i = bisect.bisect_right(self._vols, vol)
+        if i and self._vols[i - 1] == vol:
+            return self._hosts[i - 1]
+        if 0 < i < len(self._vols) and self._hosts[i - 1] == self._hosts[i]:
+            return self._hosts[i]
+        return None
+
+    def bounds(self, vol: int) -> Tuple[Optional[int], Optional[int]]:
+        """Диапазон возможных номеров basket для vol по соседним точкам (None — граница неизвестна)"""
+        i = bisect.bisect_right(self._vols, vol)
+        low = int(self._hosts[i - 1]) if i else None
+        high = int(self._hosts[i]) if i < len(self._vols) else None
+        return low, high
+
+    async def record(self, vol: int, host: str) -> None:
+        """Запоминает найденный хост и сохраняет изменения в Redis"""
+        removed = self._insert(vol, host)
+        if self.redis is None:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(BASKET_INDEX_KEY, str(vol), host)
+                if removed:
+                    pipe.hdel(BASKET_INDEX_KEY, *[str(v) for v in removed])
+                await pipe.execute()
+        except RedisError as e:
+            logger.error(f"Не удалось сохранить индекс basket-хостов: {e}")
+
+    def _insert(self, vol: int, host: str) -> list:
+        """
+        Вставляет точку и убирает внутренние точки интервалов: точка между двумя соседями
+        с тем же хостом ничего не добавляет. Возвращает удаленные vol.
+        """
+        i = bisect.bisect_left(self._vols, vol)
+        if i < len(self._vols) and self._vols[i] == vol:
+            self._hosts[i] = host
+        else:
+            self._vols.insert(i, vol)
+            self._hosts.insert(i, host)
+
+        removed = []
+        for j in (i + 1, i, i - 1):
+            if 0 < j < len(self._vols) - 1 and self._hosts[j - 1] == self._hosts[j] == self._hosts[j + 1]:
+                removed.append(self._vols.pop(j))
+                self._hosts.pop(j)
+        return removed
+
+
+basket_index = BasketIndex()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Бенчмарк записи доступности: по одному ORM-объекту на день (как было) против многострочного INSERT
+и COPY через asyncpg (availability.py). После каждой записи строки читаются обратно и сверяются
+со сгенерированными. Данные создаются внутри транзакции, которая откатывается в конце.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python bench_availability.py
+Размеры можно задать: BENCH_GOODS=50 BENCH_DAYS=365
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.future import select
+
+from availability import build_availability_rows, copy_availability, insert_availability
+from models import Goods, DailyAvailability
+from test_support import rollback_session
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("api").setLevel(logging.ERROR)
+logger = logging.getLogger("bench_availability")
+
+GOODS = int(os.getenv("BENCH_GOODS", "50"))
+DAYS = int(os.getenv("BENCH_DAYS", "365"))
+REPEATS = int(os.getenv("BENCH_REPEATS", "3"))
+MIN_DAILY = 1
+MAX_DAILY = 20
+
+
+async def orm_availability(db, rows):
+    """Прежний способ: объект DailyAvailability на каждый день"""
+    for goods_id, date, quantity in rows:
+        db.add(DailyAvailability(goods_id=goods_id, date=date, available_quantity=quantity))
+    await db.flush()
+    return len(rows)
+
+
+WRITERS = {
+    "orm": orm_availability,
+    "insert": insert_availability,
+    "copy": copy_availability,
+}
+
+
+async def seed(db, today):
+    result = await db.execute(
+        insert(Goods).returning(Goods.id),
+        [{
+            "name": f"Бенчмарк доступности {i}",
+            "price": 1000,
+            "article": str(20_000_000 + i),
+            "url": "",
+            "image": "",
+            "start_date": today,
+            "end_date": today + timedelta(days=DAYS - 1),
+            "min_daily": MIN_DAILY,
+            "max_daily": MAX_DAILY,
+        } for i in range(GOODS)]
+    )
+    return list(result.scalars().all())
+
+
+def generate_rows(goods_ids, today):
+    rows = []
+    for goods_id in goods_ids:
+        rows.extend(build_availability_rows(
+            goods_id, today, today + timedelta(days=DAYS - 1), MIN_DAILY, MAX_DAILY, today
+        ))
+    return rows
+
+
+async def load_rows(db, goods_ids):
+    result = await db.execute(
+        select(DailyAvailability.goods_id, DailyAvailability.date, DailyAvailability.available_quantity)
+        .where(DailyAvailability.goods_id.in_(goods_ids))
+    )
+    # date — timestamptz. Даты без пояса asyncpg переводит через astimezone(), то есть считает
+    # их локальным временем хоста; обратное преобразование делает сверку независимой от TZ хоста
+    return [
+        (goods_id, date.astimezone().replace(tzinfo=None), quantity)
+        for goods_id, date, quantity in result.all()
+    ]
+
+
+def check_rows(name, expected, written):
+    assert len(written) == len(expected), f"{name}: записано {len(written)} строк, ожидалось {len(expected)}"
+    assert sorted(written) == sorted(expected), f"{name}: записанные строки не совпадают со сгенерированными"
+    assert all(MIN_DAILY <= quantity <= MAX_DAILY for _, _, quantity in written), f"{name}: количество вне диапазона"
+
+
+async def bench(name, writer):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    timings = []
+    for _ in range(REPEATS):
+        async with rollback_session() as db:
+            goods_ids = await seed(db, today)
+            started = time.perf_counter()
+            rows = generate_rows(goods_ids, today)
+            count = await writer(db, rows)
+            timings.append(time.perf_counter() - started)
+
+            assert count == len(rows)
+            db.expunge_all()
+            check_rows(name, rows, await load_rows(db, goods_ids))
+    return statistics.median(timings)
+
+
+async def main():
+    report = {name: await bench(name, writer) for name, writer in WRITERS.items()}
+    logger.info(f"=== {GOODS} товаров x {DAYS} дней ({GOODS * DAYS} строк), медиана из {REPEATS}, с ===")
+    baseline = report["orm"]
+    for name, elapsed in report.items():
+        logger.info(f"{name:>8}: {elapsed:8.3f}   x{baseline / elapsed:.1f}")
+    logger.info("Строки всех способов совпали со сгенерированными")
+
+
+if __name__ == "__main__":
+    print("Запуск бенчмарка записи доступности...")
+    asyncio.run(main())
+    print("Бенчмарк завершен.")
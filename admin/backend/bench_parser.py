@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Бенчмарк парсера WB: временная сессия aiohttp на каждый вызов против общей сессии с пулом.
+Поднимает локальный mock-сервер card.wb.ru / basket-XX, сеть не нужна.
+Первый запрос на каждом новом соединении задерживается на MOCK_CONNECT_MS — так имитируется
+цена DNS + TCP + TLS, которую на реальном WB платит каждое новое соединение.
+Каждая серия начинается с пустым индексом basket-хостов и кэшем карточек, а каждый артикул лежит
+в своем vol, поэтому обе серии запрашивают карточку и перебирают basket для каждого парсинга.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python bench_parser.py
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import web
+
+import parser
+from basket_index import BasketIndex
+from card_cache import CardCache
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("parser").setLevel(logging.ERROR)
+logging.getLogger("aiohttp.access").setLevel(logging.ERROR)
+logger = logging.getLogger("bench_parser")
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+MOCK_CONNECT_MS = float(os.getenv("MOCK_CONNECT_MS", "20"))
+# Картинка находится только на этом basket, до него парсер перебирает basket-20...
+WORKING_BASKET = "23"
+
+
+class MockWB:
+    def __init__(self):
+        self.connections = set()
+        self.card_requests = 0
+        self.image_probes = 0
+
+    def reset(self):
+        self.connections.clear()
+        self.card_requests = 0
+        self.image_probes = 0
+
+    async def delay_new_connection(self, request):
+        transport = request.transport
+        if transport not in self.connections:
+            self.connections.add(transport)
+            await asyncio.sleep(MOCK_CONNECT_MS / 1000)
+
+    async def card(self, request):
+        await self.delay_new_connection(request)
+        self.card_requests += 1
+        nm = request.query["nm"]
+        return web.json_response({
+            "data": {"products": [{"id": int(nm), "name": f"Товар {nm}", "salePriceU": 150000}]}
+        })
+
+    async def image(self, request):
+        await self.delay_new_connection(request)
+        self.image_probes += 1
+        status = 200 if request.match_info["host"] == WORKING_BASKET else 404
+        # Как nginx на basket-XX: с Content-Length соединение после HEAD можно переиспользовать
+        return web.Response(status=status, headers={"Content-Length": "0"})
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/cards/v1/detail", self.card)
+        app.router.add_route("HEAD", "/basket-{host}/{tail:.*}", self.image)
+        return app
+
+
+async def run_series(urls, session):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    timings = []
+
+    async def parse_one(url):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await parser.parse_wildberries_url(url, session)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert result and result["image"], f"Парсинг {url} не удался"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(parse_one(url) for url in urls))
+    return timings, time.perf_counter() - started
+
+
+def report(label, timings, total, mock):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    logger.info(
+        f"{label:>16}: медиана {statistics.median(timings):7.2f} мс, p95 {p95:7.2f} мс, "
+        f"{len(timings) / total:7.1f} парсингов/с, новых соединений {len(mock.connections)}, "
+        f"запросов карточек {mock.card_requests}, HEAD к basket {mock.image_probes}"
+    )
+
+
+def check_paths(label, mock):
+    """Серия действительно прошла через API карточек и перебор basket на каждом парсинге"""
+    assert mock.card_requests == REQUESTS, f"{label}: запросов карточек {mock.card_requests}, ожидалось {REQUESTS}"
+    assert mock.image_probes >= REQUESTS, f"{label}: HEAD к basket {mock.image_probes} — часть парсингов взяла хост из индекса"
+
+
+def reset_state(mock):
+    """Серии не должны делиться выученным индексом basket-хостов и кэшем карточек"""
+    mock.reset()
+    parser.basket_index = BasketIndex()
+    parser.card_cache = CardCache()
+
+
+async def main():
+    mock = MockWB()
+    runner = web.AppRunner(mock.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    parser.CARD_API_URL = f"http://127.0.0.1:{port}/cards/v1/detail"
+    parser.BASKET_URL = f"http://127.0.0.1:{port}/basket-{{host}}"
+    # Свой vol (nm // 100000) у каждого артикула: индекс не может пропустить перебор basket
+    urls = [f"https://www.wildberries.ru/catalog/{50_000_000 + i * 100_000}/detail.aspx" for i in range(REQUESTS)]
+
+    logger.info(f"{REQUESTS} парсингов, параллельно {CONCURRENCY}, цена нового соединения {MOCK_CONNECT_MS} мс")
+    try:
+        reset_state(mock)
+        timings, total = await run_series(urls, None)
+        report("сессия на вызов", timings, total, mock)
+        check_paths("сессия на вызов", mock)
+
+        reset_state(mock)
+        session = parser.create_wb_session()
+        try:
+            timings, total = await run_series(urls, session)
+        finally:
+            await session.close()
+        report("общая сессия", timings, total, mock)
+        check_paths("общая сессия", mock)
+        logger.info("В обеих сериях каждый парсинг запрашивал карточку и перебирал basket, индекс и кэш не использовались")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    print("Запуск бенчмарка парсера...")
+    asyncio.run(main())
+    print("Бенчмарк завершен.")
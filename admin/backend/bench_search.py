@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Бенчмарк поиска товаров: ILIKE без индекса против pg_trgm GIN + точного поиска по артикулу.
+Данные создаются внутри транзакции, которая откатывается в конце.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python bench_search.py
+Размеры выборки можно задать: BENCH_SIZES=10000,100000
+"""
+
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import insert, or_, text
+from sqlalchemy.future import select
+
+import search
+from models import Goods
+from test_support import rollback_session
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("api").setLevel(logging.ERROR)
+logger = logging.getLogger("bench_search")
+
+SIZES = [int(size) for size in os.getenv("BENCH_SIZES", "10000,100000").split(",")]
+REPEATS = int(os.getenv("BENCH_REPEATS", "20"))
+
+WORDS = [
+    "куртка", "платье", "кроссовки", "рюкзак", "наушники", "чехол", "футболка", "джинсы",
+    "зарядка", "кружка", "свитер", "шапка", "ботинки", "сумка", "часы", "лампа",
+]
+COLORS = ["черный", "белый", "синий", "красный", "зеленый", "бежевый"]
+
+
+async def seed(db, size):
+    rng = random.Random(size)
+    rows = []
+    for i in range(size):
+        article = str(10_000_000 + i * 7)
+        rows.append({
+            "name": f"{rng.choice(WORDS)} {rng.choice(COLORS)} модель {rng.randint(1, 5000)}",
+            "price": rng.randint(100, 20000),
+            "article": article,
+            "url": f"https://www.wildberries.ru/catalog/{article}/detail.aspx",
+            "image": "",
+        })
+    for start in range(0, size, 5000):
+        await db.execute(insert(Goods), rows[start:start + 5000])
+    await db.execute(text("ANALYZE goods"))
+    return rows
+
+
+async def measure(db, run_query):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        await run_query()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def legacy_search(db, q):
+    pattern = f"%{q}%"
+    result = await db.execute(
+        select(Goods).where(or_(Goods.name.ilike(pattern), Goods.article.ilike(pattern))).limit(50)
+    )
+    return result.scalars().all()
+
+
+async def bench(size):
+    async with rollback_session() as db:
+        rows = await seed(db, size)
+        queries = {
+            "слово": "наушники",
+            "опечатка": "наушникы",
+            "фраза": "кроссовки синий",
+            "артикул": rows[size // 2]["article"],
+        }
+
+        report = {}
+        for label, q in queries.items():
+            report[label] = {"ilike": await measure(db, lambda: legacy_search(db, q))}
+
+        try:
+            async with db.begin_nested():
+                await db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            logger.error(f"pg_trgm недоступен, сравнение невозможно: {e}")
+            return report
+        await db.execute(text("CREATE INDEX ix_goods_name_trgm_bench ON goods USING gin (name gin_trgm_ops)"))
+        await db.execute(text("CREATE INDEX ix_goods_article_trgm_bench ON goods USING gin (article gin_trgm_ops)"))
+        await db.execute(text("ANALYZE goods"))
+        search._trgm_available = None
+
+        for label, q in queries.items():
+            report[label]["trgm"] = await measure(db, lambda: search.search_goods(db, q))
+        return report
+
+
+async def main():
+    for size in SIZES:
+        report = await bench(size)
+        logger.info(f"=== {size} товаров, медиана из {REPEATS} запросов, мс ===")
+        for label, timings in report.items():
+            ilike = timings["ilike"]
+            trgm = timings.get("trgm")
+            if trgm is None:
+                logger.info(f"{label:>10}: ILIKE {ilike:8.2f}")
+            else:
+                logger.info(f"{label:>10}: ILIKE {ilike:8.2f}   pg_trgm {trgm:8.2f}   x{ilike / trgm:.1f}")
+
+
+if __name__ == "__main__":
+    print("Запуск бенчмарка поиска...")
+    asyncio.run(main())
+    print("Бенчмарк завершен.")
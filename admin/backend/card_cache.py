@@ -0,0 +1,126 @@
+"""
+Кэш карточек товаров WB по nm id.
+
+Найденные карточки живут CARD_CACHE_TTL секунд, несуществующие артикулы — CARD_CACHE_NEGATIVE_TTL.
+Одновременные запросы одного артикула внутри процесса склеиваются в один запрос к WB.
+Счетчики попаданий и промахов копятся в Redis-хэше card:stats, чтобы их видели все воркеры.
+Без Redis кэш работает только как склейка одновременных запросов.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+CARD_CACHE_PREFIX = "card"
+CARD_STATS_KEY = "card:stats"
+CARD_CACHE_TTL = int(os.getenv("CARD_CACHE_TTL", "600"))
+CARD_CACHE_NEGATIVE_TTL = int(os.getenv("CARD_CACHE_NEGATIVE_TTL", "300"))
+
+# Запись о несуществующем артикуле
+MISSING = {"missing": True}
+EMPTY_RESPONSE = {"data": {"products": []}}
+
+
+def card_cache_key(nm) -> str:
+    return f"{CARD_CACHE_PREFIX}:{nm}"
+
+
+class CardCache:
+    def __init__(self):
+        self.redis = None
+        self.stats = Counter()
+        self._inflight = {}
+
+    def attach(self, redis_client) -> None:
+        self.redis = redis_client
+
+    async def get_or_fetch(self, nm, fetch: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """
+        Ответ API карточек для nm: из кэша или через fetch().
+        fetch возвращает None при сетевой ошибке (такое не кэшируется)
+        и ответ без products, если товара нет (кэшируется как отсутствующий).
+        """
+        nm = str(nm)
+        task = self._inflight.get(nm)
+        if task is not None:
+            await self._count("coalesced")
+        else:
+            task = asyncio.ensure_future(self._load(nm, fetch))
+            self._inflight[nm] = task
+            task.add_done_callback(lambda done: self._inflight.pop(nm, None) if self._inflight.get(nm) is done else None)
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    async def _load(self, nm: str, fetch) -> Optional[dict]:
+        cached = await self._get(nm)
+        if cached is not None:
+            if cached == MISSING:
+                await self._count("negative_hits")
+                return EMPTY_RESPONSE
+            await self._count("hits")
+            return cached
+
+        await self._count("misses")
+        data = await fetch()
+        if data is None:
+            return None
+        products = (data.get("data") or {}).get("products") or []
+        if products:
+            # Парсеру нужна только первая карточка
+            await self._set(nm, {"data": {"products": products[:1]}}, CARD_CACHE_TTL)
+        else:
+            await self._set(nm, MISSING, CARD_CACHE_NEGATIVE_TTL)
+        return data
+
+    async def invalidate(self, nm) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(card_cache_key(nm))
+        except Exception as e:
+            logger.warning(f"Не удалось удалить карточку {nm} из кэша: {e}")
+
+    async def get_stats(self) -> dict:
+        """Счетчики по всем воркерам (из Redis) или только по этому процессу"""
+        if self.redis is not None:
+            try:
+                stored = await self.redis.hgetall(CARD_STATS_KEY)
+                return {name: int(value) for name, value in stored.items()}
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать счетчики кэша карточек: {e}")
+        return dict(self.stats)
+
+    async def _get(self, nm: str) -> Optional[dict]:
+        if self.redis is None:
+            return None
+        try:
+            payload = await self.redis.get(card_cache_key(nm))
+        except Exception as e:
+            logger.warning(f"Кэш карточек недоступен: {e}")
+            return None
+        return json.loads(payload) if payload else None
+
+    async def _set(self, nm: str, value: dict, ttl: int) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(card_cache_key(nm), json.dumps(value, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить карточку {nm} в кэш: {e}")
+
+    async def _count(self, name: str) -> None:
+        self.stats[name] += 1
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hincrby(CARD_STATS_KEY, name, 1)
+        except Exception as e:
+            logger.debug(f"Не удалось обновить счетчик {name}: {e}")
+
+
+card_cache = CardCache()
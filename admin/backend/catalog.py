@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Goods, DailyAvailability, Category, Reservation
+from schemas import CatalogItemResponse
+
+logger = logging.getLogger('api')
+
+
+def build_catalog_query(current_date: datetime, goods_id: Optional[int] = None):
+    """
+    Строит единый запрос каталога: видимые активные товары,
+    у которых на сегодня есть остаток, вместе с этим остатком, числом забронированных
+    сегодня единиц и названием категории.
+    С goods_id выбирается один товар независимо от остатка (карточка товара).
+    """
+    today = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # Бронирования агрегируются в базе: в ответ попадает только число, а не список
+    reserved = (
+        select(
+            Reservation.goods_id,
+            func.sum(Reservation.quantity).label("reserved_count")
+        )
+        .where(
+            Reservation.reserved_at >= today,
+            Reservation.reserved_at < today + timedelta(days=1)
+        )
+        .group_by(Reservation.goods_id)
+        .subquery()
+    )
+
+    query = select(
+        Goods.id,
+        Goods.name,
+        Goods.price,
+        Goods.cashback_percent,
+        Goods.article,
+        Goods.url,
+        Goods.image,
+        Goods.purchase_guide,
+        Goods.start_date,
+        Goods.end_date,
+        Goods.category_id,
+        Category.name.label("category_name"),
+        func.coalesce(DailyAvailability.available_quantity, 0).label("available_quantity"),
+        func.coalesce(reserved.c.reserved_count, 0).label("reserved_count"),
+    )
+
+    if goods_id is None:
+        query = query.join(
+            DailyAvailability,
+            and_(
+                DailyAvailability.goods_id == Goods.id,
+                DailyAvailability.date == today,
+                DailyAvailability.available_quantity > 0
+            )
+        ).where(
+            Goods.is_active == True,
+            Goods.is_hidden == False,
+            Goods.start_date <= current_date,
+            Goods.end_date >= current_date
+        )
+    else:
+        query = query.outerjoin(
+            DailyAvailability,
+            and_(
+                DailyAvailability.goods_id == Goods.id,
+                DailyAvailability.date == today
+            )
+        ).where(Goods.id == goods_id)
+
+    return (
+        query
+        .outerjoin(reserved, reserved.c.goods_id == Goods.id)
+        .outerjoin(Category, Category.id == Goods.category_id)
+        .order_by(Goods.id)
+    )
+
+
+async def fetch_catalog(db: AsyncSession, current_date: datetime) -> List[CatalogItemResponse]:
+    """Возвращает каталог на указанную дату одним запросом к базе"""
+    result = await db.execute(build_catalog_query(current_date))
+    items = [CatalogItemResponse(**row._mapping) for row in result.all()]
+    logger.info(f"Каталог на {current_date.date()}: {len(items)} товаров в наличии")
+    return items
+
+
+async def fetch_catalog_item(db: AsyncSession, goods_id: int, current_date: datetime) -> Optional[CatalogItemResponse]:
+    """Карточка одного товара в формате каталога или None, если товара нет"""
+    result = await db.execute(build_catalog_query(current_date, goods_id=goods_id))
+    row = result.first()
+    return CatalogItemResponse(**row._mapping) if row else None
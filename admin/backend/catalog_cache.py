@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from schemas import CatalogItemResponse
+
+logger = logging.getLogger('api')
+
+# Счетчик версии каталога: увеличивается при любом изменении товаров, доступности или бронирований
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_CACHE_PREFIX = "catalog:payload"
+# Страховочный TTL: покрывает изменения, которые делает воркер без инвалидации
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "60"))
+
+
+def catalog_cache_key(current_date: datetime, version: int) -> str:
+    return f"{CATALOG_CACHE_PREFIX}:{current_date.date().isoformat()}:v{version}"
+
+
+def serialize_catalog(items: List[CatalogItemResponse]) -> str:
+    """Сериализует каталог в JSON так же, как это сделал бы FastAPI"""
+    return json.dumps([item.model_dump(mode="json") for item in items], ensure_ascii=False)
+
+
+async def get_catalog_version(redis_client) -> int:
+    version = await redis_client.get(CATALOG_VERSION_KEY)
+    return int(version) if version else 0
+
+
+async def get_cached_catalog(redis_client, current_date: datetime) -> tuple:
+    """
+    Возвращает (payload, version). payload равен None, если в кэше ничего нет.
+    Ошибки Redis не пробрасываются — в этом случае каталог строится из базы.
+    """
+    try:
+        version = await get_catalog_version(redis_client)
+        payload = await redis_client.get(catalog_cache_key(current_date, version))
+        return payload, version
+    except Exception as e:
+        logger.warning(f"Кэш каталога недоступен: {e}")
+        return None, None
+
+
+async def store_catalog(redis_client, current_date: datetime, version: Optional[int], payload: str):
+    if version is None:
+        return
+    try:
+        await redis_client.set(catalog_cache_key(current_date, version), payload, ex=CATALOG_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить каталог в кэш: {e}")
+
+
+async def bump_catalog_version(redis_client):
+    """Инвалидирует кэш каталога во всех воркерах uvicorn"""
+    try:
+        version = await redis_client.incr(CATALOG_VERSION_KEY)
+        logger.debug(f"Версия каталога увеличена до {version}")
+    except Exception as e:
+        logger.warning(f"Не удалось инвалидировать кэш каталога: {e}")
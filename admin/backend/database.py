@@ -1,7 +1,9 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.ext.asyncio import async_scoped_session
 from asyncio import current_task
+import logging
 import os
 from typing import AsyncGenerator
 from sqlalchemy.ext.declarative import declarative_base
@@ -43,6 +45,16 @@ AsyncScopedSession = async_scoped_session(
     scopefunc=current_task,
 )
 
+logger = logging.getLogger('api')
+
+# Расширение и GIN-индексы для поиска товаров (search.py). Дублируют миграцию add_goods_trigram_search:
+# create_all их не создает, а миграции при старте контейнера не запускаются
+TRIGRAM_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_goods_name_trgm ON goods USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_goods_article_trgm ON goods USING gin (article gin_trgm_ops)",
+]
+
 # Базовый класс для всех моделей
 Base = declarative_base()
 
@@ -64,6 +76,13 @@ async def init_db():
     """
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # Отдельная транзакция: без прав на расширение таблицы все равно создаются, а поиск работает через ILIKE
+    try:
+        async with engine.begin() as conn:
+            for statement in TRIGRAM_SEARCH_DDL:
+                await conn.execute(text(statement))
+    except Exception as e:
+        logger.warning(f"Не удалось создать pg_trgm и индексы поиска: {e}")
 
 async def close_db():
     """
@@ -0,0 +1,106 @@
+"""
+Разреженные наборы полей для админских эндпоинтов товаров.
+
+Запрошенная форма ответа (view=summary или fields=...) определяет, какие колонки и связи
+реально загружаются из базы: load_only для колонок, selectinload только для нужных связей,
+raiseload для остальных, чтобы ничего лишнего не подгрузилось лениво.
+"""
+
+from typing import List, Optional
+
+from sqlalchemy.orm import load_only, selectinload, raiseload
+
+from models import Goods
+
+VIEW_FULL = "full"
+VIEW_SUMMARY = "summary"
+
+GOODS_COLUMNS = [
+    "id", "name", "price", "cashback_percent", "article", "url", "image",
+    "is_active", "is_hidden", "purchase_guide", "start_date", "end_date",
+    "min_daily", "max_daily", "category_id", "created_at", "updated_at",
+]
+GOODS_RELATIONS = ["daily_availability", "reservations", "category"]
+
+# Колонки таблицы товаров в админке
+SUMMARY_FIELDS = [
+    "id", "name", "price", "cashback_percent", "article", "url", "image",
+    "is_active", "is_hidden", "start_date", "end_date", "min_daily", "max_daily", "category",
+]
+
+
+class InvalidFields(ValueError):
+    """Запрошено неизвестное поле"""
+
+
+def resolve_fields(view: str, fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Возвращает список полей ответа или None для полного (прежнего) ответа.
+    fields имеет приоритет над view.
+    """
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in GOODS_COLUMNS and field not in GOODS_RELATIONS]
+        if unknown:
+            raise InvalidFields(f"Неизвестные поля: {', '.join(unknown)}")
+        if "id" not in requested:
+            requested.insert(0, "id")
+        return requested
+    if view == VIEW_SUMMARY:
+        return list(SUMMARY_FIELDS)
+    return None
+
+
+def goods_load_options(fields: List[str], availability_filter=None) -> list:
+    """Опции загрузки под набор полей; availability_filter сужает подгружаемую доступность"""
+    columns = [getattr(Goods, field) for field in fields if field in GOODS_COLUMNS]
+    if "category" in fields and "category_id" not in fields:
+        columns.append(Goods.category_id)
+
+    options = [load_only(*columns)]
+    if "category" in fields:
+        options.append(selectinload(Goods.category))
+    if "daily_availability" in fields:
+        relation = Goods.daily_availability
+        if availability_filter is not None:
+            relation = relation.and_(availability_filter)
+        options.append(selectinload(relation))
+    if "reservations" in fields:
+        options.append(selectinload(Goods.reservations))
+    options.append(raiseload("*"))
+    return options
+
+
+def serialize_goods(goods: Goods, fields: List[str]) -> dict:
+    """Словарь только с запрошенными полями (без копий данных товара в каждом бронировании)"""
+    data = {field: getattr(goods, field) for field in fields if field in GOODS_COLUMNS}
+    if "category" in fields:
+        category = goods.category
+        data["category"] = {
+            "id": category.id,
+            "name": category.name,
+            "description": category.description,
+            "is_active": category.is_active
+        } if category else None
+    if "daily_availability" in fields:
+        data["daily_availability"] = [
+            {
+                "id": item.id,
+                "goods_id": item.goods_id,
+                "date": item.date,
+                "available_quantity": item.available_quantity
+            }
+            for item in sorted(goods.daily_availability, key=lambda item: item.date)
+        ]
+    if "reservations" in fields:
+        data["reservations"] = [
+            {
+                "id": item.id,
+                "user_id": item.user_id,
+                "goods_id": item.goods_id,
+                "quantity": item.quantity,
+                "reserved_at": item.reserved_at
+            }
+            for item in sorted(goods.reservations, key=lambda item: item.reserved_at, reverse=True)
+        ]
+    return data
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from availability import regenerate_availability
+from price_history import record_prices
+from models import Goods
+from parser import extract_product_id, parse_wildberries_url
+
+logger = logging.getLogger('api')
+
+# Сколько товаров парсится с WB одновременно
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "8"))
+IMPORT_MAX_ITEMS = int(os.getenv("IMPORT_MAX_ITEMS", "500"))
+
+
+def normalize_source(source: str) -> Optional[str]:
+    """Приводит артикул или ссылку к URL карточки WB; None, если артикул не распознан"""
+    source = source.strip()
+    if source.isdigit():
+        return f"https://www.wildberries.ru/catalog/{source}/detail.aspx"
+    if extract_product_id(source):
+        return source
+    return None
+
+
+async def parse_sources(sources: List[str], concurrency: int = IMPORT_CONCURRENCY, session=None) -> List[dict]:
+    """
+    Парсит ссылки параллельно, но не больше concurrency запросов к WB одновременно.
+    Возвращает по результату на каждый источник в исходном порядке: {"source", "data"} или {"source", "error"}.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def parse_one(source: str) -> dict:
+        url = normalize_source(source)
+        if not url:
+            return {"source": source, "error": "Не удалось определить артикул"}
+        async with semaphore:
+            try:
+                data = await parse_wildberries_url(url, session)
+            except Exception as e:
+                logger.error(f"Ошибка при парсинге {url}: {e}")
+                return {"source": source, "error": str(e)}
+        if not data:
+            return {"source": source, "error": "Не удалось получить информацию о товаре"}
+        return {"source": source, "data": data}
+
+    return await asyncio.gather(*(parse_one(source) for source in sources))
+
+
+async def import_goods(db: AsyncSession, sources: List[str], defaults: dict, skip_existing: bool = True,
+                       concurrency: int = IMPORT_CONCURRENCY, session=None) -> List[dict]:
+    """
+    Импортирует товары по списку ссылок или артикулов.
+    Все распарсенные товары и их доступность записываются в одной транзакции;
+    для каждого источника возвращается результат с goods_id или текстом ошибки.
+    """
+    parsed = await parse_sources(sources, concurrency, session)
+
+    existing = set()
+    if skip_existing:
+        articles = [item["data"]["article"] for item in parsed if "data" in item]
+        if articles:
+            result = await db.execute(select(Goods.article).where(Goods.article.in_(articles)))
+            existing = set(result.scalars().all())
+
+    results = []
+    to_insert = []
+    seen = set()
+    for item in parsed:
+        if "error" in item:
+            results.append({"source": item["source"], "success": False, "error": item["error"]})
+            continue
+        data = item["data"]
+        article = data["article"]
+        if article in existing or article in seen:
+            results.append({
+                "source": item["source"], "success": False, "article": article,
+                "error": "Товар с таким артикулом уже есть"
+            })
+            continue
+        seen.add(article)
+        row = dict(defaults)
+        row.update(
+            name=data.get("name") or "",
+            article=article,
+            url=data.get("url"),
+            price=data.get("price"),
+            image=data.get("image") or "",
+        )
+        result_item = {"source": item["source"], "success": True, "article": article, "name": row["name"]}
+        results.append(result_item)
+        to_insert.append((row, result_item))
+
+    if not to_insert:
+        return results
+
+    try:
+        inserted = await db.execute(
+            insert(Goods).returning(
+                Goods.id, Goods.price, Goods.start_date, Goods.end_date, Goods.min_daily, Goods.max_daily,
+                sort_by_parameter_order=True
+            ),
+            [row for row, _ in to_insert]
+        )
+        goods_rows = inserted.all()
+        await regenerate_availability(db, goods_rows)
+        await record_prices(db, [(row.id, row.price) for row in goods_rows])
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Ошибка при сохранении импортированных товаров: {e}")
+        for _, result_item in to_insert:
+            result_item.update(success=False, error=f"Ошибка сохранения: {e}")
+        return results
+
+    for (_, result_item), goods_row in zip(to_insert, goods_rows):
+        result_item["goods_id"] = goods_row.id
+    logger.info(f"Импорт: создано {len(goods_rows)} товаров из {len(sources)} источников")
+    return results
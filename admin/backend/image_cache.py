@@ -0,0 +1,144 @@
+"""
+Кэш проверки ссылок на картинки товаров.
+
+Результат HEAD-проверки хранится в Redis (image:valid:{url}): рабочая ссылка — IMAGE_VALID_TTL,
+нерабочая — IMAGE_INVALID_TTL. Нерабочей ссылка считается только по определенному ответу сервера;
+таймауты, сетевые ошибки, 5xx и 429 дают неопределенный результат, который не кэшируется
+и не затирает прежние записи — иначе короткий сбой хоста картинок отключил бы их на час. Поверх Redis — небольшой LRU в памяти процесса с коротким сроком,
+чтобы повторные уведомления по одному товару не ходили даже в Redis.
+Кэш прогревает фоновая перепроверка картинок всех товаров (image_revalidation.py),
+поэтому при отправке уведомления сеть нужна только для еще не проверенных ссылок.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_PREFIX = "image:valid"
+IMAGE_VALID_TTL = int(os.getenv("IMAGE_VALID_TTL", "86400"))
+IMAGE_INVALID_TTL = int(os.getenv("IMAGE_INVALID_TTL", "3600"))
+IMAGE_LRU_SIZE = int(os.getenv("IMAGE_LRU_SIZE", "1024"))
+IMAGE_LRU_TTL = int(os.getenv("IMAGE_LRU_TTL", "300"))
+IMAGE_CHECK_TIMEOUT = 5
+
+
+def image_cache_key(url: str) -> str:
+    return f"{IMAGE_CACHE_PREFIX}:{url}"
+
+
+async def check_image_url(url: str, session: aiohttp.ClientSession) -> Optional[bool]:
+    """
+    HEAD-запрос к картинке: True — отдается, False — сервер ответил, что ее нет,
+    None — проверить не удалось (сетевая ошибка, таймаут, 5xx или 429).
+    """
+    try:
+        async with session.head(url, timeout=aiohttp.ClientTimeout(total=IMAGE_CHECK_TIMEOUT)) as resp:
+            if resp.status == 200:
+                return True
+            if resp.status >= 500 or resp.status == 429:
+                logger.warning(f"Image URL validation inconclusive: {url}, status: {resp.status}")
+                return None
+            return False
+    except Exception as e:
+        logger.warning(f"Image URL validation failed: {url}, error: {e}")
+        return None
+
+
+class ImageValidationCache:
+    def __init__(self, lru_size: int = IMAGE_LRU_SIZE, lru_ttl: int = IMAGE_LRU_TTL):
+        self.redis = None
+        self.lru_size = lru_size
+        self.lru_ttl = lru_ttl
+        self._lru = OrderedDict()
+
+    def attach(self, redis_client) -> None:
+        self.redis = redis_client
+
+    async def is_valid(self, url: str, session: aiohttp.ClientSession) -> bool:
+        """
+        Результат из памяти, из Redis или (при промахе) новой HEAD-проверки.
+        Неопределенная проверка не кэшируется: для этой отправки картинка считается нерабочей,
+        а следующая отправка проверит ссылку заново.
+        """
+        cached = self._lru_get(url)
+        if cached is not None:
+            return cached
+        cached = await self._redis_get(url)
+        if cached is not None:
+            self._lru_put(url, cached)
+            return cached
+        valid = await check_image_url(url, session)
+        if valid is None:
+            return False
+        await self.store({url: valid})
+        return valid
+
+    async def store(self, results: Dict[str, bool]) -> None:
+        """Сохраняет результаты проверок в память и одним пайплайном в Redis"""
+        for url, valid in results.items():
+            self._lru_put(url, valid)
+        if self.redis is None or not results:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for url, valid in results.items():
+                    pipe.set(image_cache_key(url), "1" if valid else "0",
+                             ex=IMAGE_VALID_TTL if valid else IMAGE_INVALID_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить проверки картинок в кэш: {e}")
+
+    async def validate_many(self, urls: Iterable[str], session: aiohttp.ClientSession,
+                            concurrency: int = 16) -> Dict[str, Optional[bool]]:
+        """
+        Перепроверяет ссылки параллельно (не больше concurrency запросов) и обновляет кэш.
+        Для ссылок с неопределенной проверкой (None) прежние записи кэша остаются как есть.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(url):
+            async with semaphore:
+                return url, await check_image_url(url, session)
+
+        results = dict(await asyncio.gather(*(check(url) for url in dict.fromkeys(urls))))
+        await self.store({url: valid for url, valid in results.items() if valid is not None})
+        return results
+
+    def _lru_get(self, url: str) -> Optional[bool]:
+        entry = self._lru.get(url)
+        if entry is None:
+            return None
+        valid, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._lru[url]
+            return None
+        self._lru.move_to_end(url)
+        return valid
+
+    def _lru_put(self, url: str, valid: bool) -> None:
+        self._lru[url] = (valid, time.monotonic() + self.lru_ttl)
+        self._lru.move_to_end(url)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def _redis_get(self, url: str) -> Optional[bool]:
+        if self.redis is None:
+            return None
+        try:
+            value = await self.redis.get(image_cache_key(url))
+        except Exception as e:
+            logger.warning(f"Кэш проверки картинок недоступен: {e}")
+            return None
+        if value is None:
+            return None
+        return value in ("1", b"1")
+
+
+image_cache = ImageValidationCache()
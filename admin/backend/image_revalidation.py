@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+from typing import List
+
+import aiohttp
+from sqlalchemy import select
+
+from database import AsyncScopedSession
+from image_cache import image_cache
+from models import Goods
+
+logger = logging.getLogger('image_revalidation')
+
+# Как часто перепроверять картинки товаров (0 — не перепроверять) и сколько HEAD-запросов одновременно.
+# Интервал короче IMAGE_VALID_TTL, поэтому картинки активных товаров всегда есть в кэше
+IMAGE_REVALIDATE_INTERVAL = int(os.getenv("IMAGE_REVALIDATE_INTERVAL", "21600"))
+IMAGE_REVALIDATE_CONCURRENCY = int(os.getenv("IMAGE_REVALIDATE_CONCURRENCY", "16"))
+
+
+async def load_goods_images() -> List[str]:
+    """Различные ссылки на картинки активных товаров"""
+    async with AsyncScopedSession() as db:
+        result = await db.execute(
+            select(Goods.image)
+            .where(Goods.is_active == True, Goods.image.is_not(None), Goods.image != "")
+            .distinct()
+        )
+        return list(result.scalars().all())
+
+
+async def revalidate_images(session: aiohttp.ClientSession = None) -> dict:
+    """Перепроверяет все картинки активных товаров и обновляет кэш проверок"""
+    urls = await load_goods_images()
+    if not urls:
+        return {"checked": 0, "invalid": 0, "unknown": 0}
+
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+    try:
+        results = await image_cache.validate_many(urls, session, IMAGE_REVALIDATE_CONCURRENCY)
+    finally:
+        if own_session:
+            await session.close()
+
+    invalid = [url for url, valid in results.items() if valid is False]
+    unknown = [url for url, valid in results.items() if valid is None]
+    stats = {"checked": len(results), "invalid": len(invalid), "unknown": len(unknown)}
+    logger.info(f"Перепроверка картинок: {stats}")
+    if invalid:
+        logger.warning(f"Нерабочие картинки: {invalid[:20]}")
+    if unknown:
+        # Прежние результаты в кэше для них сохранены, проверка повторится в следующий проход
+        logger.warning(f"Не удалось проверить картинки: {unknown[:20]}")
+    return stats
+
+
+async def run_image_revalidation_loop(redis_client):
+    """Периодическая перепроверка картинок (запускается рядом с воркером активности)"""
+    if IMAGE_REVALIDATE_INTERVAL <= 0:
+        logger.info("Перепроверка картинок отключена")
+        return
+    image_cache.attach(redis_client)
+    while True:
+        try:
+            await revalidate_images()
+        except Exception as e:
+            logger.error(f"Ошибка при перепроверке картинок: {e}")
+        await asyncio.sleep(IMAGE_REVALIDATE_INTERVAL)
@@ -0,0 +1,434 @@
+"""
+Горячие счетчики остатков на сегодня в Redis.
+
+В полночь по МСК открываются квоты дня, и сотни покупателей одновременно бронируют
+одни и те же товары. В этом режиме остаток списывается атомарным Lua-скриптом в Redis,
+а в Postgres синхронно пишется только строка бронирования (без блокировки строки доступности).
+Списания копятся в хэше inventory:pending и пачками переносятся в daily_availability фоновой задачей.
+Перенос идемпотентен: хэш атомарно переименовывается в inventory:inflight с id переноса, id пишется
+в inventory_flushes в той же транзакции, что и UPDATE, и только потом inflight удаляется.
+Повтор переноса с тем же id (сбой после коммита, истекшая блокировка) ничего не списывает дважды.
+
+Режим включается переменной HOT_INVENTORY_ENABLED и выключается на лету ключом
+inventory:hot:kill — тогда бронирования снова идут через SQL (reservations.reserve_stock),
+но только после того, как все списания из Redis перенесены в Postgres.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from redis.exceptions import RedisError
+from sqlalchemy import update, delete, func, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+
+from database import async_session_factory
+from models import DailyAvailability, Reservation, InventoryFlush
+from reservations import reserve_stock, insert_reservation, ReservationError
+
+logger = logging.getLogger('api')
+
+HOT_INVENTORY_ENABLED = os.getenv("HOT_INVENTORY_ENABLED", "false").lower() == "true"
+HOT_INVENTORY_FLUSH_INTERVAL = float(os.getenv("HOT_INVENTORY_FLUSH_INTERVAL", "0.5"))
+HOT_INVENTORY_LOCK_TTL_MS = 10000
+HOT_INVENTORY_LOCK_WAIT = 5  # сколько секунд ждать блокировку при загрузке счетчиков
+COUNTERS_TTL = int(timedelta(days=2).total_seconds())
+
+KILL_SWITCH_KEY = "inventory:hot:kill"
+LOCK_KEY = "inventory:hot:lock"
+# Еще не перенесенные в Postgres списания: поле "<дата>:<goods_id>" -> количество
+PENDING_KEY = "inventory:pending"
+# Списания, которые переносятся сейчас (или перенос которых прервался), и id этого переноса
+INFLIGHT_KEY = "inventory:inflight"
+INFLIGHT_ID_KEY = "inventory:inflight:id"
+# Сколько хранить id примененных переносов
+FLUSH_IDS_TTL = timedelta(days=2)
+
+CLAIM_NOT_LOADED = -2
+CLAIM_DUPLICATE = -3
+CLAIM_SOLD_OUT = -1
+CLAIM_DISABLED = -4
+
+OVERLOADED_MESSAGE = "Сервис бронирования перегружен, попробуйте еще раз"
+
+# KEYS: loaded, stock, users, pending, kill switch; ARGV: goods_id, user_id, quantity, pending field, ttl
+# Аварийный ключ проверяется в том же скрипте: после его установки новые списания в pending не попадают
+CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[5]) == 1 then return -4 end
+if redis.call('EXISTS', KEYS[1]) == 0 then return -2 end
+if redis.call('SISMEMBER', KEYS[3], ARGV[2]) == 1 then return -3 end
+local stock = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+local quantity = tonumber(ARGV[3])
+if stock < quantity then return -1 end
+redis.call('HINCRBY', KEYS[2], ARGV[1], -quantity)
+redis.call('SADD', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('HINCRBY', KEYS[4], ARGV[4], quantity)
+return stock - quantity
+"""
+
+# KEYS: loaded, stock, users, pending; ARGV: goods_id, user_id, quantity, pending field, writeback
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+local quantity = tonumber(ARGV[3])
+redis.call('HINCRBY', KEYS[2], ARGV[1], quantity)
+redis.call('SREM', KEYS[3], ARGV[2])
+if ARGV[5] == '1' then
+    if redis.call('HINCRBY', KEYS[4], ARGV[4], -quantity) == 0 then
+        redis.call('HDEL', KEYS[4], ARGV[4])
+    end
+end
+return 1
+"""
+
+# KEYS: loaded, stock, pending, inflight; ARGV: date, ttl, учитывать ли inflight (1/0),
+# затем пары goods_id, остаток в Postgres
+LOAD_SCRIPT = """
+redis.call('DEL', KEYS[2])
+for i = 4, #ARGV, 2 do
+    local field = ARGV[1] .. ':' .. ARGV[i]
+    local pending = tonumber(redis.call('HGET', KEYS[3], field) or '0')
+    local inflight = 0
+    if ARGV[3] == '1' then
+        inflight = tonumber(redis.call('HGET', KEYS[4], field) or '0')
+    end
+    redis.call('HSET', KEYS[2], ARGV[i], tonumber(ARGV[i + 1]) - pending - inflight)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[1], '1', 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS: pending, inflight, inflight id; ARGV: id нового переноса.
+# Незавершенный перенос возвращается с прежним id, иначе pending становится inflight.
+BEGIN_FLUSH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+local flush_id = redis.call('GET', KEYS[3])
+if not flush_id then
+    flush_id = ARGV[1]
+    redis.call('SET', KEYS[3], flush_id)
+end
+return {flush_id, redis.call('HGETALL', KEYS[2])}
+"""
+
+# KEYS: inflight, inflight id; ARGV: id переноса
+FINISH_FLUSH_SCRIPT = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+def _day(current_date: datetime) -> str:
+    return current_date.date().isoformat()
+
+
+def _keys(current_date: datetime, goods_id: int) -> list:
+    day = _day(current_date)
+    return [
+        f"inventory:{day}:loaded",
+        f"inventory:{day}:stock",
+        f"inventory:{day}:users:{goods_id}",
+        PENDING_KEY,
+    ]
+
+
+async def hot_inventory_mode(redis_client) -> str:
+    """
+    "off" — режим выключен в окружении; "hot" — бронирование через счетчики Redis;
+    "sql" — режим выключен аварийным ключом и все списания из Redis уже перенесены в Postgres.
+    Если Redis недоступен или перенос еще не закончен, остатки в Postgres завышены,
+    поэтому бронирование отклоняется, а не уходит в SQL.
+    """
+    if not HOT_INVENTORY_ENABLED:
+        return "off"
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(KILL_SWITCH_KEY)
+            pipe.hlen(PENDING_KEY)
+            pipe.exists(INFLIGHT_KEY)
+            killed, pending, inflight = await pipe.execute()
+    except Exception as e:
+        logger.error(f"Redis недоступен, бронирование отклонено: {e}")
+        raise ReservationError(OVERLOADED_MESSAGE)
+    if not killed:
+        return "hot"
+    if pending or inflight:
+        # Перенос запускает set_kill_switch, остаток дочищает run_flusher
+        logger.warning("Горячий режим выключен, но списания еще не перенесены в Postgres")
+        raise ReservationError(OVERLOADED_MESSAGE)
+    return "sql"
+
+
+async def _acquire_lock(redis_client, wait: float = 0) -> str:
+    """Блокировка, которая не дает загрузке счетчиков и переносу списаний пересекаться"""
+    token = uuid.uuid4().hex
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        if await redis_client.set(LOCK_KEY, token, nx=True, px=HOT_INVENTORY_LOCK_TTL_MS):
+            return token
+        if asyncio.get_running_loop().time() >= deadline:
+            return None
+        await asyncio.sleep(0.05)
+
+
+async def _release_lock(redis_client, token: str):
+    await redis_client.register_script(UNLOCK_SCRIPT)(keys=[LOCK_KEY], args=[token])
+
+
+async def load_counters(redis_client, current_date: datetime, wait: float = HOT_INVENTORY_LOCK_WAIT,
+                        force: bool = False) -> bool:
+    """
+    Загружает остатки на день из Postgres в Redis (сверка).
+    Счетчик = остаток в Postgres минус еще не перенесенные списания
+    (inflight не вычитается, если его перенос уже записан в Postgres).
+    Выполняется под той же блокировкой, что и перенос, поэтому Postgres и inventory:pending согласованы.
+    """
+    today = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    loaded_key = f"inventory:{_day(today)}:loaded"
+    token = await _acquire_lock(redis_client, wait)
+    if token is None:
+        logger.warning("Не удалось получить блокировку для загрузки счетчиков остатков")
+        return False
+    try:
+        # Пока ждали блокировку, счетчики мог загрузить другой запрос
+        if not force and await redis_client.exists(loaded_key):
+            return True
+        async with async_session_factory() as db:
+            stock_rows = (await db.execute(
+                select(DailyAvailability.goods_id, DailyAvailability.available_quantity)
+                .where(DailyAvailability.date == today)
+            )).all()
+            user_rows = (await db.execute(
+                select(Reservation.goods_id, Reservation.user_id)
+                .where(func.date(Reservation.reserved_at) == today.date())
+            )).all()
+            # Перенос мог закоммититься и упасть до удаления inflight; без блокировки он не продолжится
+            inflight_id = await redis_client.get(INFLIGHT_ID_KEY)
+            inflight_applied = inflight_id is not None and (await db.execute(
+                select(InventoryFlush.flush_id).where(InventoryFlush.flush_id == inflight_id)
+            )).scalar() is not None
+
+        day = _day(today)
+        users = {}
+        for goods_id, user_id in user_rows:
+            users.setdefault(goods_id, []).append(user_id)
+        if users:
+            pipe = redis_client.pipeline(transaction=False)
+            for goods_id, user_ids in users.items():
+                pipe.sadd(f"inventory:{day}:users:{goods_id}", *user_ids)
+                pipe.expire(f"inventory:{day}:users:{goods_id}", COUNTERS_TTL)
+            await pipe.execute()
+
+        args = [day, COUNTERS_TTL, "0" if inflight_applied else "1"]
+        for goods_id, quantity in stock_rows:
+            args.extend([goods_id, quantity or 0])
+        await redis_client.register_script(LOAD_SCRIPT)(
+            keys=[loaded_key, f"inventory:{day}:stock", PENDING_KEY, INFLIGHT_KEY],
+            args=args
+        )
+        logger.info(f"Счетчики остатков на {day} загружены в Redis: {len(stock_rows)} товаров")
+        return True
+    finally:
+        await _release_lock(redis_client, token)
+
+
+async def invalidate_counters(redis_client, current_date: datetime = None):
+    """Сбрасывает счетчики дня: следующая попытка бронирования загрузит их заново"""
+    if not HOT_INVENTORY_ENABLED:
+        return
+    current_date = current_date or datetime.now()
+    try:
+        await redis_client.delete(f"inventory:{_day(current_date)}:loaded")
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить счетчики остатков: {e}")
+
+
+async def flush_pending(redis_client, wait: float = 0) -> int:
+    """
+    Переносит накопленные списания в daily_availability одним пакетным UPDATE.
+    Списания сначала атомарно уходят в inventory:inflight; id переноса записывается в Postgres
+    в одной транзакции с UPDATE, поэтому повтор того же переноса ничего не списывает.
+    """
+    token = await _acquire_lock(redis_client, wait)
+    if token is None:
+        return 0
+    try:
+        started = await redis_client.register_script(BEGIN_FLUSH_SCRIPT)(
+            keys=[PENDING_KEY, INFLIGHT_KEY, INFLIGHT_ID_KEY], args=[uuid.uuid4().hex]
+        )
+        if not started:
+            return 0
+        flush_id, flat = started
+        batch = []
+        for field, quantity in zip(flat[::2], flat[1::2]):
+            quantity = int(quantity)
+            if quantity == 0:
+                continue
+            day, goods_id = field.split(":")
+            batch.append({
+                "b_goods_id": int(goods_id),
+                "b_date": datetime.fromisoformat(day),
+                "b_quantity": quantity,
+            })
+
+        table = DailyAvailability.__table__
+        async with async_session_factory() as db:
+            # Конкурирующий перенос с тем же id ждет здесь коммита первого и получает конфликт
+            recorded = await db.execute(
+                pg_insert(InventoryFlush)
+                .values(flush_id=flush_id)
+                .on_conflict_do_nothing()
+                .returning(InventoryFlush.flush_id)
+            )
+            applied = recorded.scalar() is not None
+            if applied and batch:
+                await db.execute(
+                    update(table)
+                    .where(
+                        table.c.goods_id == bindparam("b_goods_id"),
+                        table.c.date == bindparam("b_date")
+                    )
+                    .values(available_quantity=table.c.available_quantity - bindparam("b_quantity")),
+                    batch
+                )
+            await db.execute(
+                delete(InventoryFlush).where(InventoryFlush.applied_at < func.now() - FLUSH_IDS_TTL)
+            )
+            await db.commit()
+
+        # Списания, пришедшие во время переноса, уже копятся в новом pending
+        await redis_client.register_script(FINISH_FLUSH_SCRIPT)(
+            keys=[INFLIGHT_KEY, INFLIGHT_ID_KEY], args=[flush_id]
+        )
+        if not applied:
+            logger.warning(f"Перенос списаний {flush_id} уже был применен, повтор пропущен")
+            return 0
+        logger.info(f"Перенесены списания остатков в Postgres: {len(batch)} товаров")
+        return len(batch)
+    finally:
+        await _release_lock(redis_client, token)
+
+
+async def run_flusher(redis_client):
+    """Фоновый перенос списаний, работает в каждом воркере uvicorn (блокировка общая)"""
+    logger.info("Перенос горячих остатков в Postgres запущен")
+    while True:
+        try:
+            await flush_pending(redis_client)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка переноса списаний остатков: {e}")
+        await asyncio.sleep(HOT_INVENTORY_FLUSH_INTERVAL)
+
+
+async def start_hot_inventory(redis_client):
+    """Сверка при старте и запуск фонового переноса; возвращает задачу или None"""
+    if not HOT_INVENTORY_ENABLED:
+        return None
+    try:
+        await flush_pending(redis_client, wait=HOT_INVENTORY_LOCK_WAIT)
+        await load_counters(redis_client, datetime.now(), force=True)
+    except Exception as e:
+        logger.error(f"Ошибка сверки горячих остатков при старте: {e}")
+    return asyncio.create_task(run_flusher(redis_client))
+
+
+async def set_kill_switch(redis_client, disabled: bool):
+    """
+    Выключает/включает горячий режим для всех процессов.
+    При выключении списания сразу переносятся в Postgres, а счетчики сбрасываются,
+    чтобы при включении они загрузились заново с учетом бронирований через SQL.
+    """
+    if disabled:
+        await redis_client.set(KILL_SWITCH_KEY, "1")
+        await flush_pending(redis_client, wait=HOT_INVENTORY_LOCK_WAIT)
+        await invalidate_counters(redis_client)
+    else:
+        await invalidate_counters(redis_client)
+        await redis_client.delete(KILL_SWITCH_KEY)
+
+
+async def _claim(redis_client, current_date, goods_id, user_id, quantity):
+    keys = _keys(current_date, goods_id) + [KILL_SWITCH_KEY]
+    args = [goods_id, user_id, quantity, f"{_day(current_date)}:{goods_id}", COUNTERS_TTL]
+    return await redis_client.register_script(CLAIM_SCRIPT)(keys=keys, args=args)
+
+
+async def release_stock(redis_client, goods_id: int, user_id: int, quantity: int,
+                        current_date: datetime, writeback: bool = False):
+    """
+    Возвращает остаток в счетчик Redis.
+    writeback=True — отмена еще не перенесенного списания (бронирование не записалось в Postgres);
+    writeback=False — отмена бронирования, остаток которого уже вернули в Postgres напрямую.
+    """
+    if not HOT_INVENTORY_ENABLED:
+        return
+    try:
+        await redis_client.register_script(RELEASE_SCRIPT)(
+            keys=_keys(current_date, goods_id),
+            args=[goods_id, user_id, quantity, f"{_day(current_date)}:{goods_id}", "1" if writeback else "0"]
+        )
+    except Exception as e:
+        logger.error(f"Не удалось вернуть остаток товара {goods_id} в Redis: {e}")
+
+
+async def reserve_stock_hot(redis_client, db, goods_id: int, user_id: int, quantity: int,
+                            current_date: datetime) -> dict:
+    """Бронирование через счетчик Redis; в Postgres синхронно пишется только строка бронирования"""
+    if quantity is None or quantity < 1:
+        raise ReservationError("Некорректное количество для бронирования")
+
+    today = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    result = await _claim(redis_client, today, goods_id, user_id, quantity)
+    if result == CLAIM_NOT_LOADED:
+        await load_counters(redis_client, today)
+        result = await _claim(redis_client, today, goods_id, user_id, quantity)
+    if result in (CLAIM_NOT_LOADED, CLAIM_DISABLED):
+        raise ReservationError(OVERLOADED_MESSAGE)
+    if result == CLAIM_DUPLICATE:
+        raise ReservationError("Вы уже бронировали этот товар сегодня")
+    if result == CLAIM_SOLD_OUT:
+        raise ReservationError("Товар недоступен для бронирования")
+
+    try:
+        reservation = await insert_reservation(db, goods_id, user_id, quantity, today)
+        if reservation is None:
+            raise ReservationError("Вы уже бронировали этот товар сегодня")
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await release_stock(redis_client, goods_id, user_id, quantity, today, writeback=True)
+        raise
+
+    logger.info(f"Бронирование {reservation['id']} (Redis): товар {goods_id}, пользователь {user_id}, остаток {result}")
+    return dict(reservation)
+
+
+async def reserve(redis_client, db, goods_id: int, user_id: int, quantity: int,
+                  current_date: datetime) -> dict:
+    """Бронирование через горячие счетчики, если режим активен, иначе через SQL"""
+    if await hot_inventory_mode(redis_client) == "hot":
+        try:
+            return await reserve_stock_hot(redis_client, db, goods_id, user_id, quantity, current_date)
+        except RedisError as e:
+            # Без Redis неизвестно, сколько списаний еще не перенесено — SQL мог бы продать лишнее
+            logger.error(f"Redis недоступен при бронировании: {e}")
+            raise ReservationError(OVERLOADED_MESSAGE)
+    return await reserve_stock(db, goods_id, user_id, quantity, current_date)
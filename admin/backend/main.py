@@ -1,10 +1,12 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import update, delete, or_
-from typing import List, Optional
+from typing import List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer
 import os
 from datetime import datetime, timedelta
@@ -18,7 +20,20 @@ from worker import update_goods_activity
 import time
 from aiohttp import ClientSession
 from sqlalchemy.orm import selectinload
-from parser import parse_wildberries_url
+from parser import parse_wildberries_url, create_wb_session
+from basket_index import basket_index
+from card_cache import card_cache
+from catalog import fetch_catalog, fetch_catalog_item
+from reservations import ReservationError
+from inventory import reserve, release_stock, invalidate_counters, start_hot_inventory, set_kill_switch
+from pagination import PAGING_OFFSET, PAGING_CURSOR, InvalidCursor, decode_cursor, apply_keyset, split_page
+from search import resolve_search, search_goods as run_goods_search
+from catalog_cache import get_cached_catalog, store_catalog, serialize_catalog, bump_catalog_version
+from availability import build_availability_rows, write_availability, regenerate_availability
+from goods_import import import_goods, IMPORT_MAX_ITEMS
+from price_history import record_prices, price_at, price_series
+from activation_scheduler import notify_schedule_changed
+from goods_fields import VIEW_FULL, VIEW_SUMMARY, InvalidFields, resolve_fields, goods_load_options, serialize_goods
 import math
 from logging.handlers import RotatingFileHandler
 from pydantic import ValidationError
@@ -29,7 +44,8 @@ from models import Goods, Reservation, DailyAvailability, Category
 from schemas import (
     GoodsCreate, GoodsUpdate, GoodsResponse,ReservationCreate, ReservationResponse,
     DailyAvailabilityResponse, CategoryCreate, CategoryUpdate, CategoryResponse,
-    BulkVisibilityUpdate
+    BulkVisibilityUpdate, BulkAvailabilityRegenerate, BulkImportRequest, BulkImportResponse,
+    CatalogItemResponse, DailyAvailabilityPage, PriceHistoryResponse, PriceAtResponse
 )
 
 # Настраиваем базовую конфигурацию, чтобы логи сразу уходили в stdout (для docker logs)
@@ -86,6 +102,8 @@ _availability_cache_ttl = 10  # Время жизни кэша в секунда
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+# Сессия aiohttp к WB, создается в lifespan
+wb_session: Optional[ClientSession] = None
 
 REDIS_RETRIES = 5  # Количество попыток при ошибке Redis
 REDIS_RETRY_DELAY = 5  # Базовая задержка между попытками (сек)
@@ -94,7 +112,18 @@ REDIS_RETRY_DELAY = 5  # Базовая задержка между попытк
 async def lifespan(app: FastAPI):
     await init_db()
     logger.info("База данных инициализирована")
+    # Горячие счетчики остатков (если включены): сверка с Postgres и фоновый перенос списаний
+    flusher_task = await start_hot_inventory(redis_client)
+    # Общий пул соединений к WB для парсера
+    global wb_session
+    wb_session = create_wb_session()
+    await basket_index.load(redis_client)
+    card_cache.attach(redis_client)
     yield
+    if flusher_task:
+        flusher_task.cancel()
+    await wb_session.close()
+    wb_session = None
     await close_db()
     logger.info("Соединение с базой данных закрыто")
 
@@ -162,55 +191,21 @@ async def generate_daily_availability(db: AsyncSession, goods_id: int, start_dat
     logger.info(f"Начинаем генерацию доступности для товара {goods_id}")
     logger.info(f"Параметры: start_date={start_date}, end_date={end_date}, min_daily={min_daily}, max_daily={max_daily}")
     
-    # Удаляем все существующие записи о доступности для этого товара
-    # в будущем (от сегодняшнего дня)
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    delete_stmt = delete(DailyAvailability).where(
-        DailyAvailability.goods_id == goods_id,
-        DailyAvailability.date >= today
-    )
-    await db.execute(delete_stmt)
-    logger.info(f"Удалены существующие записи доступности для товара {goods_id}")
-    
-    # Если не указаны даты начала или окончания, используем сегодня и +30 дней
-    if not start_date:
-        logger.info("Дата начала не указана, используем сегодня")
-        start_date = today
-    if not end_date:
-        logger.info("Дата окончания не указана, используем сегодня + 30 дней")
-        end_date = today + timedelta(days=30)
-    
-    # Приведение дат к одному формату (без часового пояса)
-    if start_date and start_date.tzinfo:
-        start_date = start_date.replace(tzinfo=None)
-    if end_date and end_date.tzinfo:
-        end_date = end_date.replace(tzinfo=None)
-    
-    # Гарантируем, что start_date не раньше сегодняшнего дня
-    start_date = max(start_date, today)
-    logger.info(f"Итоговые даты: start_date={start_date}, end_date={end_date}")
-    
-    # Создаем новые записи для каждого дня
-    count = 0
-    current_date = start_date
-    while current_date <= end_date:
-        # Генерируем случайное количество товара на день
-        available_quantity = random.randint(min_daily, max_daily)
-        
-        # Создаем новую запись
-        daily_availability = DailyAvailability(
-            goods_id=goods_id,
-            date=current_date,
-            available_quantity=available_quantity
+    rows = build_availability_rows(goods_id, start_date, end_date, min_daily, max_daily, today)
+
+    # Удаляем все существующие записи о доступности для этого товара
+    # в будущем (от сегодняшнего дня) и записываем весь диапазон одной операцией
+    await db.execute(
+        delete(DailyAvailability).where(
+            DailyAvailability.goods_id == goods_id,
+            DailyAvailability.date >= today
         )
-        db.add(daily_availability)
-        count += 1
-        
-        # Переходим к следующему дню
-        current_date += timedelta(days=1)
+    )
+    count = await write_availability(db, rows)
     
     await db.commit()
-    logger.info(f"Сгенерировано {count} записей доступности для товара {goods_id} с {start_date} по {end_date}")
+    logger.info(f"Сгенерировано {count} записей доступности для товара {goods_id}")
 
 # CRUD маршруты
 @app.post("/goods/", response_model=GoodsResponse, status_code=status.HTTP_201_CREATED)
@@ -218,6 +213,9 @@ async def create_goods(goods: GoodsCreate, db: AsyncSession = Depends(get_db)):
     """Создать новый товар и сгенерировать доступность по дням"""
     db_goods = Goods(**goods.dict())
     db.add(db_goods)
+    await db.flush()
+    # Начальная цена — первая точка истории цен
+    await record_prices(db, [(db_goods.id, db_goods.price)])
     await db.commit()
     await db.refresh(db_goods)
     
@@ -230,6 +228,10 @@ async def create_goods(goods: GoodsCreate, db: AsyncSession = Depends(get_db)):
         db_goods.min_daily, 
         db_goods.max_daily
     )
+    await invalidate_counters(redis_client)
+    await bump_catalog_version(redis_client)
+    # Планировщик активации сразу выставит статус и запомнит границы нового товара
+    await notify_schedule_changed(redis_client, [db_goods.id])
     
     # Загружаем созданную доступность отдельным запросом
     availability_query = select(DailyAvailability).filter(
@@ -276,40 +278,70 @@ async def read_goods(
     skip: int = 0,
     limit: int = 100,
     db: AsyncSession = Depends(get_db),
-    include_hidden: bool = False
+    include_hidden: bool = False,
+    paging: str = Query(PAGING_OFFSET, pattern=f"^({PAGING_OFFSET}|{PAGING_CURSOR})$"),
+    cursor: Optional[str] = None,
+    view: str = Query(VIEW_FULL, pattern=f"^({VIEW_FULL}|{VIEW_SUMMARY})$"),
+    fields: Optional[str] = None
 ):
-    """Получить список всех товаров с фильтрацией и пагинацией"""
+    """
+    Получить список всех товаров с фильтрацией и пагинацией.
+    paging=cursor (или переданный cursor) включает keyset-пагинацию по id:
+    вместо total возвращается next_cursor, и любая страница стоит как первая.
+    view=summary или fields=id,name,... загружают из базы только нужные колонки и связи.
+    """
+    use_cursor = paging == PAGING_CURSOR or cursor is not None
+    cursor_values = None
+    if cursor:
+        try:
+            cursor_values = decode_cursor(cursor, [int])
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        requested_fields = resolve_fields(view, fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        logger.info(f"Запрос товаров: search={search}, include_hidden={include_hidden}, skip={skip}, limit={limit}")
+        logger.info(f"Запрос товаров: search={search}, include_hidden={include_hidden}, skip={skip}, limit={limit}, cursor={use_cursor}")
         base_query = select(Goods)
-        # Применяем поиск, если указан
+        search_order = []
+        # Применяем поиск, если указан (триграммный индекс или точный артикул)
         if search:
-            search_pattern = f"%{search}%"
-            base_query = base_query.where(
-                or_(
-                    Goods.name.ilike(search_pattern),
-                    Goods.article.ilike(search_pattern)
-                )
-            )
+            search_condition, search_order = await resolve_search(db, search)
+            base_query = base_query.where(search_condition)
         # Фильтруем скрытые товары только если include_hidden=False
         if not include_hidden:
             base_query = base_query.where(Goods.is_hidden == False)
-        # Считаем total
-        count_query = base_query.with_only_columns(func.count()).order_by(None)
-        total = (await db.execute(count_query)).scalar()
         # Применяем пагинацию и загрузку связей
-        query = base_query.options(
-            selectinload(Goods.daily_availability),
-            selectinload(Goods.category),
-            selectinload(Goods.reservations)
-        ).offset(skip).limit(limit)
-        result = await db.execute(query)
-        goods_list = result.scalars().all()
-        logger.info(f"Найдено товаров: {len(goods_list)} из total={total}")
+        if requested_fields is None:
+            load_options = [
+                selectinload(Goods.daily_availability),
+                selectinload(Goods.category),
+                selectinload(Goods.reservations)
+            ]
+        else:
+            load_options = goods_load_options(requested_fields)
+        query = base_query.options(*load_options)
+        if use_cursor:
+            query = apply_keyset(query, [Goods.id], cursor_values, limit)
+            result = await db.execute(query)
+            goods_list, next_cursor = split_page(result.scalars().all(), limit, lambda g: [g.id])
+            logger.info(f"Найдено товаров: {len(goods_list)}, next_cursor={next_cursor}")
+        else:
+            # Считаем total
+            count_query = base_query.with_only_columns(func.count()).order_by(None)
+            total = (await db.execute(count_query)).scalar()
+            result = await db.execute(query.order_by(*search_order).offset(skip).limit(limit))
+            goods_list = result.scalars().all()
+            logger.info(f"Найдено товаров: {len(goods_list)} из total={total}")
         
         # Преобразуем модели в словари для избежания ошибки сериализации
         goods_items = []
         for goods in goods_list:
+            if requested_fields is not None:
+                goods_items.append(serialize_goods(goods, requested_fields))
+                continue
+
             # Получаем доступность товара
             availability = goods.daily_availability
             
@@ -370,6 +402,8 @@ async def read_goods(
             }
             goods_items.append(goods_dict)
             
+        if use_cursor:
+            return {"items": goods_items, "next_cursor": next_cursor}
         return {"items": goods_items, "total": total}
     except Exception as e:
         logger.error(f"Ошибка при получении списка товаров: {str(e)}")
@@ -387,20 +421,11 @@ async def search_goods(
     Поиск товаров по имени или артикулу
     """
     try:
-        query = select(Goods).options(
+        return await run_goods_search(db, q, limit=50, options=(
             selectinload(Goods.daily_availability),
             selectinload(Goods.category),
             selectinload(Goods.reservations)  # Добавляем загрузку резерваций
-        ).filter(
-            or_(
-                Goods.name.ilike(f"%{q}%"),
-                Goods.article.ilike(f"%{q}%")
-            )
-        ).limit(50)
-        
-        result = await db.execute(query)
-        goods = result.scalars().all()
-        return goods
+        ))
     except Exception as e:
         logger.error(f"Ошибка при поиске товаров: {str(e)}")
         raise HTTPException(
@@ -408,10 +433,59 @@ async def search_goods(
             detail=f"Ошибка при поиске товаров: {str(e)}"
         )
 
+@app.get("/goods/{goods_id}/price-history", response_model=PriceHistoryResponse, dependencies=[Depends(verify_telegram_user)])
+async def read_price_history(
+    goods_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """История цены товара для графика: по умолчанию за последние 30 дней"""
+    end = end or datetime.now()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="Начало периода позже его конца")
+    points = await price_series(db, goods_id, start, end)
+    return {
+        "goods_id": goods_id,
+        "start": start,
+        "end": end,
+        "points": [{"changed_at": changed_at, "price": price} for changed_at, price in points]
+    }
+
+@app.get("/goods/{goods_id}/price-at", response_model=PriceAtResponse, dependencies=[Depends(verify_telegram_user)])
+async def read_price_at(goods_id: int, at: datetime, db: AsyncSession = Depends(get_db)):
+    """Цена товара на указанный момент"""
+    return {"goods_id": goods_id, "at": at, "price": await price_at(db, goods_id, at)}
+
 @app.get("/goods/{goods_id}", response_model=GoodsResponse, dependencies=[Depends(verify_telegram_user)])
-async def read_goods(goods_id: int, db: AsyncSession = Depends(get_db)):
+async def read_goods(
+    goods_id: int,
+    db: AsyncSession = Depends(get_db),
+    view: str = Query(VIEW_FULL, pattern=f"^({VIEW_FULL}|{VIEW_SUMMARY})$"),
+    fields: Optional[str] = None
+):
     """Получить товар по ID с информацией о доступности и бронированиях"""
     logger.info(f"Запрос товара с ID: {goods_id}")
+    try:
+        requested_fields = resolve_fields(view, fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if requested_fields is not None:
+        # Разреженный ответ: один запрос только за нужными колонками и связями
+        result = await db.execute(
+            select(Goods)
+            .options(*goods_load_options(requested_fields, availability_filter=DailyAvailability.date >= today))
+            .filter(Goods.id == goods_id)
+        )
+        goods = result.scalars().first()
+        if not goods:
+            logger.warning(f"Товар с ID {goods_id} не найден")
+            raise HTTPException(status_code=404, detail="Товар не найден")
+        # Минуем response_model: полная схема потребовала бы всех полей
+        return JSONResponse(content=jsonable_encoder(serialize_goods(goods, requested_fields)))
     
     # Получаем товар
     goods_query = select(Goods).filter(Goods.id == goods_id)
@@ -423,7 +497,6 @@ async def read_goods(goods_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Товар не найден")
     
     # Получаем доступность товара (начиная с сегодняшнего дня)
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     availability_query = select(DailyAvailability).filter(
         DailyAvailability.goods_id == goods_id,
         DailyAvailability.date >= today
@@ -511,6 +584,8 @@ async def update_goods(goods_id: int, goods_data: GoodsUpdate, db: AsyncSession
             .where(Goods.id == goods_id)
             .values(**update_data)
         )
+        if "price" in update_data:
+            await record_prices(db, [(goods_id, update_data["price"])])
         await db.commit()
     
     # Получаем обновленный товар с информацией о категории
@@ -528,6 +603,10 @@ async def update_goods(goods_id: int, goods_data: GoodsUpdate, db: AsyncSession
             updated_goods.min_daily, 
             updated_goods.max_daily
         )
+        await invalidate_counters(redis_client)
+    if "start_date" in update_data or "end_date" in update_data:
+        await notify_schedule_changed(redis_client, [goods_id])
+    await bump_catalog_version(redis_client)
     
     # Загружаем связанные данные
     availability_query = select(DailyAvailability).filter(DailyAvailability.goods_id == goods_id)
@@ -598,6 +677,7 @@ async def delete_goods(goods_id: int, db: AsyncSession = Depends(get_db)):
     # Удаляем товар
     await db.execute(delete(Goods).where(Goods.id == goods_id))
     await db.commit()
+    await bump_catalog_version(redis_client)
     
     return None
 
@@ -618,60 +698,32 @@ def apply_query_filters(query, filters):
                 query = query.filter(Goods.is_active == value)
     return query
 
-# Функция для удаления устаревших записей
-async def clean_expired_availability(db: AsyncSession):
-    """Удаляет записи о доступности товаров с истекшей датой"""
-    current_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    delete_stmt = delete(DailyAvailability).where(
-        DailyAvailability.date < current_date
-    )
-    
-    await db.execute(delete_stmt)
-    await db.commit()
-
-# Модифицируем эндпоинт каталога для автоматической очистки
-@app.get("/catalog/", response_model=List[GoodsResponse])
+# Каталог только читает данные: устаревшая доступность удаляется воркером (retention.py)
+@app.get("/catalog/", response_model=List[CatalogItemResponse])
 async def get_catalog(
     current_date: Optional[datetime] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """Получить список доступных товаров на текущую дату"""
     try:
+        # Кэшируем только каталог на сегодня; запросы на произвольную дату идут в базу
+        use_cache = current_date is None
         if current_date is None:
             current_date = datetime.now()
         
-        # Автоматически очищаем устаревшие записи
-        await clean_expired_availability(db)
+        if use_cache:
+            payload, version = await get_cached_catalog(redis_client, current_date)
+            if payload is not None:
+                return Response(content=payload, media_type="application/json")
         
-        # Добавляем условие is_hidden=False и загрузку связанных данных
-        query = select(Goods).options(
-            selectinload(Goods.daily_availability),
-            selectinload(Goods.category),
-            selectinload(Goods.reservations)  # Добавляем загрузку резерваций
-        ).where(
-            Goods.is_active == True,
-            Goods.is_hidden == False,
-            Goods.start_date <= current_date,
-            Goods.end_date >= current_date
-        )
-        
-        result = await db.execute(query)
-        goods = result.scalars().all()
+        # Товары и остаток на сегодня выбираются одним запросом
+        items = await fetch_catalog(db, current_date)
         
-        # Проверяем наличие доступных товаров на текущую дату
-        available_goods = []
-        for item in goods:
-            availability_query = select(DailyAvailability).where(
-                DailyAvailability.goods_id == item.id,
-                DailyAvailability.date == current_date.replace(hour=0, minute=0, second=0, microsecond=0),
-                DailyAvailability.available_quantity > 0
-            )
-            availability_result = await db.execute(availability_query)
-            if availability_result.scalars().first():
-                available_goods.append(item)
-        
-        return available_goods
+        if use_cache:
+            payload = serialize_catalog(items)
+            await store_catalog(redis_client, current_date, version, payload)
+            return Response(content=payload, media_type="application/json")
+        return items
     except Exception as e:
         logger.error(f"Ошибка при получении каталога: {str(e)}")
         raise HTTPException(
@@ -679,14 +731,13 @@ async def get_catalog(
             detail=f"Ошибка при получении каталога: {str(e)}"
         )
 
-@app.get("/catalog/{goods_id}", response_model=GoodsResponse)
+@app.get("/catalog/{goods_id}", response_model=CatalogItemResponse)
 async def get_goods_details(
     goods_id: int,
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить детальную информацию о товаре"""
-    result = await db.execute(select(Goods).filter(Goods.id == goods_id))
-    goods = result.scalars().first()
+    """Получить детальную информацию о товаре (остаток и число бронирований на сегодня)"""
+    goods = await fetch_catalog_item(db, goods_id, datetime.now())
     
     if goods is None:
         raise HTTPException(status_code=404, detail="Товар не найден")
@@ -718,7 +769,10 @@ async def push_notification_to_queue(user_id, goods_data, quantity, reservation_
     }
     try:
         logger.info(f"Пробуем положить уведомление в очередь Redis: {notification}")
-        await redis_with_retries(redis_client.rpush, "notifications", json.dumps(notification))
+        # Поток читает группа потребителей notification_worker.py; обработанные записи обрезает сам воркер
+        await redis_with_retries(
+            redis_client.xadd, "notifications:stream", {"payload": json.dumps(notification)}
+        )
         logger.info(f"Уведомление успешно добавлено в очередь Redis для user_id={user_id}, goods_id={goods_data.get('id')}, reservation_id={reservation_id}")
     except Exception as e:
         logger.error(f"Ошибка при добавлении уведомления в очередь Redis: {str(e)}")
@@ -762,40 +816,12 @@ async def create_reservation(
     if start_date and end_date and (start_date > current_date or end_date < current_date):
         raise HTTPException(status_code=400, detail="Товар недоступен для бронирования на текущую дату")
     
-    # Проверяем доступность на текущую дату
-    availability_query = select(DailyAvailability).where(
-        DailyAvailability.goods_id == goods.id,
-        DailyAvailability.date == current_date,
-    )
-    availability_result = await db.execute(availability_query)
-    availability = availability_result.scalars().first()
-    
-    if not availability or availability.available_quantity <= 0:
-        raise HTTPException(status_code=400, detail="Товар недоступен для бронирования")
-    
-    # Проверяем, не бронировал ли уже пользователь этот товар сегодня
-    existing_reservation_query = select(Reservation).where(
-        Reservation.goods_id == goods.id,
-        Reservation.user_id == user_id,
-        func.date(Reservation.reserved_at) == current_date.date()
-    )
-    existing_result = await db.execute(existing_reservation_query)
-    if existing_result.scalars().first():
-        raise HTTPException(status_code=400, detail="Вы уже бронировали этот товар сегодня")
-    
-    # Создаем бронирование с гарантированным user_id
-    db_reservation = Reservation(
-        goods_id=goods.id,
-        user_id=user_id,  # Используем ID пользователя из Telegram
-        quantity=reservation.quantity
-    )
-    db.add(db_reservation)
-    
-    # Уменьшаем доступное количество товара
-    availability.available_quantity -= reservation.quantity
-    
-    await db.commit()
-    await db.refresh(db_reservation)
+    # Списываем остаток и создаем бронирование одной атомарной транзакцией
+    try:
+        db_reservation = await reserve(redis_client, db, goods.id, user_id, reservation.quantity, current_date)
+    except ReservationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await bump_catalog_version(redis_client)
     
     # Отправляем уведомление через очередь Redis
     try:
@@ -807,7 +833,7 @@ async def create_reservation(
             "cashback_percent": goods.cashback_percent,
             "image": goods.image,
             "purchase_guide": goods.purchase_guide
-        }, reservation.quantity, db_reservation.id)
+        }, reservation.quantity, db_reservation["id"])
     except Exception as e:
         logger.error(f"Ошибка при постановке уведомления в очередь: {str(e)}")
     
@@ -859,18 +885,31 @@ async def health_check():
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
 # Эндпоинты для доступности товаров
-@app.get("/availability/", response_model=List[DailyAvailabilityResponse], dependencies=[Depends(verify_telegram_user)])
+@app.get("/availability/", response_model=Union[List[DailyAvailabilityResponse], DailyAvailabilityPage], dependencies=[Depends(verify_telegram_user)])
 async def read_all_availability(
     skip: int = 0, 
     limit: int = 500,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     goods_id: Optional[int] = None,
+    paging: str = Query(PAGING_OFFSET, pattern=f"^({PAGING_OFFSET}|{PAGING_CURSOR})$"),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить данные о доступности всех товаров с возможностью фильтрации"""
+    """
+    Получить данные о доступности всех товаров с возможностью фильтрации.
+    В режиме paging=cursor страницы идут по (date, id) и возвращается {items, next_cursor}.
+    """
     global _last_availability_request_time, _availability_cache
     
+    use_cursor = paging == PAGING_CURSOR or cursor is not None
+    cursor_values = None
+    if cursor:
+        try:
+            cursor_values = decode_cursor(cursor, [datetime.fromisoformat, int])
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     # Проверяем, прошло ли достаточно времени с последнего запроса
     current_time = time.time()
     
@@ -878,7 +917,7 @@ async def read_all_availability(
     if (_availability_cache is not None and 
         current_time - _last_availability_request_time < _availability_cache_ttl and
         not any([date_from, date_to, goods_id]) and  # Не используем кэш при фильтрации
-        skip == 0 and limit == 500):  # Не используем кэш при нестандартных параметрах
+        skip == 0 and limit == 500 and not use_cursor):  # Не используем кэш при нестандартных параметрах
         logger.info("Возвращаем кэшированные данные о доступности")
         return _availability_cache
     
@@ -899,10 +938,17 @@ async def read_all_availability(
         query = query.filter(DailyAvailability.goods_id == goods_id)
     
     # Сортировка и пагинация
-    query = query.order_by(DailyAvailability.date.desc()).offset(skip).limit(limit)
-    
-    result = await db.execute(query)
-    availability_list = result.scalars().all()
+    next_cursor = None
+    if use_cursor:
+        query = apply_keyset(query, [DailyAvailability.date, DailyAvailability.id], cursor_values, limit)
+        result = await db.execute(query)
+        availability_list, next_cursor = split_page(
+            result.scalars().all(), limit, lambda item: [item.date, item.id]
+        )
+    else:
+        query = query.order_by(DailyAvailability.date.desc()).offset(skip).limit(limit)
+        result = await db.execute(query)
+        availability_list = result.scalars().all()
     
     # Получаем информацию о товарах для отображения названий
     goods_ids = [item.goods_id for item in availability_list]
@@ -925,6 +971,9 @@ async def read_all_availability(
         }
         response_list.append(availability_dict)
     
+    if use_cursor:
+        return {"items": response_list, "next_cursor": next_cursor}
+    
     # Обновляем кэш, если это стандартный запрос без фильтров
     if not any([date_from, date_to, goods_id]) and skip == 0 and limit == 500:
         _availability_cache = response_list
@@ -939,9 +988,22 @@ async def read_all_reservations(
     goods_id: Optional[int] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
+    paging: str = Query(PAGING_OFFSET, pattern=f"^({PAGING_OFFSET}|{PAGING_CURSOR})$"),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить список всех бронирований с возможностью фильтрации"""
+    """
+    Получить список всех бронирований с возможностью фильтрации.
+    В режиме paging=cursor страницы идут по (reserved_at, id) и возвращается {items, next_cursor}.
+    """
+    use_cursor = paging == PAGING_CURSOR or cursor is not None
+    cursor_values = None
+    if cursor:
+        try:
+            cursor_values = decode_cursor(cursor, [datetime.fromisoformat, int])
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     logger.info(f"Запрос списка бронирований с параметрами: skip={skip}, limit={limit}, user_id={user_id}, goods_id={goods_id}, date_from={date_from}, date_to={date_to}")
     
     # Создаем базовый запрос
@@ -958,10 +1020,17 @@ async def read_all_reservations(
         query = query.filter(Reservation.reserved_at <= date_to)
     
     # Сортировка и пагинация
-    query = query.order_by(Reservation.reserved_at.desc()).offset(skip).limit(limit)
-    
-    result = await db.execute(query)
-    reservations_list = result.scalars().all()
+    next_cursor = None
+    if use_cursor:
+        query = apply_keyset(query, [Reservation.reserved_at, Reservation.id], cursor_values, limit)
+        result = await db.execute(query)
+        reservations_list, next_cursor = split_page(
+            result.scalars().all(), limit, lambda item: [item.reserved_at, item.id]
+        )
+    else:
+        query = query.order_by(Reservation.reserved_at.desc()).offset(skip).limit(limit)
+        result = await db.execute(query)
+        reservations_list = result.scalars().all()
     
     # Получаем информацию о товарах для отображения названий
     goods_ids = [item.goods_id for item in reservations_list]
@@ -985,6 +1054,8 @@ async def read_all_reservations(
         }
         response_list.append(reservation_dict)
     
+    if use_cursor:
+        return {"items": response_list, "next_cursor": next_cursor}
     return response_list
 
 @app.delete("/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -1033,6 +1104,10 @@ async def cancel_reservation(
         .where(Reservation.id == reservation_id)
     )
     await db.commit()
+    if daily_availability:
+        await release_stock(redis_client, reservation.goods_id, reservation.user_id,
+                            reservation.quantity, reservation.reserved_at)
+    await bump_catalog_version(redis_client)
     
     return None
 
@@ -1050,7 +1125,7 @@ async def parse_wildberries(request_data: dict):
     try:
         # Используем функцию из parser.py
         logger.debug("Вызов функции parse_wildberries_url")
-        result = await parse_wildberries_url(url)
+        result = await parse_wildberries_url(url, wb_session)
         
         if not result:
             logger.error(f"Парсинг URL {url} не вернул результатов")
@@ -1065,6 +1140,38 @@ async def parse_wildberries(request_data: dict):
         raise HTTPException(status_code=500, detail=f"Ошибка при парсинге товара: {str(e)}")
 
 
+@app.get("/parse-wildberries/cache-stats")
+async def parse_cache_stats():
+    """Счетчики кэша карточек WB: попадания, промахи, отсутствующие артикулы, склеенные запросы"""
+    stats = await card_cache.get_stats()
+    lookups = stats.get("hits", 0) + stats.get("negative_hits", 0) + stats.get("misses", 0)
+    stats["hit_ratio"] = round((lookups - stats.get("misses", 0)) / lookups, 3) if lookups else None
+    return stats
+
+@app.post("/goods/bulk/import", response_model=BulkImportResponse)
+async def bulk_import_goods(payload: BulkImportRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Массовый импорт товаров по ссылкам WB или артикулам.
+    Ссылки парсятся параллельно с ограничением IMPORT_CONCURRENCY, товары и их доступность
+    создаются в одной транзакции, по каждому источнику возвращается результат.
+    """
+    if len(payload.items) > IMPORT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Не больше {IMPORT_MAX_ITEMS} товаров за один импорт")
+    if payload.min_daily > payload.max_daily:
+        raise HTTPException(status_code=400, detail="min_daily не может быть больше max_daily")
+
+    logger.info(f"Запрос на импорт {len(payload.items)} товаров")
+    defaults = payload.dict(exclude={"items", "skip_existing"})
+    results = await import_goods(db, payload.items, defaults, skip_existing=payload.skip_existing, session=wb_session)
+
+    created = sum(1 for item in results if item["success"])
+    if created:
+        await invalidate_counters(redis_client)
+        await bump_catalog_version(redis_client)
+        await notify_schedule_changed(redis_client, [item["goods_id"] for item in results if item["success"]])
+    logger.info(f"Импорт завершен: создано {created}, ошибок {len(results) - created}")
+    return {"created": created, "failed": len(results) - created, "items": results}
+
 @app.delete("/reservations/{reservation_id}/user/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def bot_cancel_reservation(reservation_id: int, user_id: int, db: AsyncSession = Depends(get_db)):
     """Отмена бронирования по прямому запросу от бота"""
@@ -1105,9 +1212,24 @@ async def bot_cancel_reservation(reservation_id: int, user_id: int, db: AsyncSes
         .where(Reservation.id == reservation_id)
     )
     await db.commit()
+    if daily_availability:
+        await release_stock(redis_client, reservation.goods_id, reservation.user_id,
+                            reservation.quantity, reservation.reserved_at)
+    await bump_catalog_version(redis_client)
     
     return None
 
+@app.put("/inventory/hot-mode", dependencies=[Depends(verify_telegram_user)])
+async def toggle_hot_inventory(enabled: bool):
+    """Аварийное выключение (и обратное включение) бронирования через счетчики Redis"""
+    try:
+        await set_kill_switch(redis_client, disabled=not enabled)
+    except Exception as e:
+        logger.error(f"Ошибка при переключении режима горячих остатков: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при переключении режима: {str(e)}")
+    logger.warning(f"Режим горячих остатков {'включен' if enabled else 'выключен'}")
+    return {"hot_inventory": enabled}
+
 # Эндпоинты для категорий
 @app.post("/categories/", response_model=CategoryResponse, status_code=status.HTTP_201_CREATED)
 async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_db)):
@@ -1170,6 +1292,7 @@ async def update_category(
             .values(**update_data)
         )
         await db.commit()
+        await bump_catalog_version(redis_client)
     
     result = await db.execute(select(Category).filter(Category.id == category_id))
     updated_category = result.scalars().first()
@@ -1195,6 +1318,7 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
     # Удаляем категорию
     await db.execute(delete(Category).where(Category.id == category_id))
     await db.commit()
+    await bump_catalog_version(redis_client)
     
     return None
 
@@ -1231,6 +1355,7 @@ async def bulk_hide_goods(
         updated_goods = result.all()
         
         logger.info(f"Успешно скрыты товары: {[g.name for g in updated_goods]}")
+        await bump_catalog_version(redis_client)
         
         return {"message": f"Успешно скрыто товаров: {len(goods_ids)}"}
         
@@ -1280,6 +1405,7 @@ async def bulk_show_goods(
         updated_goods = result.all()
         
         logger.info(f"Успешно показаны товары: {[g.name for g in updated_goods]}")
+        await bump_catalog_version(redis_client)
         
         return {"message": f"Успешно показано товаров: {len(goods_ids)}"}
         
@@ -1297,6 +1423,45 @@ async def bulk_show_goods(
             detail=f"Ошибка при отображении товаров: {str(e)}"
         )
 
+@app.put("/goods/bulk/availability", status_code=status.HTTP_200_OK)
+async def bulk_regenerate_availability(
+    payload: BulkAvailabilityRegenerate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Массовая перегенерация доступности товаров в одной транзакции"""
+    goods_ids = payload.goods_ids
+    logger.info(f"Запрос на перегенерацию доступности товаров: {goods_ids}")
+    try:
+        result = await db.execute(
+            select(Goods.id, Goods.start_date, Goods.end_date, Goods.min_daily, Goods.max_daily)
+            .where(Goods.id.in_(goods_ids))
+        )
+        goods_list = result.all()
+        if not goods_list:
+            raise HTTPException(status_code=404, detail="Товары не найдены")
+
+        count = await regenerate_availability(db, goods_list)
+        await db.commit()
+    except HTTPException:
+        raise
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при перегенерации доступности: {str(e)}")
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при перегенерации доступности: {str(e)}"
+        )
+
+    await invalidate_counters(redis_client)
+    await bump_catalog_version(redis_client)
+    return {
+        "message": f"Доступность перегенерирована для товаров: {len(goods_list)}",
+        "generated": count
+    }
+
 # Для тестирования приложения
 if __name__ == "__main__":
     import uvicorn
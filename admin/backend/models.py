@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, BigInteger, ForeignKey, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from datetime import datetime as dt, timedelta
@@ -32,8 +32,9 @@ class Goods(Base):
     image = Column(String, index=True)
     is_active = Column(Boolean, default=True)
     is_hidden = Column(Boolean, default=False)
-    start_date = Column(DateTime(timezone=True), nullable=True)
-    end_date = Column(DateTime(timezone=True), nullable=True)
+    # Индексы нужны планировщику активации: он выбирает ближайшие границы диапазонными запросами
+    start_date = Column(DateTime(timezone=True), nullable=True, index=True)
+    end_date = Column(DateTime(timezone=True), nullable=True, index=True)
     min_daily = Column(Integer, default=1)
     max_daily = Column(Integer, default=10)
     purchase_guide = Column(String, nullable=True)
@@ -58,6 +59,11 @@ class DailyAvailability(Base):
     
     goods = relationship("Goods", back_populates="daily_availability")
     
+    # Ключ keyset-пагинации /availability/ (date, id)
+    __table_args__ = (
+        Index('ix_daily_availability_date_id', 'date', 'id'),
+    )
+    
     def __repr__(self):
         return f"DailyAvailability(id={self.id}, goods_id={self.goods_id}, date={self.date}, quantity={self.available_quantity})"
 
@@ -71,6 +77,54 @@ class Reservation(Base):
     reserved_at = Column(DateTime(timezone=True), server_default=func.now())
     
     goods = relationship("Goods", back_populates="reservations")
+    
+    # Ключ keyset-пагинации /reservations/ (reserved_at, id)
+    __table_args__ = (
+        Index('ix_reservations_reserved_at_id', 'reserved_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f"Reservation(id={self.id}, goods={self.goods_id}, user={self.user_id})"
+
+class RetentionRun(Base):
+    __tablename__ = "retention_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, index=True)
+    cutoff = Column(DateTime(timezone=True))
+    batches = Column(Integer, default=0)
+    deleted_rows = Column(Integer, default=0)
+    oldest_date = Column(DateTime(timezone=True), nullable=True)
+    newest_date = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"RetentionRun(id={self.id}, table={self.table_name}, deleted={self.deleted_rows})"
+
+class InventoryFlush(Base):
+    __tablename__ = "inventory_flushes"
+    
+    # Примененные переносы горячих списаний (inventory.py): перенос с уже записанным id не повторяется
+    flush_id = Column(String, primary_key=True)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"InventoryFlush(flush_id={self.flush_id}, applied_at={self.applied_at})"
+
+class GoodsPriceHistory(Base):
+    __tablename__ = "goods_price_history"
+    
+    # Хранятся только точки изменения цены: цена действует до следующей точки
+    id = Column(BigInteger, primary_key=True)
+    goods_id = Column(Integer, ForeignKey('goods.id', ondelete='CASCADE'), nullable=False)
+    price = Column(Integer, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    # "Цена на момент T" и выборка диапазона для графика — по (goods_id, changed_at)
+    __table_args__ = (
+        Index('ix_goods_price_history_goods_changed', 'goods_id', 'changed_at'),
+    )
 
     def __repr__(self):
-        return f"Reservation(id={self.id}, goods={self.goods_id}, user={self.user_id})"
\ No newline at end of file
+        return f"GoodsPriceHistory(goods={self.goods_id}, price={self.price}, changed_at={self.changed_at})"
@@ -2,10 +2,17 @@ import asyncio
 import os
 import json
 import logging
+import random
+import socket
+import time
+import uuid
 from datetime import datetime
 import aiohttp
 import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
 import re
+from image_cache import image_cache
+from collections import deque
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,24 +23,174 @@ logger = logging.getLogger('notification_worker')
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 BOT_API_URL = os.getenv("BOT_API_URL", "http://bot:8080")
+# Старая очередь-список: при старте переносится в поток
 QUEUE_NAME = "notifications"
 DLQ_NAME = "notifications_dlq"
+# Поток уведомлений и группа потребителей: реплики воркера делят сообщения и подтверждают их через XACK
+STREAM_NAME = "notifications:stream"
+GROUP_NAME = "notification_workers"
+CONSUMER_NAME = os.getenv("NOTIFICATION_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+STREAM_BLOCK_MS = 5000  # сколько ждать новых сообщений в одном XREADGROUP
+# Сообщение упавшего потребителя забирается, если оно не подтверждено дольше этого срока
+CLAIM_IDLE_MS = int(os.getenv("NOTIFICATION_CLAIM_IDLE_MS", "60000"))
+CLAIM_INTERVAL = 30  # как часто проверять зависшие сообщения и обрезать поток (сек)
+MAX_DELIVERIES = 3  # сообщение, которое столько раз роняло потребителей, уходит в DLQ
+# Сколько уведомлений отправляется одновременно и сколько прочитанных может ждать своей очереди
+NOTIFICATION_CONCURRENCY = int(os.getenv("NOTIFICATION_CONCURRENCY", "8"))
+NOTIFICATION_PREFETCH = int(os.getenv("NOTIFICATION_PREFETCH", str(NOTIFICATION_CONCURRENCY * 4)))
+# Пакетная отправка боту: до NOTIFICATION_BATCH_SIZE уведомлений в запросе (0 — по одному),
+# пакет ждет остальных не дольше NOTIFICATION_BATCH_WAIT секунд
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "20"))
+NOTIFICATION_BATCH_WAIT = float(os.getenv("NOTIFICATION_BATCH_WAIT", "0.02"))
 MAX_RETRIES = 5
-RETRY_DELAY = 5  # секунд между попытками
+# Сколько раз сообщение можно отложить по просьбе бота (429 / flood wait), прежде чем отправить в DLQ
+MAX_THROTTLED_RETRIES = int(os.getenv("NOTIFICATION_MAX_THROTTLED_RETRIES", "20"))
+# Отложенные повторы: ZSET со временем, когда сообщение пора вернуть в поток
+RETRY_ZSET = "notifications:retry"
+RETRY_BASE_DELAY = 5  # задержка первого повтора (сек), дальше удваивается
+RETRY_MAX_DELAY = 300  # потолок задержки повтора (сек)
+RETRY_POLL_INTERVAL = 0.5  # как часто проверять наступившие повторы (сек)
+RETRY_PROMOTE_BATCH = 100
+# Пока у пользователя ждет повтор, его следующие уведомления откладываются в список за ним:
+# маркер хранит retry_id ожидающего повтора, список — уведомления в порядке поступления
+DEFERRED_PREFIX = "notifications:deferred"
+PARKED_PREFIX = "notifications:parked"
+DEFERRED_TTL = 86400  # страховка: маркер потерянного повтора не держит пользователя дольше суток
 REDIS_RETRIES = 5  # Количество попыток при ошибке Redis
 REDIS_RETRY_DELAY = 5  # Базовая задержка между попытками (сек)
 
+# Переносит наступившие повторы в поток атомарно, поэтому несколько реплик не продублируют сообщение
+PROMOTE_RETRIES_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, payload in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', 'payload', payload)
+    redis.call('ZREM', KEYS[1], payload)
+end
+return #due
+"""
+
+# KEYS: маркер, список отложенных, поток; ARGV: уведомление, его retry_id.
+# Откладывает уведомление, если у пользователя ждет другой повтор. Если маркер истек, а список остался,
+# возвращает список в поток, а уведомление ставит за ним
+PARK_LUA = """
+local head = redis.call('GET', KEYS[1])
+if head then
+    if head == ARGV[2] then return 0 end
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+local parked = redis.call('LRANGE', KEYS[2], 0, -1)
+if #parked == 0 then return 0 end
+for _, payload in ipairs(parked) do
+    redis.call('XADD', KEYS[3], '*', 'payload', payload)
+end
+redis.call('XADD', KEYS[3], '*', 'payload', ARGV[1])
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# KEYS: маркер, список отложенных, поток; ARGV: retry_id завершенного повтора.
+# Повтор завершен (доставлен или ушел в DLQ): отложенные за ним уведомления по порядку возвращаются в поток
+RELEASE_DEFERRED_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+local parked = redis.call('LRANGE', KEYS[2], 0, -1)
+for _, payload in ipairs(parked) do
+    redis.call('XADD', KEYS[3], '*', 'payload', payload)
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return #parked
+"""
+
+class RetryLater(Exception):
+    """Бот просит подождать (429 / flood wait): сообщение откладывается, а не ждет в воркере"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after} s")
+        self.retry_after = retry_after
+
+# Общая HTTP-сессия для проверки картинок и пакетный отправитель (создаются в notification_worker)
+http_session = None
+bot_batcher = None
+
+class BotBatchSender:
+    """
+    Склеивает уведомления из очередей разных пользователей в один запрос /send_notifications:
+    пакет уходит, когда набралось batch_size сообщений или прошло max_wait секунд с первого.
+    Каждый отправитель получает ответ по своему уведомлению.
+    """
+
+    def __init__(self, session, batch_size=NOTIFICATION_BATCH_SIZE, max_wait=NOTIFICATION_BATCH_WAIT):
+        self.session = session
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def send(self, notification):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((notification, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._post(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, batch):
+        try:
+            payload = [notification for notification, _ in batch]
+            async with self.session.post(f"{BOT_API_URL}/send_notifications", json=payload) as resp:
+                if resp.status == 200:
+                    results = (await resp.json())["results"]
+                    responses = [(200, json.dumps(result, ensure_ascii=False), result, None) for result in results]
+                else:
+                    # Ошибка всего пакета относится к каждому уведомлению в нем
+                    text = await resp.text()
+                    responses = [(resp.status, text, {}, resp.headers.get("Retry-After"))] * len(batch)
+            if len(responses) != len(batch):
+                # Без взаимно однозначного ответа нельзя понять, какие уведомления доставлены
+                raise ValueError(f"Бот вернул {len(responses)} результатов на пакет из {len(batch)} уведомлений")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
 async def is_image_url_valid(url):
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.head(url, timeout=5) as resp:
-                return resp.status == 200
-    except Exception as e:
-        logger.warning(f"Image URL validation failed: {url}, error: {e}")
-        return False
+    """Проверка картинки через кэш: сеть нужна, только если ссылки нет ни в памяти, ни в Redis"""
+    if http_session is not None:
+        return await image_cache.is_valid(url, http_session)
+    async with aiohttp.ClientSession() as session:
+        return await image_cache.is_valid(url, session)
+
+async def post_to_bot(notification):
+    """
+    Отправляет уведомление боту через пакетный отправитель или отдельным запросом.
+    Возвращает (HTTP-статус, текст ответа, ответ по уведомлению, Retry-After).
+    """
+    if bot_batcher is not None:
+        return await bot_batcher.send(notification)
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{BOT_API_URL}/send_notification", json=notification) as resp:
+            text = await resp.text()
+            data = await resp.json() if resp.status == 200 else {}
+            return resp.status, text, data, resp.headers.get("Retry-After")
 
 async def send_notification_to_bot(notification, allow_payload_correction=True):
-    url = f"{BOT_API_URL}/send_notification"
     logger.info(f"Sending payload to bot: {json.dumps(notification, ensure_ascii=False)}")
     goods_data = notification.get("goods_data", {})
     image_url = goods_data.get("image")
@@ -50,50 +207,47 @@ async def send_notification_to_bot(notification, allow_payload_correction=True):
         if re.search(r'[`*_]', text):
             logger.warning(f"Possible markdown in text: {text}")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=notification) as resp:
-                text = await resp.text()
-                if resp.status == 200:
-                    data = await resp.json()
-                    if data.get("status") == "success" and data.get("delivery_confirmed", False):
-                        logger.info(f"Notification delivered: {notification}")
-                        return True
-                    if "flood" in text.lower() or "wait" in text.lower():
-                        wait_time = data.get("retry_after") or 30
-                        logger.warning(f"Flood wait from Bot API. Waiting {wait_time} seconds. Response: {data}")
-                        await asyncio.sleep(int(wait_time))
-                        return False
-                    else:
-                        logger.warning(f"Bot API error: {data}. Payload: {json.dumps(notification, ensure_ascii=False)}")
-                        # --- CORRECT PAYLOAD IF POSSIBLE ---
-                        if allow_payload_correction:
-                            corrected = False
-                            # 1. Удаляем image, если есть подозрение на web page content
-                            if goods_data.get("image") and "web page content" in str(data).lower():
-                                logger.warning("Removing image field due to web page content error and retrying...")
-                                goods_data.pop("image", None)
+        status, text, data, retry_after = await post_to_bot(notification)
+        if status == 200:
+            if data.get("status") == "success" and data.get("delivery_confirmed", False):
+                logger.info(f"Notification delivered: {notification}")
+                return True
+            # Бот возвращает retry_after на TelegramRetryAfter; по одному слову "wait" в тексте не откладываем
+            if data.get("retry_after") or "flood" in text.lower():
+                wait_time = data.get("retry_after") or 30
+                logger.warning(f"Flood wait from Bot API. Retry in {wait_time} seconds. Response: {data}")
+                raise RetryLater(int(wait_time))
+            else:
+                logger.warning(f"Bot API error: {data}. Payload: {json.dumps(notification, ensure_ascii=False)}")
+                # --- CORRECT PAYLOAD IF POSSIBLE ---
+                if allow_payload_correction:
+                    corrected = False
+                    # 1. Удаляем image, если есть подозрение на web page content
+                    if goods_data.get("image") and "web page content" in str(data).lower():
+                        logger.warning("Removing image field due to web page content error and retrying...")
+                        goods_data.pop("image", None)
+                        corrected = True
+                    # 2. Удаляем markdown/html из текста
+                    for key in ["purchase_guide", "name"]:
+                        if key in goods_data:
+                            clean = re.sub(r'<[^>]+>', '', goods_data[key])
+                            clean = re.sub(r'[`*_\[\]]', '', clean)
+                            if clean != goods_data[key]:
+                                logger.warning(f"Cleaning formatting in {key} and retrying...")
+                                goods_data[key] = clean
                                 corrected = True
-                            # 2. Удаляем markdown/html из текста
-                            for key in ["purchase_guide", "name"]:
-                                if key in goods_data:
-                                    clean = re.sub(r'<[^>]+>', '', goods_data[key])
-                                    clean = re.sub(r'[`*_\[\]]', '', clean)
-                                    if clean != goods_data[key]:
-                                        logger.warning(f"Cleaning formatting in {key} and retrying...")
-                                        goods_data[key] = clean
-                                        corrected = True
-                            if corrected:
-                                return await send_notification_to_bot(notification, allow_payload_correction=False)
-                        return False
-                elif resp.status == 429:
-                    retry_after = resp.headers.get("Retry-After")
-                    wait_time = int(retry_after) if retry_after and retry_after.isdigit() else 30
-                    logger.warning(f"429 Too Many Requests. Flood wait {wait_time} seconds.")
-                    await asyncio.sleep(wait_time)
-                    return False
-                else:
-                    logger.error(f"HTTP error {resp.status}: {text}. Payload: {json.dumps(notification, ensure_ascii=False)}")
-                    return False
+                    if corrected:
+                        return await send_notification_to_bot(notification, allow_payload_correction=False)
+                return False
+        elif status == 429:
+            wait_time = int(retry_after) if retry_after and retry_after.isdigit() else 30
+            logger.warning(f"429 Too Many Requests. Retry in {wait_time} seconds.")
+            raise RetryLater(wait_time)
+        else:
+            logger.error(f"HTTP error {status}: {text}. Payload: {json.dumps(notification, ensure_ascii=False)}")
+            return False
+    except RetryLater:
+        raise
     except Exception as e:
         logger.error(f"Exception while sending notification: {e}. Payload: {json.dumps(notification, ensure_ascii=False)}")
         return False
@@ -113,32 +267,14 @@ async def redis_with_retries(method, *args, **kwargs):
                 raise
 
 async def process_notification(redis_client, raw_notification):
+    notification = {}
     try:
         notification = json.loads(raw_notification)
-        reservation_id = notification.get("reservation_id")
-        if reservation_id:
-            sent_key = f"sent_reservation:{reservation_id}"
-            already_sent = await redis_with_retries(redis_client.get, sent_key)
-            if already_sent:
-                logger.warning(f"Уведомление с reservation_id={reservation_id} уже отправлялось, пропускаем.")
-                return
-        retries = notification.get("retries", 0)
-        logger.info(f"Обработка уведомления: {notification}")
-        success = await send_notification_to_bot(notification)
-        if success:
-            logger.info(f"Уведомление отправлено и удалено из очереди: {notification}")
-            if reservation_id:
-                await redis_with_retries(redis_client.set, f"sent_reservation:{reservation_id}", "1", ex=60*60*24)
-        else:
-            if retries + 1 >= MAX_RETRIES:
-                logger.error(f"Достигнут лимит попыток, переносим в DLQ: {notification}")
-                notification["failed_at"] = datetime.utcnow().isoformat()
-                await redis_with_retries(redis_client.rpush, DLQ_NAME, json.dumps(notification))
-            else:
-                notification["retries"] = retries + 1
-                logger.warning(f"Повторная попытка отправки через {RETRY_DELAY} сек. Попытка {notification['retries']}/{MAX_RETRIES}")
-                await asyncio.sleep(RETRY_DELAY)
-                await redis_with_retries(redis_client.rpush, QUEUE_NAME, json.dumps(notification))
+        if await park_behind_retry(redis_client, notification, raw_notification):
+            logger.info(f"У пользователя {notification.get('user_id')} ждет повтор, уведомление поставлено за ним")
+            return
+        if await deliver_notification(redis_client, notification):
+            return
     except Exception as e:
         logger.error(f"Ошибка обработки уведомления: {e}")
         # В случае критической ошибки тоже отправляем в DLQ
@@ -146,20 +282,338 @@ async def process_notification(redis_client, raw_notification):
             await redis_with_retries(redis_client.rpush, DLQ_NAME, raw_notification)
         except Exception as e2:
             logger.critical(f"Ошибка при переносе в DLQ: {e2}")
+            # Сообщение останется неподтвержденным и будет забрано повторно
+            raise
+    await release_deferred(redis_client, notification)
 
-async def notification_worker():
-    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
-    logger.info("Воркер уведомлений запущен. Ожидание новых задач...")
+async def deliver_notification(redis_client, notification):
+    """Отправляет уведомление; возвращает True, если оно отложено для повтора"""
+    reservation_id = notification.get("reservation_id")
+    if reservation_id:
+        sent_key = f"sent_reservation:{reservation_id}"
+        already_sent = await redis_with_retries(redis_client.get, sent_key)
+        if already_sent:
+            logger.warning(f"Уведомление с reservation_id={reservation_id} уже отправлялось, пропускаем.")
+            return False
+    retries = notification.get("retries", 0)
+    logger.info(f"Обработка уведомления: {notification}")
+    try:
+        success = await send_notification_to_bot(notification)
+    except RetryLater as e:
+        # Ограничение скорости не расходует MAX_RETRIES, но считается отдельно, чтобы сообщение не ходило по кругу
+        throttled = notification.get("throttled", 0) + 1
+        if throttled >= MAX_THROTTLED_RETRIES:
+            logger.error(f"Бот {throttled} раз просил подождать, переносим в DLQ: {notification}")
+            await move_to_dlq(redis_client, notification)
+            return False
+        notification["throttled"] = throttled
+        await schedule_retry(redis_client, notification, retry_delay(retries, e.retry_after))
+        return True
+    if success:
+        logger.info(f"Уведомление отправлено и удалено из очереди: {notification}")
+        if reservation_id:
+            await redis_with_retries(redis_client.set, f"sent_reservation:{reservation_id}", "1", ex=60*60*24)
+        return False
+    if retries + 1 >= MAX_RETRIES:
+        logger.error(f"Достигнут лимит попыток, переносим в DLQ: {notification}")
+        await move_to_dlq(redis_client, notification)
+        return False
+    notification["retries"] = retries + 1
+    delay = retry_delay(retries)
+    logger.warning(f"Повторная попытка отправки через {delay:.1f} сек. Попытка {notification['retries']}/{MAX_RETRIES}")
+    await schedule_retry(redis_client, notification, delay)
+    return True
+
+async def move_to_dlq(redis_client, notification):
+    notification["failed_at"] = datetime.utcnow().isoformat()
+    await redis_with_retries(redis_client.rpush, DLQ_NAME, json.dumps(notification))
+
+def deferred_keys(user_id):
+    return [f"{DEFERRED_PREFIX}:{user_id}", f"{PARKED_PREFIX}:{user_id}", STREAM_NAME]
+
+async def park_behind_retry(redis_client, notification, raw_notification):
+    """Ставит уведомление за ожидающим повтором того же пользователя; True, если отложено"""
+    user_id = notification.get("user_id")
+    if user_id is None:
+        return False
+    parked = await redis_with_retries(
+        redis_client.eval, PARK_LUA, 3, *deferred_keys(user_id), raw_notification, notification.get("retry_id", "")
+    )
+    return bool(parked)
+
+async def release_deferred(redis_client, notification):
+    """Повтор завершен: возвращает в поток уведомления пользователя, ждавшие за ним"""
+    user_id = notification.get("user_id")
+    retry_id = notification.get("retry_id")
+    if user_id is None or retry_id is None:
+        return
+    released = await redis_with_retries(
+        redis_client.eval, RELEASE_DEFERRED_LUA, 3, *deferred_keys(user_id), retry_id
+    )
+    if released:
+        logger.info(f"Возвращено в очередь {released} уведомлений пользователя {user_id}, ждавших повтора")
+
+def retry_delay(retries, retry_after=0):
+    """
+    Экспоненциальная задержка с джиттером: половина задержки фиксирована, половина случайна,
+    чтобы повторы после общего сбоя не возвращались одной пачкой. Не меньше retry_after от бота.
+    """
+    backoff = min(RETRY_BASE_DELAY * 2 ** retries, RETRY_MAX_DELAY)
+    return max(backoff / 2 + random.uniform(0, backoff / 2), retry_after)
+
+async def schedule_retry(redis_client, notification, delay):
+    """
+    Откладывает сообщение в RETRY_ZSET; в поток его вернет run_retry_mover.
+    Маркер пользователя ставится в той же транзакции: следующие его уведомления будут ждать этот повтор.
+    """
+    due = time.time() + delay
+    # Время повтора в теле делает член ZSET уникальным даже для одинаковых уведомлений
+    notification["retry_at"] = datetime.utcfromtimestamp(due).isoformat()
+    user_id = notification.get("user_id")
+    if user_id is None:
+        await redis_with_retries(redis_client.zadd, RETRY_ZSET, {json.dumps(notification): due})
+        return
+    notification.setdefault("retry_id", uuid.uuid4().hex)
+
+    async def add_retry():
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zadd(RETRY_ZSET, {json.dumps(notification): due})
+            pipe.set(f"{DEFERRED_PREFIX}:{user_id}", notification["retry_id"], ex=DEFERRED_TTL + int(delay))
+            await pipe.execute()
+
+    await redis_with_retries(add_retry)
+
+async def run_retry_mover(redis_client):
+    """Возвращает в поток сообщения, чье время повтора наступило"""
+    promote = redis_client.register_script(PROMOTE_RETRIES_LUA)
     while True:
         try:
-            raw_notification = await redis_with_retries(redis_client.lpop, QUEUE_NAME)
-            if raw_notification:
-                await process_notification(redis_client, raw_notification)
-            else:
-                await asyncio.sleep(1)
+            moved = await promote(
+                keys=[RETRY_ZSET, STREAM_NAME],
+                args=[time.time(), RETRY_PROMOTE_BATCH]
+            )
+            if moved:
+                logger.info(f"Возвращено в очередь {moved} отложенных уведомлений")
+            if moved < RETRY_PROMOTE_BATCH:
+                await asyncio.sleep(RETRY_POLL_INTERVAL)
         except Exception as e:
-            logger.error(f"Ошибка в основном цикле воркера: {e}")
+            logger.error(f"Ошибка переноса отложенных уведомлений: {e}")
             await asyncio.sleep(5)
 
+async def enqueue(redis_client, raw_notification):
+    await redis_with_retries(
+        redis_client.xadd, STREAM_NAME, {"payload": raw_notification}
+    )
+
+async def ensure_group(redis_client):
+    """Создает поток и группу потребителей, если их еще нет"""
+    try:
+        await redis_client.xgroup_create(STREAM_NAME, GROUP_NAME, id="0", mkstream=True)
+        logger.info(f"Создана группа {GROUP_NAME} для потока {STREAM_NAME}")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def migrate_legacy_queue(redis_client):
+    """Переносит уведомления, оставшиеся в старом списке, в поток"""
+    moved = 0
+    while True:
+        raw_notification = await redis_with_retries(redis_client.lpop, QUEUE_NAME)
+        if raw_notification is None:
+            break
+        await enqueue(redis_client, raw_notification)
+        moved += 1
+    if moved:
+        logger.info(f"Перенесено {moved} уведомлений из списка {QUEUE_NAME} в поток {STREAM_NAME}")
+
+async def handle_message(redis_client, message_id, fields):
+    """Обрабатывает запись потока и подтверждает ее (повтор уже поставлен в поток новой записью)"""
+    raw_notification = fields.get("payload")
+    if raw_notification is not None:
+        await process_notification(redis_client, raw_notification)
+    await redis_with_retries(redis_client.xack, STREAM_NAME, GROUP_NAME, message_id)
+
+def ordering_key(message_id, fields):
+    """Уведомления одного пользователя обрабатываются строго по порядку"""
+    try:
+        user_id = json.loads(fields.get("payload") or "{}").get("user_id")
+    except (ValueError, AttributeError):
+        user_id = None
+    return f"user:{user_id}" if user_id is not None else f"message:{message_id}"
+
+class NotificationPool:
+    """
+    Обрабатывает уведомления параллельно, не больше concurrency одновременно.
+    У каждого пользователя своя очередь: его уведомления идут друг за другом, разные пользователи — параллельно.
+    Прочитанных, но еще не обработанных сообщений не больше prefetch — submit ждет, пока освободится место.
+    """
+
+    def __init__(self, redis_client, concurrency=NOTIFICATION_CONCURRENCY, prefetch=NOTIFICATION_PREFETCH):
+        self.redis = redis_client
+        self._slots = asyncio.Semaphore(concurrency)
+        self._buffer = asyncio.Semaphore(max(prefetch, concurrency))
+        self._lanes = {}
+        self._message_ids = set()
+        self._tasks = set()
+
+    def __contains__(self, message_id):
+        return message_id in self._message_ids
+
+    async def submit(self, message_id, fields):
+        if message_id in self._message_ids:
+            return
+        await self._buffer.acquire()
+        self._message_ids.add(message_id)
+        key = ordering_key(message_id, fields)
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append((message_id, fields))
+            return
+        self._lanes[key] = deque([(message_id, fields)])
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key):
+        lane = self._lanes[key]
+        try:
+            while lane:
+                message_id, fields = lane[0]
+                try:
+                    async with self._slots:
+                        await handle_message(self.redis, message_id, fields)
+                except Exception as e:
+                    # Неподтвержденное сообщение позже заберет claim_stale_messages
+                    logger.error(f"Сообщение {message_id} не обработано: {e}")
+                finally:
+                    lane.popleft()
+                    self._message_ids.discard(message_id)
+                    self._buffer.release()
+        finally:
+            del self._lanes[key]
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+async def claim_stale_messages(redis_client, pool):
+    """
+    Забирает сообщения, которые другие потребители получили, но не подтвердили за CLAIM_IDLE_MS.
+    Сообщения, доставленные больше MAX_DELIVERIES раз, переносятся в DLQ без обработки.
+    Собственные сообщения, которые еще ждут очереди в пуле, пропускаются.
+    """
+    start_id = "0-0"
+    while True:
+        next_id, messages, *_ = await redis_client.xautoclaim(
+            STREAM_NAME, GROUP_NAME, CONSUMER_NAME, CLAIM_IDLE_MS, start_id=start_id, count=10
+        )
+        for message_id, fields in messages:
+            if message_id in pool:
+                continue
+            pending = await redis_client.xpending_range(
+                STREAM_NAME, GROUP_NAME, min=message_id, max=message_id, count=1
+            )
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            logger.warning(f"Забрано зависшее сообщение {message_id} (доставок: {deliveries})")
+            if deliveries > MAX_DELIVERIES:
+                logger.error(f"Сообщение {message_id} доставлялось {deliveries} раз, переносим в DLQ")
+                await redis_with_retries(redis_client.rpush, DLQ_NAME, fields.get("payload", "{}"))
+                await redis_with_retries(redis_client.xack, STREAM_NAME, GROUP_NAME, message_id)
+                continue
+            await pool.submit(message_id, fields)
+        if next_id in ("0-0", b"0-0"):
+            return
+        start_id = next_id
+
+def stream_id_key(message_id):
+    ms, _, seq = message_id.partition("-")
+    return int(ms), int(seq or 0)
+
+async def trim_stream(redis_client):
+    """
+    Удаляет из потока записи, которые все группы уже получили и подтвердили:
+    граница — самый старый неподтвержденный id или, если таких нет, last-delivered-id группы.
+    Длину потока на стороне продюсеров не ограничиваем — иначе вытеснялись бы недоставленные записи.
+    """
+    boundaries = []
+    for group in await redis_client.xinfo_groups(STREAM_NAME):
+        pending = await redis_client.xpending(STREAM_NAME, group["name"])
+        boundaries.append(pending["min"] if pending["pending"] else group["last-delivered-id"])
+    if not boundaries:
+        return 0
+    # MINID удаляет записи строго меньше границы, поэтому сама граница остается
+    min_id = min(boundaries, key=stream_id_key)
+    trimmed = await redis_client.xtrim(STREAM_NAME, minid=min_id, approximate=True)
+    if trimmed:
+        logger.info(f"Из потока {STREAM_NAME} удалено {trimmed} обработанных записей (до {min_id})")
+    return trimmed
+
+async def read_messages(redis_client, pool, last_id=">"):
+    """
+    Читает сообщения группы и передает их в пул: ">" — новые (с ожиданием до STREAM_BLOCK_MS),
+    иначе — собственные неподтвержденные после last_id. Возвращает id последнего прочитанного или None.
+    """
+    response = await redis_client.xreadgroup(
+        GROUP_NAME, CONSUMER_NAME, {STREAM_NAME: last_id}, count=NOTIFICATION_CONCURRENCY,
+        block=STREAM_BLOCK_MS if last_id == ">" else None
+    )
+    last_read = None
+    for _, messages in response or []:
+        for message_id, fields in messages:
+            await pool.submit(message_id, fields)
+            last_read = message_id
+    return last_read
+
+async def notification_worker():
+    global http_session, bot_batcher
+    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    image_cache.attach(redis_client)
+    http_session = aiohttp.ClientSession()
+    if NOTIFICATION_BATCH_SIZE > 0:
+        bot_batcher = BotBatchSender(http_session)
+    await redis_with_retries(ensure_group, redis_client)
+    await migrate_legacy_queue(redis_client)
+    pool = NotificationPool(redis_client)
+    retry_mover = asyncio.create_task(run_retry_mover(redis_client))
+    logger.info(
+        f"Воркер уведомлений {CONSUMER_NAME} запущен "
+        f"(параллельно до {NOTIFICATION_CONCURRENCY}). Ожидание новых задач..."
+    )
+
+    loop = asyncio.get_running_loop()
+    # Сначала дочитываем то, что этот потребитель получил, но не подтвердил до перезапуска
+    recover_from = "0"
+    next_claim_at = loop.time()
+    try:
+        while True:
+            try:
+                if recover_from is not None:
+                    recover_from = await read_messages(redis_client, pool, recover_from)
+                    continue
+                if loop.time() >= next_claim_at:
+                    await claim_stale_messages(redis_client, pool)
+                    await trim_stream(redis_client)
+                    next_claim_at = loop.time() + CLAIM_INTERVAL
+                await read_messages(redis_client, pool)
+            except ResponseError as e:
+                if "NOGROUP" in str(e):
+                    # Поток или группу удалили (например, FLUSHDB) — создаем заново
+                    await ensure_group(redis_client)
+                    continue
+                logger.error(f"Ошибка Redis в основном цикле воркера: {e}")
+                await asyncio.sleep(5)
+            except Exception as e:
+                logger.error(f"Ошибка в основном цикле воркера: {e}")
+                await asyncio.sleep(5)
+    finally:
+        retry_mover.cancel()
+        await pool.close()
+        await http_session.close()
+
 if __name__ == "__main__":
     asyncio.run(notification_worker()) 
\ No newline at end of file
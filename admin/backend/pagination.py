@@ -0,0 +1,61 @@
+import base64
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import tuple_
+
+# Режимы пагинации списков: offset (skip/limit, как раньше) и cursor (keyset)
+PAGING_OFFSET = "offset"
+PAGING_CURSOR = "cursor"
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или выдан для другого списка"""
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Упаковывает значения ключа сортировки последней строки в непрозрачный токен"""
+    raw = json.dumps([_to_json(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, types: Sequence[Callable]) -> list:
+    """Распаковывает токен; types — конструкторы значений (datetime.fromisoformat, int, ...)"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursor("Некорректный курсор")
+        return [convert(value) for convert, value in zip(types, values)]
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("Некорректный курсор")
+
+
+def apply_keyset(query, columns: Sequence, cursor_values: Optional[list], limit: int, descending: bool = True):
+    """
+    Сортирует запрос по columns и продолжает выборку строго после курсора.
+    Берем limit + 1 строку, чтобы понять, есть ли следующая страница, без count(*).
+    """
+    if cursor_values is not None:
+        key = tuple_(*columns)
+        bound = tuple_(*cursor_values)
+        query = query.where(key < bound if descending else key > bound)
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows: List, limit: int, key: Callable) -> tuple:
+    """Возвращает (строки страницы, next_cursor или None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
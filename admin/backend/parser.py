@@ -4,7 +4,12 @@ import logging
 import math
 from functools import lru_cache
 import sys
+import os
 import asyncio
+from contextlib import asynccontextmanager
+
+from basket_index import basket_index
+from card_cache import card_cache
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,6 +22,52 @@ logger = logging.getLogger(__name__)
 print('=== PRINT TEST: parser.py загружен ===')
 logger.info('=== LOGGER TEST: parser.py logger работает ===')
 
+# Адреса WB (бенчмарк подменяет их на локальный mock-сервер)
+CARD_API_URL = 'https://card.wb.ru/cards/v1/detail'
+ALT_CARD_URL = 'https://wbx-content-v2.wbstatic.net/ru/{product_id}.json'
+BASKET_URL = 'https://basket-{host}.wbbasket.ru'
+
+# Настройки общего пула соединений к WB
+WB_POOL_LIMIT = int(os.getenv("WB_POOL_LIMIT", "100"))
+WB_POOL_LIMIT_PER_HOST = int(os.getenv("WB_POOL_LIMIT_PER_HOST", "10"))
+WB_DNS_TTL = int(os.getenv("WB_DNS_TTL", "600"))
+WB_KEEPALIVE = float(os.getenv("WB_KEEPALIVE", "60"))
+WB_REQUEST_TIMEOUT = float(os.getenv("WB_REQUEST_TIMEOUT", "15"))
+
+# Перебор basket-хостов: диапазон, размер волны параллельных проверок и задержка хеджа
+BASKET_FIRST = 20
+BASKET_LAST = 49
+BASKET_PROBE_WAVE = int(os.getenv("BASKET_PROBE_WAVE", "4"))
+BASKET_HEDGE_DELAY = float(os.getenv("BASKET_HEDGE_DELAY", "0.3"))
+
+
+def create_wb_session() -> aiohttp.ClientSession:
+    """
+    Долгоживущая сессия для запросов к WB: соединения к card.wb.ru и basket-XX
+    переиспользуются (keep-alive), DNS кэшируется, число соединений ограничено.
+    Создается и закрывается в lifespan приложения.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=WB_POOL_LIMIT,
+        limit_per_host=WB_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=WB_DNS_TTL,
+        keepalive_timeout=WB_KEEPALIVE
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=WB_REQUEST_TIMEOUT)
+    )
+
+
+@asynccontextmanager
+async def wb_session_scope(session: aiohttp.ClientSession = None):
+    """Отдает переданную сессию или открывает временную (для вызовов вне приложения)"""
+    if session is not None:
+        yield session
+        return
+    async with aiohttp.ClientSession() as own_session:
+        yield own_session
+
 def extract_product_id(url):
     """Извлекает ID товара из URL Wildberries"""
     logger.debug(f"Извлечение ID товара из URL: {url}")
@@ -46,7 +97,7 @@ def get_basket_host(vol: int) -> str:
     return None
 
 async def is_image_exists(host: str, vol: int, part: int, nm: int, session, timeout_sec=2) -> tuple:
-    url = f"https://basket-{host}.wbbasket.ru/vol{vol}/part{part}/{nm}/images/big/1.webp"
+    url = f"{BASKET_URL.format(host=host)}/vol{vol}/part{part}/{nm}/images/big/1.webp"
     try:
         timeout = aiohttp.ClientTimeout(total=timeout_sec)
         async with session.head(url, timeout=timeout) as resp:
@@ -58,38 +109,136 @@ async def is_image_exists(host: str, vol: int, part: int, nm: int, session, time
             return (False, "NO_MORE_BASKETS")
         return (False, None)
 
-async def find_working_basket_host(vol: int, part: int, nm: int, session) -> str:
-    """Сначала basket по алгоритму, затем строго последовательный перебор basket-20...49 (кроме уже проверенного). Таймаут 1 секунда. DNS-ошибка — прекращаем перебор basket-XX > N."""
-    # 1. Пробуем basket по алгоритму
+def estimate_basket_host(vol: int) -> int:
+    """
+    Наиболее вероятный номер basket для vol: по таблице, а за ее пределами —
+    экстраполяция шагом последнего известного диапазона (216 vol на basket).
+    """
     alg_host = get_basket_host(vol)
-    checked = set()
-    if alg_host is not None and alg_host.isdigit() and 20 <= int(alg_host) < 50:
-        result, err = await is_image_exists(alg_host, vol, part, nm, session, timeout_sec=1)
-        checked.add(alg_host)
-        if err == "NO_MORE_BASKETS":
-            logger.warning(f"DNS-ошибка на basket-{alg_host}, прекращаю перебор basket-XX > {alg_host}")
-            return None
-        if result:
-            logger.info(f"Нашёл рабочий basket-{alg_host} (по алгоритму) для vol={vol}, nm={nm}")
-            return alg_host
-    # 2. Перебираем basket-20...49 (кроме уже проверенного)
-    for i in range(20, 50):
-        host = str(i).zfill(2)
-        if host in checked:
-            continue
-        result, err = await is_image_exists(host, vol, part, nm, session, timeout_sec=1)
-        if err == "NO_MORE_BASKETS":
-            logger.warning(f"DNS-ошибка на basket-{host}, прекращаю перебор basket-XX > {host}")
-            break
-        if result:
-            logger.info(f"Нашёл рабочий basket-{host} для vol={vol}, nm={nm}")
-            return host
+    if alg_host is not None:
+        return int(alg_host)
+    return 20 + (vol - 3486) // 216 + 1
+
+
+def basket_probe_order(vol: int, low: int = None, high: int = None) -> list:
+    """
+    Хосты basket-20...49 в порядке убывания вероятности: сначала укладывающиеся в границы
+    из индекса [low, high], внутри — ближе к оценке раньше. Остальные хосты идут в конце
+    на случай, если в индексе ошибочная точка.
+    """
+    low = BASKET_FIRST if low is None else low
+    high = BASKET_LAST if high is None else high
+    estimate = min(max(estimate_basket_host(vol), low, BASKET_FIRST), high, BASKET_LAST)
+    hosts = range(BASKET_FIRST, BASKET_LAST + 1)
+    # При равном расстоянии сначала старший хост: новые артикулы лежат на новых basket
+    ordered = sorted(hosts, key=lambda host: (not low <= host <= high, abs(host - estimate), -host))
+    return [str(host).zfill(2) for host in ordered]
+
+
+async def find_working_basket_host(vol: int, part: int, nm: int, session,
+                                   wave: int = None, hedge_delay: float = None, timeout_sec: float = 1) -> str:
+    """
+    Ищет basket с картинкой товара. vol из известного интервала индекса не проверяется вовсе,
+    иначе хосты проверяются от наиболее вероятного,
+    параллельно волнами по wave штук. Если волна не ответила за hedge_delay,
+    запускается следующая (не больше двух волн одновременно). Первый ответ 200 возвращается,
+    остальные проверки отменяются. DNS-ошибка на basket-N — хосты старше N больше не проверяются.
+    """
+    known_host = basket_index.lookup(vol)
+    if known_host:
+        logger.info(f"basket-{known_host} для vol={vol} взят из индекса")
+        return known_host
+
+    wave = wave or BASKET_PROBE_WAVE
+    hedge_delay = BASKET_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    queue = basket_probe_order(vol, *basket_index.bounds(vol))
+    pending = {}
+    to_launch = wave
+    try:
+        while True:
+            for host in queue[:to_launch]:
+                task = asyncio.create_task(is_image_exists(host, vol, part, nm, session, timeout_sec=timeout_sec))
+                pending[task] = host
+            del queue[:to_launch]
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(
+                pending, timeout=hedge_delay if queue else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Хедж: текущая волна медлит — добавляем следующую
+                to_launch = min(wave, max(2 * wave - len(pending), 0))
+                continue
+
+            to_launch = 0
+            for task in done:
+                host = pending.pop(task)
+                if task.cancelled():
+                    continue
+                result, err = task.result()
+                if result:
+                    logger.info(f"Нашёл рабочий basket-{host} для vol={vol}, nm={nm}")
+                    await basket_index.record(vol, host)
+                    return host
+                if err == "NO_MORE_BASKETS":
+                    logger.warning(f"DNS-ошибка на basket-{host}, прекращаю перебор basket-XX > {host}")
+                    queue = [other for other in queue if int(other) < int(host)]
+                    for other_task, other in pending.items():
+                        if int(other) > int(host):
+                            other_task.cancel()
+                to_launch += 1
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
     logger.error(f"Не удалось найти рабочий basket-хост для vol={vol}, nm={nm}")
     return None
 
-async def get_product_details(product_id):
-    """Получение данных о товаре через API"""
-    url = f'https://card.wb.ru/cards/v1/detail?appType=1&curr=rub&dest=-1257786&spp=27&nm={product_id}'
+def calculate_wb_price(product: dict):
+    """Цена с учетом WB-кошелька (-2%) по карточке товара; None, если цены в карточке нет"""
+    if 'salePriceU' in product:
+        base_sale_price = product['salePriceU'] / 100
+        return math.floor(base_sale_price * 0.98)
+    if 'priceU' in product:
+        base_price = product['priceU'] / 100
+        if 'sale' in product:
+            sale_percent = product['sale']
+            base_sale_price = base_price * (1 - sale_percent/100)
+            return math.floor(base_sale_price * 0.98)
+        return math.floor(base_price * 0.98)
+    return None
+
+async def fetch_product_cards(nm_ids, session: aiohttp.ClientSession) -> dict:
+    """
+    Карточки нескольких товаров одним запросом (nm через ';').
+    Возвращает {nm: карточка}; артикулов, которых нет в ответе, в словаре нет.
+    Сетевые ошибки и ответы не 200 пробрасываются как исключения.
+    """
+    nm_param = ';'.join(str(nm) for nm in nm_ids)
+    url = f'{CARD_API_URL}?appType=1&curr=rub&dest=-1257786&spp=27&nm={nm_param}'
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36',
+        'Accept': '*/*',
+    }
+    async with session.get(url=url, headers=headers) as response:
+        response.raise_for_status()
+        data = await response.json(content_type=None)
+    products = (data.get('data') or {}).get('products') or []
+    return {product['id']: product for product in products if 'id' in product}
+
+async def get_product_details(product_id, session: aiohttp.ClientSession = None, use_cache: bool = True):
+    """
+    Данные о товаре: из кэша карточек или через API.
+    Одновременные запросы одного артикула выполняются одним запросом к WB.
+    """
+    if not use_cache:
+        return await fetch_product_details(product_id, session)
+    return await card_cache.get_or_fetch(product_id, lambda: fetch_product_details(product_id, session))
+
+async def fetch_product_details(product_id, session: aiohttp.ClientSession = None):
+    """Получение данных о товаре через API (через общую сессию, если она передана)"""
+    url = f'{CARD_API_URL}?appType=1&curr=rub&dest=-1257786&spp=27&nm={product_id}'
     logger.debug(f"Запрос данных товара с ID: {product_id}, URL: {url}")
     
     headers = {
@@ -99,7 +248,7 @@ async def get_product_details(product_id):
         'Referer': f'https://www.wildberries.ru/catalog/{product_id}/detail.aspx',
     }
     
-    async with aiohttp.ClientSession() as session:
+    async with wb_session_scope(session) as session:
         try:
             async with session.get(url=url, headers=headers) as response:
                 logger.debug(f"Получен ответ от API, статус: {response.status}")
@@ -108,7 +257,7 @@ async def get_product_details(product_id):
                     logger.error(f"Ошибка API, статус: {response.status}")
                     
                     # Пробуем альтернативный URL, если первый не сработал
-                    alt_url = f'https://wbx-content-v2.wbstatic.net/ru/{product_id}.json'
+                    alt_url = ALT_CARD_URL.format(product_id=product_id)
                     logger.debug(f"Пробуем альтернативный URL: {alt_url}")
                     
                     async with session.get(alt_url) as alt_response:
@@ -129,7 +278,7 @@ async def get_product_details(product_id):
                     logger.warning(f"В ответе API отсутствуют данные о товаре.")
                     
                     # Пробуем альтернативный URL, если в основном ответе нет товаров
-                    alt_url = f'https://wbx-content-v2.wbstatic.net/ru/{product_id}.json'
+                    alt_url = ALT_CARD_URL.format(product_id=product_id)
                     logger.debug(f"Пробуем альтернативный URL: {alt_url}")
                     
                     async with session.get(alt_url) as alt_response:
@@ -145,12 +294,14 @@ async def get_product_details(product_id):
             logger.exception(f"Исключение при получении данных товара: {e}")
             return None
 
-async def parse_wildberries_url(url):
+async def parse_wildberries_url(url, session: aiohttp.ClientSession = None, use_cache: bool = True):
     """
     Основная функция для парсинга данных с Wildberries по URL
     
     Args:
         url: Ссылка на товар Wildberries
+        session: Общая сессия aiohttp; без нее на вызов открывается временная
+        use_cache: Брать карточку из кэша карточек (False — всегда свежие данные WB)
         
     Returns:
         dict: Словарь с данными о товаре или None, если парсинг не удался
@@ -163,7 +314,7 @@ async def parse_wildberries_url(url):
             return None
             
         # Получаем данные о товаре
-        product_data = await get_product_details(product_id)
+        product_data = await get_product_details(product_id, session, use_cache)
         
         if not product_data or 'data' not in product_data or 'products' not in product_data['data'] or not product_data['data']['products']:
             logger.error("Не удалось получить информацию о товаре")
@@ -172,18 +323,7 @@ async def parse_wildberries_url(url):
         product = product_data['data']['products'][0]
         
         # Вычисляем цену с учетом WB-кошелька
-        wb_price = None
-        if 'salePriceU' in product:
-            base_sale_price = product['salePriceU'] / 100
-            wb_price = math.floor(base_sale_price * 0.98)
-        elif 'priceU' in product:
-            base_price = product['priceU'] / 100
-            if 'sale' in product:
-                sale_percent = product['sale']
-                base_sale_price = base_price * (1 - sale_percent/100)
-                wb_price = math.floor(base_sale_price * 0.98)
-            else:
-                wb_price = math.floor(base_price * 0.98)
+        wb_price = calculate_wb_price(product)
         
         # Формируем URL изображения
         image_url = None
@@ -191,8 +331,8 @@ async def parse_wildberries_url(url):
             nm = int(product_id)
             vol = nm // 100000
             part = nm // 1000
-            async with aiohttp.ClientSession() as session:
-                host = await find_working_basket_host(vol, part, nm, session)
+            async with wb_session_scope(session) as basket_session:
+                host = await find_working_basket_host(vol, part, nm, basket_session)
                 if host:
                     image_url = f"https://basket-{host}.wbbasket.ru/vol{vol}/part{part}/{nm}/images/big/1.webp"
                     logger.info(f"Сформирован image_url: {image_url}")
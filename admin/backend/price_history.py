@@ -0,0 +1,165 @@
+"""
+История цен товаров.
+
+В goods_price_history пишутся только точки изменения: новая строка появляется, лишь если цена
+отличается от последней записанной. Цена на момент T — последняя точка не позже T.
+Старые точки уплотняет compact_price_history: оставляет по одной точке на товар в день,
+убирает повторы и удаляет историю старше PRICE_HISTORY_RETENTION_DAYS.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, column, delete, func, insert, literal, select, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import GoodsPriceHistory
+
+logger = logging.getLogger('price_history')
+
+# Точки старше этого срока уплотняются до одной в день
+PRICE_HISTORY_COMPACT_AFTER_DAYS = int(os.getenv("PRICE_HISTORY_COMPACT_AFTER_DAYS", "30"))
+# Точки старше этого срока удаляются (кроме последней, которая задает цену на границе)
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RETENTION_DAYS", "730"))
+
+
+async def record_prices(db: AsyncSession, prices: Iterable[Tuple[int, Optional[int]]],
+                        changed_at: Optional[datetime] = None) -> int:
+    """
+    Записывает точки (goods_id, price) одним INSERT ... SELECT, пропуская цены,
+    совпадающие с последней точкой товара. Коммит остается за вызывающим кодом.
+    """
+    rows = [(goods_id, price) for goods_id, price in prices if price is not None]
+    if not rows:
+        return 0
+
+    history = GoodsPriceHistory.__table__
+    new_prices = values(
+        column("goods_id", Integer), column("price", Integer), name="new_prices"
+    ).data(rows)
+    last_price = (
+        select(history.c.price)
+        .where(history.c.goods_id == new_prices.c.goods_id)
+        .order_by(history.c.changed_at.desc(), history.c.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    changed_at_value = literal(changed_at) if changed_at else func.now()
+    result = await db.execute(
+        insert(history).from_select(
+            ["goods_id", "price", "changed_at"],
+            select(new_prices.c.goods_id, new_prices.c.price, changed_at_value)
+            .where(new_prices.c.price.is_distinct_from(last_price))
+        )
+    )
+    return result.rowcount
+
+
+async def price_at(db: AsyncSession, goods_id: int, at: datetime) -> Optional[int]:
+    """Цена товара на момент at или None, если истории на тот момент нет"""
+    result = await db.execute(
+        select(GoodsPriceHistory.price)
+        .where(GoodsPriceHistory.goods_id == goods_id, GoodsPriceHistory.changed_at <= at)
+        .order_by(GoodsPriceHistory.changed_at.desc(), GoodsPriceHistory.id.desc())
+        .limit(1)
+    )
+    return result.scalar()
+
+
+async def price_series(db: AsyncSession, goods_id: int, start: datetime, end: datetime) -> List[Tuple[datetime, int]]:
+    """
+    Ступенчатый ряд для графика: цена, действовавшая на start (с отметкой start),
+    и все изменения внутри (start, end].
+    """
+    points = []
+    opening = await price_at(db, goods_id, start)
+    if opening is not None:
+        points.append((start, opening))
+    result = await db.execute(
+        select(GoodsPriceHistory.changed_at, GoodsPriceHistory.price)
+        .where(
+            GoodsPriceHistory.goods_id == goods_id,
+            GoodsPriceHistory.changed_at > start,
+            GoodsPriceHistory.changed_at <= end
+        )
+        .order_by(GoodsPriceHistory.changed_at, GoodsPriceHistory.id)
+    )
+    points.extend((changed_at, price) for changed_at, price in result.all())
+    return points
+
+
+async def compact_price_history(db: AsyncSession,
+                                compact_after_days: int = PRICE_HISTORY_COMPACT_AFTER_DAYS,
+                                retention_days: int = PRICE_HISTORY_RETENTION_DAYS) -> dict:
+    """
+    Уплотняет историю за одну транзакцию:
+    1. старше compact_after_days — оставляет последнюю точку товара за каждый день;
+    2. убирает точки, повторяющие цену предыдущей (появляются после шага 1);
+    3. старше retention_days — удаляет все точки, кроме последней на границе.
+    """
+    now = datetime.utcnow()
+    compact_cutoff = now - timedelta(days=compact_after_days)
+    retention_cutoff = now - timedelta(days=retention_days)
+    history = GoodsPriceHistory.__table__
+
+    day_rank = (
+        select(
+            history.c.id,
+            func.row_number().over(
+                partition_by=(history.c.goods_id, func.date_trunc("day", history.c.changed_at)),
+                order_by=(history.c.changed_at.desc(), history.c.id.desc())
+            ).label("rank")
+        )
+        .where(history.c.changed_at < compact_cutoff)
+        .subquery()
+    )
+    downsampled = await db.execute(
+        delete(history).where(history.c.id.in_(select(day_rank.c.id).where(day_rank.c.rank > 1)))
+    )
+
+    previous = (
+        select(
+            history.c.id,
+            history.c.changed_at,
+            history.c.price,
+            func.lag(history.c.price).over(
+                partition_by=history.c.goods_id,
+                order_by=(history.c.changed_at, history.c.id)
+            ).label("previous_price")
+        )
+        .subquery()
+    )
+    repeats = await db.execute(
+        delete(history).where(history.c.id.in_(
+            select(previous.c.id).where(
+                previous.c.changed_at < compact_cutoff,
+                previous.c.price == previous.c.previous_price
+            )
+        ))
+    )
+
+    age_rank = (
+        select(
+            history.c.id,
+            func.row_number().over(
+                partition_by=history.c.goods_id,
+                order_by=(history.c.changed_at.desc(), history.c.id.desc())
+            ).label("rank")
+        )
+        .where(history.c.changed_at < retention_cutoff)
+        .subquery()
+    )
+    expired = await db.execute(
+        delete(history).where(history.c.id.in_(select(age_rank.c.id).where(age_rank.c.rank > 1)))
+    )
+    await db.commit()
+
+    stats = {
+        "downsampled": downsampled.rowcount,
+        "repeats": repeats.rowcount,
+        "expired": expired.rowcount,
+    }
+    logger.info(f"Уплотнение истории цен: {stats}")
+    return stats
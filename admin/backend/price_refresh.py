@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Integer, column, func, select, update, values
+
+from database import AsyncScopedSession
+from models import Goods
+from parser import calculate_wb_price, create_wb_session, fetch_product_cards
+from price_history import record_prices
+
+logger = logging.getLogger('price_refresh')
+
+# Как часто обновлять цены, сколько артикулов в одном запросе к WB и сколько запросов в секунду
+PRICE_REFRESH_INTERVAL = int(os.getenv("PRICE_REFRESH_INTERVAL", "3600"))
+PRICE_REFRESH_BATCH = int(os.getenv("PRICE_REFRESH_BATCH", "100"))
+PRICE_REFRESH_RPS = float(os.getenv("PRICE_REFRESH_RPS", "2"))
+
+
+async def load_active_goods() -> List[Tuple[int, int, int]]:
+    """(id, nm, текущая цена) активных товаров с числовым артикулом"""
+    async with AsyncScopedSession() as db:
+        result = await db.execute(
+            select(Goods.id, Goods.article, Goods.price).where(Goods.is_active == True)
+        )
+        return [
+            (goods_id, int(article), price)
+            for goods_id, article, price in result.all()
+            if article and article.isdigit()
+        ]
+
+
+async def fetch_prices(nm_ids: List[int], session, batch_size: int = PRICE_REFRESH_BATCH,
+                       rps: float = PRICE_REFRESH_RPS) -> Dict[int, int]:
+    """
+    Цены с учетом WB-кошелька для списка nm: по batch_size артикулов в запросе,
+    запросы идут последовательно не чаще rps в секунду. Ошибка одной порции не останавливает остальные.
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1 / rps if rps > 0 else 0
+    next_request_at = loop.time()
+    prices = {}
+    for start in range(0, len(nm_ids), batch_size):
+        chunk = nm_ids[start:start + batch_size]
+        await asyncio.sleep(max(next_request_at - loop.time(), 0))
+        next_request_at = loop.time() + interval
+        try:
+            cards = await fetch_product_cards(chunk, session)
+        except Exception as e:
+            logger.warning(f"Не удалось получить цены для {len(chunk)} артикулов: {e}")
+            continue
+        for nm, card in cards.items():
+            price = calculate_wb_price(card)
+            if price is not None:
+                prices[nm] = price
+    return prices
+
+
+async def apply_prices(changes: List[Tuple[int, int]], observed: List[Tuple[int, int]] = ()) -> int:
+    """
+    Записывает новые цены одним UPDATE ... FROM (VALUES ...) и в той же транзакции
+    добавляет точки истории цен для всех полученных цен (повторы истории отбрасываются).
+    """
+    if not changes and not observed:
+        return 0
+    goods = Goods.__table__
+    async with AsyncScopedSession() as db:
+        updated = 0
+        if changes:
+            new_prices = values(
+                column("id", Integer), column("price", Integer), name="new_prices"
+            ).data(changes)
+            result = await db.execute(
+                update(goods)
+                .where(goods.c.id == new_prices.c.id)
+                .values(price=new_prices.c.price, updated_at=func.now())
+            )
+            updated = result.rowcount
+        await record_prices(db, observed or changes)
+        await db.commit()
+        return updated
+
+
+async def refresh_prices(session=None) -> int:
+    """Обновляет цены активных товаров; пишет только строки, где цена изменилась"""
+    goods = await load_active_goods()
+    if not goods:
+        logger.info("Нет активных товаров для обновления цен")
+        return 0
+
+    nm_ids = list(dict.fromkeys(nm for _, nm, _ in goods))
+    logger.info(f"Обновление цен: {len(goods)} товаров, {len(nm_ids)} артикулов")
+
+    own_session = session is None
+    if own_session:
+        session = create_wb_session()
+    try:
+        prices = await fetch_prices(nm_ids, session)
+    finally:
+        if own_session:
+            await session.close()
+
+    observed = [(goods_id, prices[nm]) for goods_id, nm, _ in goods if nm in prices]
+    changes = [
+        (goods_id, prices[nm])
+        for goods_id, nm, price in goods
+        if nm in prices and prices[nm] != price
+    ]
+    updated = await apply_prices(changes, observed)
+    logger.info(f"Цены получены для {len(prices)} из {len(nm_ids)} артикулов, изменено {updated} товаров")
+    return updated
+
+
+async def run_price_refresh_loop():
+    """Периодическое обновление цен (запускается рядом с воркером активности)"""
+    while True:
+        try:
+            await refresh_prices()
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении цен: {e}")
+        await asyncio.sleep(PRICE_REFRESH_INTERVAL)
@@ -0,0 +1,91 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import update, insert, exists, literal, func, Integer, BigInteger
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import DailyAvailability, Reservation
+
+logger = logging.getLogger('api')
+
+
+class ReservationError(Exception):
+    """Бронирование невозможно (нет остатка, повтор и т.п.); текст уходит пользователю"""
+
+
+async def insert_reservation(db: AsyncSession, goods_id: int, user_id: int, quantity: int,
+                             today: datetime):
+    """
+    Вставляет бронирование, если пользователь еще не бронировал этот товар сегодня.
+    Возвращает строку бронирования или None при повторе. Коммит остается за вызывающим.
+    """
+    already_reserved = exists().where(
+        Reservation.goods_id == goods_id,
+        Reservation.user_id == user_id,
+        func.date(Reservation.reserved_at) == today.date()
+    )
+    inserted = await db.execute(
+        insert(Reservation)
+        .from_select(
+            ["goods_id", "user_id", "quantity"],
+            select(
+                literal(goods_id, Integer),
+                literal(user_id, BigInteger),
+                literal(quantity, Integer)
+            ).where(~already_reserved)
+        )
+        .returning(
+            Reservation.id,
+            Reservation.goods_id,
+            Reservation.user_id,
+            Reservation.quantity,
+            Reservation.reserved_at
+        )
+    )
+    return inserted.mappings().first()
+
+
+async def reserve_stock(db: AsyncSession, goods_id: int, user_id: int, quantity: int,
+                        current_date: datetime) -> dict:
+    """
+    Атомарно списывает остаток на сегодня и создает бронирование в одной транзакции.
+
+    Списание выполняется одним условным UPDATE ... WHERE available_quantity >= :q,
+    поэтому два покупателя не могут продать один и тот же остаток.
+    UPDATE блокирует строку доступности до коммита, и проверка повторного бронирования
+    в INSERT ... WHERE NOT EXISTS выполняется уже после коммита конкурирующей транзакции.
+    """
+    if quantity is None or quantity < 1:
+        raise ReservationError("Некорректное количество для бронирования")
+
+    today = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    try:
+        decrement = await db.execute(
+            update(DailyAvailability)
+            .where(
+                DailyAvailability.goods_id == goods_id,
+                DailyAvailability.date == today,
+                DailyAvailability.available_quantity >= quantity
+            )
+            .values(available_quantity=DailyAvailability.available_quantity - quantity)
+            .returning(DailyAvailability.available_quantity)
+            .execution_options(synchronize_session=False)
+        )
+        remaining = decrement.scalar()
+        if remaining is None:
+            raise ReservationError("Товар недоступен для бронирования")
+
+        reservation = await insert_reservation(db, goods_id, user_id, quantity, today)
+        if reservation is None:
+            raise ReservationError("Вы уже бронировали этот товар сегодня")
+
+        await db.commit()
+    except BaseException:
+        # Откат возвращает списанный остаток
+        await db.rollback()
+        raise
+
+    logger.info(f"Бронирование {reservation['id']}: товар {goods_id}, пользователь {user_id}, остаток {remaining}")
+    return dict(reservation)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, delete, func
+from database import AsyncScopedSession
+from models import DailyAvailability, RetentionRun
+from price_history import compact_price_history
+
+logger = logging.getLogger('availability_retention')
+
+MOSCOW_TZ = ZoneInfo('Europe/Moscow')
+
+# Размер одной порции удаления и пауза между порциями,
+# чтобы не держать блокировки на daily_availability долго
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.1"))
+# Час (по МСК), в который запускается очистка — вне полуночного пика
+RETENTION_HOUR = int(os.getenv("RETENTION_HOUR", "4"))
+
+async def prune_expired_availability(batch_size: int = RETENTION_BATCH_SIZE,
+                                     batch_pause: float = RETENTION_BATCH_PAUSE):
+    """
+    Удаляет записи о доступности с датой раньше сегодняшней порциями по batch_size.
+    Курсор идет по id, каждая порция коммитится отдельно.
+    Итог запуска сохраняется в таблицу retention_runs.
+    """
+    cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cursor = 0
+    batches = 0
+    deleted_rows = 0
+    oldest_date = None
+    newest_date = None
+    started_at = datetime.utcnow()
+
+    logger.info(f"Очистка устаревшей доступности: cutoff={cutoff}, batch_size={batch_size}")
+
+    try:
+        while True:
+            async with AsyncScopedSession() as session:
+                batch_ids = (
+                    select(DailyAvailability.id)
+                    .where(
+                        DailyAvailability.date < cutoff,
+                        DailyAvailability.id > cursor
+                    )
+                    .order_by(DailyAvailability.id)
+                    .limit(batch_size)
+                )
+                result = await session.execute(
+                    delete(DailyAvailability)
+                    .where(DailyAvailability.id.in_(batch_ids.scalar_subquery()))
+                    .returning(DailyAvailability.id, DailyAvailability.date)
+                    .execution_options(synchronize_session=False)
+                )
+                rows = result.all()
+                await session.commit()
+
+            if not rows:
+                break
+
+            batches += 1
+            deleted_rows += len(rows)
+            cursor = max(row.id for row in rows)
+            batch_oldest = min(row.date for row in rows)
+            batch_newest = max(row.date for row in rows)
+            oldest_date = batch_oldest if oldest_date is None else min(oldest_date, batch_oldest)
+            newest_date = batch_newest if newest_date is None else max(newest_date, batch_newest)
+            logger.info(f"Порция {batches}: удалено {len(rows)} записей, курсор id={cursor}")
+
+            if len(rows) < batch_size:
+                break
+            await asyncio.sleep(batch_pause)
+
+        async with AsyncScopedSession() as session:
+            session.add(RetentionRun(
+                table_name=DailyAvailability.__tablename__,
+                cutoff=cutoff,
+                batches=batches,
+                deleted_rows=deleted_rows,
+                oldest_date=oldest_date,
+                newest_date=newest_date,
+                started_at=started_at,
+                finished_at=func.now()
+            ))
+            await session.commit()
+
+        logger.info(f"Очистка завершена: удалено {deleted_rows} записей за {batches} порций")
+    except Exception as e:
+        logger.error(f"Ошибка при очистке устаревшей доступности: {e}")
+
+    return deleted_rows
+
+async def wait_until_retention_hour():
+    """Ждет до ближайшего RETENTION_HOUR по Москве"""
+    now = datetime.now(MOSCOW_TZ)
+    next_run = now.replace(hour=RETENTION_HOUR, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    wait_seconds = (next_run - now).total_seconds()
+
+    logger.info(f"Следующая очистка доступности в: {next_run.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+    await asyncio.sleep(wait_seconds)
+
+async def compact_history():
+    """Уплотнение истории цен; ошибки не останавливают цикл очистки"""
+    try:
+        async with AsyncScopedSession() as session:
+            await compact_price_history(session)
+    except Exception as e:
+        logger.error(f"Ошибка при уплотнении истории цен: {e}")
+
+async def run_retention_loop():
+    """Ежедневная очистка устаревшей доступности и истории цен (запускается рядом с воркером активности)"""
+    # Первый проход сразу при старте, чтобы не копить хвост после деплоя
+    await prune_expired_availability()
+    await compact_history()
+    while True:
+        await wait_until_retention_hour()
+        await prune_expired_availability()
+        await compact_history()
@@ -29,8 +29,8 @@ def run_migrations():
         command.current(alembic_cfg)
         
         # Выполняем миграцию
-        logger.info("Выполняем upgrade до ревизии a5b1c3d4e5f6...")
-        command.upgrade(alembic_cfg, "a5b1c3d4e5f6")
+        logger.info("Выполняем upgrade до последней ревизии...")
+        command.upgrade(alembic_cfg, "head")
         
         logger.info("Миграции успешно применены!")
         return True
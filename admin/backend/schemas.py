@@ -89,6 +89,10 @@ class DailyAvailabilityResponse(DailyAvailabilityBase):
     class Config:
         from_attributes = True
 
+class DailyAvailabilityPage(BaseModel):
+    items: List[DailyAvailabilityResponse] = []
+    next_cursor: Optional[str] = None
+
 # Схемы для резервирования
 class ReservationBase(BaseModel):
     goods_id: int
@@ -124,6 +128,43 @@ class GoodsResponse(GoodsBase):
     class Config:
         from_attributes = True
 
+# Плоская схема публичного каталога: товар, остаток и число забронированных сегодня единиц.
+# Списков бронирований здесь нет — размер ответа не растет вместе с числом бронирований.
+class CatalogItemResponse(BaseModel):
+    id: int
+    name: str
+    price: Optional[int] = None
+    cashback_percent: int = 0
+    article: str
+    url: str
+    image: Optional[str] = None
+    purchase_guide: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    category_id: Optional[int] = None
+    category_name: Optional[str] = None
+    available_quantity: int
+    reserved_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+# История цен: ступенчатый ряд точек изменения
+class PricePoint(BaseModel):
+    changed_at: datetime
+    price: int
+
+class PriceHistoryResponse(BaseModel):
+    goods_id: int
+    start: datetime
+    end: datetime
+    points: List[PricePoint] = []
+
+class PriceAtResponse(BaseModel):
+    goods_id: int
+    at: datetime
+    price: Optional[int] = None
+
 # Добавить в schemas.py
 class BulkVisibilityUpdate(BaseModel):
     goods_ids: List[int] = Field(..., description="Список ID товаров для обновления")
@@ -140,3 +181,52 @@ class BulkVisibilityUpdate(BaseModel):
                 "goods_ids": [1, 2, 3]
             }
         }
+
+class BulkAvailabilityRegenerate(BaseModel):
+    goods_ids: List[int] = Field(..., description="Список ID товаров для перегенерации доступности")
+
+    @validator('goods_ids')
+    def validate_goods_ids(cls, v):
+        if not v:
+            raise ValueError("Список товаров не может быть пустым")
+        return list(dict.fromkeys(int(id) for id in v))
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "goods_ids": [1, 2, 3]
+            }
+        }
+
+class BulkImportRequest(BaseModel):
+    items: List[str] = Field(..., description="Ссылки на товары WB или артикулы")
+    cashback_percent: int = 0
+    is_active: bool = True
+    is_hidden: bool = False
+    purchase_guide: Optional[str] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    min_daily: int = 1
+    max_daily: int = 10
+    category_id: Optional[int] = None
+    skip_existing: bool = True
+
+    @validator('items')
+    def validate_items(cls, v):
+        v = [item.strip() for item in v if item and item.strip()]
+        if not v:
+            raise ValueError("Список товаров не может быть пустым")
+        return v
+
+class BulkImportItemResult(BaseModel):
+    source: str
+    success: bool
+    goods_id: Optional[int] = None
+    article: Optional[str] = None
+    name: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkImportResponse(BaseModel):
+    created: int
+    failed: int
+    items: List[BulkImportItemResult]
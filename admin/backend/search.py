@@ -0,0 +1,89 @@
+"""
+Поиск товаров по названию и артикулу.
+
+ILIKE '%q%' по обычным B-tree индексам всегда превращается в последовательное сканирование.
+С расширением pg_trgm и GIN-индексами (init_db и миграция add_goods_trigram_search) тот же ILIKE
+обслуживается индексом, а similarity() дает ранжирование и терпимость к опечаткам.
+Числовой запрос, совпадающий с артикулом, обслуживается точным поиском по индексу ix_goods_article.
+"""
+
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import or_, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Goods
+
+logger = logging.getLogger('api')
+
+# Есть ли pg_trgm в базе; перепроверяется раз в TRGM_RECHECK_INTERVAL секунд,
+# чтобы расширение, установленное после старта, подхватывалось без перезапуска
+TRGM_RECHECK_INTERVAL = 300
+_trgm_available: Optional[bool] = None
+_trgm_checked_at = 0.0
+
+
+async def trgm_available(db: AsyncSession) -> bool:
+    global _trgm_available, _trgm_checked_at
+    if _trgm_available is None or time.monotonic() - _trgm_checked_at >= TRGM_RECHECK_INTERVAL:
+        previous = _trgm_available
+        try:
+            result = await db.execute(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))
+            _trgm_available = bool(result.scalar())
+        except Exception as e:
+            logger.warning(f"Не удалось проверить наличие pg_trgm: {e}")
+            await db.rollback()
+            _trgm_available = False
+        _trgm_checked_at = time.monotonic()
+        if _trgm_available != previous:
+            if _trgm_available:
+                logger.info("pg_trgm установлен, поиск товаров работает через триграммный индекс")
+            else:
+                logger.warning("pg_trgm не установлен, поиск товаров работает через ILIKE без индекса")
+    return _trgm_available
+
+
+def search_condition(q: str, use_trgm: bool):
+    pattern = f"%{q}%"
+    condition = or_(
+        Goods.name.ilike(pattern),
+        Goods.article.ilike(pattern)
+    )
+    if use_trgm:
+        # Похожие названия (опечатки) по порогу pg_trgm.similarity_threshold
+        condition = or_(condition, Goods.name.op('%')(q))
+    return condition
+
+
+def search_rank(q: str, use_trgm: bool) -> list:
+    """Выражения ORDER BY: сначала наиболее похожие товары"""
+    if not use_trgm:
+        return [Goods.id.desc()]
+    similarity = func.greatest(func.similarity(Goods.name, q), func.similarity(Goods.article, q))
+    return [similarity.desc(), Goods.id.desc()]
+
+
+async def resolve_search(db: AsyncSession, q: str) -> Tuple[object, list]:
+    """
+    Возвращает (условие WHERE, выражения ORDER BY) для поискового запроса.
+    Если запрос — число и есть товар с таким артикулом, возвращается точное условие по артикулу.
+    """
+    q = q.strip()
+    if q.isdigit():
+        exact = await db.execute(select(Goods.id).where(Goods.article == q).limit(1))
+        if exact.scalar() is not None:
+            return Goods.article == q, [Goods.id.desc()]
+
+    use_trgm = await trgm_available(db)
+    return search_condition(q, use_trgm), search_rank(q, use_trgm)
+
+
+async def search_goods(db: AsyncSession, q: str, limit: int = 50, options: tuple = ()) -> List[Goods]:
+    """Поиск товаров с ранжированием по похожести"""
+    condition, order = await resolve_search(db, q)
+    query = select(Goods).options(*options).where(condition).order_by(*order).limit(limit)
+    result = await db.execute(query)
+    return result.scalars().all()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Тест поиска basket-хоста на локальном поддельном basket-сервере с задержками.
+Хосты basket-XX.test резолвятся в 127.0.0.1, хосты выше DNS_LIMIT дают DNS-ошибку, как на WB.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python test_basket_probe.py
+"""
+
+import asyncio
+import logging
+import socket
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+import parser
+from basket_index import BasketIndex
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("parser").setLevel(logging.ERROR)
+logging.getLogger("aiohttp.access").setLevel(logging.ERROR)
+logger = logging.getLogger("test_basket_probe")
+
+DNS_LIMIT = 45
+NOT_FOUND_LATENCY = 0.05
+# Эти хосты зависают дольше таймаута проверки
+HANGING_HOSTS = {"21", "22", "24", "25", "27"}
+
+
+class FakeResolver(AbstractResolver):
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        number = int(host.split(".")[0].split("-")[1])
+        if number > DNS_LIMIT:
+            raise OSError(-3, "Temporary failure in name resolution")
+        return [{
+            "hostname": host, "host": "127.0.0.1", "port": port,
+            "family": socket.AF_INET, "proto": 0, "flags": socket.AI_NUMERICHOST
+        }]
+
+    async def close(self):
+        pass
+
+
+class FakeBasket:
+    def __init__(self, working_host):
+        self.working_host = working_host
+        self.probed = []
+
+    async def image(self, request):
+        host = request.host.split(".")[0].split("-")[1]
+        self.probed.append(host)
+        if host in HANGING_HOSTS:
+            await asyncio.sleep(2)
+        await asyncio.sleep(NOT_FOUND_LATENCY)
+        status = 200 if host == self.working_host else 404
+        return web.Response(status=status, headers={"Content-Length": "0"})
+
+
+async def probe(working_host, vol, index=None):
+    # Каждый сценарий начинает с пустого индекса, если не передан свой
+    parser.basket_index = index if index is not None else BasketIndex()
+    basket = FakeBasket(working_host)
+    app = web.Application()
+    app.router.add_route("HEAD", "/{tail:.*}", basket.image)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    parser.BASKET_URL = f"http://basket-{{host}}.test:{port}"
+
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=FakeResolver()))
+    try:
+        started = time.perf_counter()
+        host = await parser.find_working_basket_host(vol, vol * 100, vol * 100000, session)
+        elapsed = time.perf_counter() - started
+        # После ответа не должно остаться незавершенных проверок
+        leftovers = [task for task in asyncio.all_tasks() if "is_image_exists" in repr(task.get_coro())]
+        assert not leftovers, f"Остались незавершенные проверки: {leftovers}"
+    finally:
+        await session.close()
+        await runner.cleanup()
+    return host, elapsed, basket.probed
+
+
+async def test_finds_estimated_host_first():
+    # vol 4000 -> оценка basket-23
+    host, elapsed, probed = await probe("23", 4000)
+    assert host == "23", host
+    assert probed[0] == "23", probed
+    assert elapsed < 0.5, f"{elapsed:.2f} с"
+    logger.info(f"Оценка угадана: basket-{host} за {elapsed:.2f} с, проверено {len(probed)}")
+
+
+async def test_far_host_with_hanging_probes():
+    # Оценка basket-23, картинка на basket-40, часть соседних хостов зависает.
+    # Последовательный перебор с таймаутом 1 с занял бы больше 5 секунд.
+    host, elapsed, probed = await probe("40", 4000)
+    assert host == "40", host
+    assert elapsed < 2.5, f"{elapsed:.2f} с"
+    logger.info(f"Дальний хост: basket-{host} за {elapsed:.2f} с, проверено {len(probed)}")
+
+
+async def test_dns_failure_stops_higher_hosts():
+    # Картинки нет нигде: хосты выше DNS_LIMIT не должны запрашиваться после DNS-ошибки
+    host, elapsed, probed = await probe("99", 9000)
+    assert host is None
+    assert all(int(h) <= DNS_LIMIT for h in probed), probed
+    assert len(set(probed)) == DNS_LIMIT - parser.BASKET_FIRST + 1, sorted(set(probed))
+    logger.info(f"Без картинки: перебор завершен за {elapsed:.2f} с, проверено {len(probed)} хостов")
+
+
+async def test_index_skips_known_range():
+    index = BasketIndex()
+    await probe("23", 4000, index)
+    await probe("23", 4100, index)
+    host, elapsed, probed = await probe("23", 4050, index)
+    assert host == "23" and not probed, probed
+    # Внутренняя точка интервала не хранится
+    await index.record(4060, "23")
+    assert len(index) == 2, len(index)
+
+    # Соседний интервал сужает перебор: первая волна только из basket-23...26
+    await index.record(4700, "26")
+    host, elapsed, probed = await probe("26", 4400, index)
+    assert host == "26", host
+    assert set(probed[:parser.BASKET_PROBE_WAVE]) <= {"23", "24", "25", "26"}, probed
+    logger.info(f"Индекс: повтор в известном интервале без проверок, {len(index)} точки")
+
+
+if __name__ == "__main__":
+    print("Запуск теста поиска basket-хоста...")
+    asyncio.run(test_finds_estimated_host_first())
+    asyncio.run(test_far_host_with_hanging_probes())
+    asyncio.run(test_dns_failure_stops_higher_hosts())
+    asyncio.run(test_index_skips_known_range())
+    print("Тест завершен.")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Тест сборки каталога: GET /catalog/ должен укладываться в один SQL-запрос
+независимо от количества товаров, а размер ответа не должен расти вместе с бронированиями.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python test_catalog.py
+"""
+
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from catalog import fetch_catalog
+from catalog_cache import serialize_catalog
+from models import Goods, DailyAvailability, Category, Reservation
+from test_support import create_test_engine, rollback_session, StatementCounter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logger = logging.getLogger("test_catalog")
+
+
+async def seed_goods(db, count, today, **overrides):
+    """Создает товары с остатком на сегодня"""
+    category = Category(name=f"test-category-{datetime.now().timestamp()}")
+    db.add(category)
+    await db.flush()
+
+    goods_list = []
+    for i in range(count):
+        fields = dict(
+            name=f"Тестовый товар {i}",
+            price=1000 + i,
+            cashback_percent=10,
+            article=str(100000 + i),
+            url=f"https://www.wildberries.ru/catalog/{100000 + i}/detail.aspx",
+            image="",
+            is_active=True,
+            is_hidden=False,
+            start_date=today - timedelta(days=1),
+            end_date=today + timedelta(days=7),
+            category_id=category.id,
+        )
+        fields.update(overrides)
+        goods = Goods(**fields)
+        db.add(goods)
+        goods_list.append(goods)
+    await db.flush()
+
+    for goods in goods_list:
+        db.add(DailyAvailability(goods_id=goods.id, date=today, available_quantity=5))
+    await db.flush()
+    return goods_list
+
+
+async def test_catalog_single_statement():
+    engine = create_test_engine()
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async with rollback_session(engine) as db:
+        visible = await seed_goods(db, 50, today)
+        await seed_goods(db, 5, today, is_hidden=True)
+        await seed_goods(db, 5, today, is_active=False)
+        sold_out = await seed_goods(db, 5, today)
+        for goods in sold_out:
+            await db.execute(
+                DailyAvailability.__table__.update()
+                .where(DailyAvailability.goods_id == goods.id)
+                .values(available_quantity=0)
+            )
+
+        with StatementCounter(engine) as counter:
+            items = await fetch_catalog(db, now)
+
+        ids = {item.id for item in items}
+        assert {g.id for g in visible} <= ids, "В каталоге не хватает видимых товаров"
+        assert not ids & {g.id for g in sold_out}, "В каталог попали товары без остатка"
+        assert all(item.available_quantity > 0 for item in items)
+        assert all(item.category_name for item in items if item.id in {g.id for g in visible})
+        assert counter.count == 1, f"Ожидался 1 запрос, выполнено {counter.count}"
+        logger.info(f"Каталог из {len(items)} товаров собран за {counter.count} запрос")
+
+    await engine.dispose()
+
+
+async def test_catalog_payload_flat_as_reservations_grow():
+    engine = create_test_engine()
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async with rollback_session(engine) as db:
+        goods_list = await seed_goods(db, 20, today)
+        for goods in goods_list:
+            await db.execute(
+                DailyAvailability.__table__.update()
+                .where(DailyAvailability.goods_id == goods.id)
+                .values(available_quantity=100000)
+            )
+        # Ответ эндпоинта — это именно serialize_catalog(fetch_catalog(...))
+        baseline = len(serialize_catalog(await fetch_catalog(db, now)))
+
+        sizes = []
+        user_id = 20_000_000
+        for _ in range(3):
+            for goods in goods_list:
+                for _ in range(100):
+                    user_id += 1
+                    db.add(Reservation(goods_id=goods.id, user_id=user_id, quantity=1, reserved_at=now))
+            await db.flush()
+            with StatementCounter(engine) as counter:
+                items = await fetch_catalog(db, now)
+            assert counter.count == 1
+            sizes.append(len(serialize_catalog(items)))
+
+        assert all(item.reserved_count == 300 for item in items if item.id in {g.id for g in goods_list})
+        # Растет только запись числа reserved_count: не больше нескольких байт на товар
+        growth = sizes[-1] - baseline
+        assert growth <= 4 * len(goods_list), f"Ответ вырос на {growth} байт: {baseline} -> {sizes}"
+        logger.info(f"Размер каталога: {baseline} байт без бронирований, {sizes} после 100/200/300 на товар")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    print("Запуск теста каталога...")
+    asyncio.run(test_catalog_single_statement())
+    asyncio.run(test_catalog_payload_flat_as_reservations_grow())
+    print("Тест завершен.")
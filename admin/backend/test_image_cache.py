@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Тесты кэша проверки картинок (image_cache.py) на fakeredis и локальном HTTP-сервере.
+Проверяют, что таймаут и 5xx не записываются в кэш как нерабочая картинка и не затирают
+прежние записи при массовой перепроверке, а определенный ответ 404 кэшируется.
+Нужен fakeredis из requirements-test.txt (в образ не ставится):
+docker exec -it wildberries-agregator-backend-1 sh -c "pip install -r requirements-test.txt && python test_image_cache.py"
+"""
+
+import asyncio
+import logging
+import sys
+
+import aiohttp
+import fakeredis
+from aiohttp import web
+
+import image_cache
+from image_cache import ImageValidationCache, image_cache_key
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("image_cache").setLevel(logging.ERROR)
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+logger = logging.getLogger("test_image_cache")
+
+# Сервер отвечает на /slow дольше таймаута проверки
+image_cache.IMAGE_CHECK_TIMEOUT = 0.2
+
+
+class ImageServer:
+    """Хост картинок: /ok — 200, /missing — 404, /error — 503, /slow — таймаут; down=True — 503 на все"""
+
+    def __init__(self):
+        self.down = False
+        self.requests = 0
+        self.runner = None
+        self.base_url = None
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.down:
+            return web.Response(status=503)
+        name = request.match_info["name"]
+        if name == "slow":
+            await asyncio.sleep(image_cache.IMAGE_CHECK_TIMEOUT * 5)
+        if name in ("ok", "slow"):
+            return web.Response(status=200)
+        if name == "error":
+            return web.Response(status=503)
+        return web.Response(status=404)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("HEAD", "/{name}.jpg", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    def url(self, name):
+        return f"{self.base_url}/{name}.jpg"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def run_case(case):
+    server = ImageServer()
+    await server.start()
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    cache = ImageValidationCache()
+    cache.attach(redis_client)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await case(server, redis_client, cache, session)
+    finally:
+        await redis_client.aclose()
+        await server.stop()
+
+
+async def timeout_is_not_cached(server, redis_client, cache, session):
+    url = server.url("slow")
+    assert await image_cache.check_image_url(url, session) is None
+    # Для этой отправки картинка не используется, но в кэш ничего не пишется
+    assert await cache.is_valid(url, session) is False
+    assert await redis_client.get(image_cache_key(url)) is None
+    assert cache._lru_get(url) is None
+
+    requests = server.requests
+    await cache.is_valid(url, session)
+    assert server.requests == requests + 1, "Следующая отправка не перепроверила ссылку после таймаута"
+    logger.info("Таймаут не записан в кэш, следующая отправка проверяет ссылку заново")
+
+
+async def server_error_is_not_cached(server, redis_client, cache, session):
+    url = server.url("error")
+    assert await cache.is_valid(url, session) is False
+    assert await redis_client.get(image_cache_key(url)) is None
+
+    missing = server.url("missing")
+    assert await cache.is_valid(missing, session) is False
+    assert await redis_client.get(image_cache_key(missing)) == "0", "404 должен кэшироваться как нерабочая ссылка"
+    logger.info("503 не кэшируется, 404 кэшируется как нерабочая ссылка")
+
+
+async def bulk_pass_during_outage(server, redis_client, cache, session):
+    urls = [server.url("ok"), server.url("missing")]
+    await cache.validate_many(urls, session)
+    assert await redis_client.get(image_cache_key(urls[0])) == "1"
+    ttl_before = await redis_client.ttl(image_cache_key(urls[0]))
+
+    # Хост картинок лежит во время массовой перепроверки: прежние записи не трогаются
+    server.down = True
+    results = await cache.validate_many(urls, session)
+    assert results == {urls[0]: None, urls[1]: None}
+    assert await redis_client.get(image_cache_key(urls[0])) == "1", "Сбой затер рабочую картинку"
+    assert await redis_client.get(image_cache_key(urls[1])) == "0"
+    assert await redis_client.ttl(image_cache_key(urls[0])) <= ttl_before
+
+    # Отправка во время сбоя берет рабочую картинку из кэша, не обращаясь к хосту
+    fresh = ImageValidationCache()
+    fresh.attach(redis_client)
+    requests = server.requests
+    assert await fresh.is_valid(urls[0], session) is True
+    assert server.requests == requests
+    logger.info("Перепроверка во время сбоя не затерла рабочие записи кэша")
+
+
+async def main():
+    for case in (timeout_is_not_cached, server_error_is_not_cached, bulk_pass_during_outage):
+        await run_case(case)
+
+
+if __name__ == "__main__":
+    print("Запуск тестов кэша проверки картинок...")
+    asyncio.run(main())
+    print("Тест завершен.")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Тесты горячих счетчиков остатков (inventory.py) на fakeredis и настоящей базе.
+Проверяют, что одновременные бронирования не продают лишнего, отмена с writeback возвращает остаток,
+перенос и перезагрузка счетчиков согласованы, а аварийный ключ переводит бронирования в SQL без потерь.
+Тест создает свои записи в базе и удаляет их в конце.
+Нужен fakeredis из requirements-test.txt (в образ не ставится):
+docker exec -it wildberries-agregator-backend-1 sh -c "pip install -r requirements-test.txt && python test_inventory.py"
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import fakeredis
+
+import inventory
+from database import async_session_factory, engine as app_engine
+from reservations import ReservationError
+from test_reservations import create_goods_with_stock, cleanup, load_state
+from test_support import create_test_engine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("api").setLevel(logging.WARNING)
+logger = logging.getLogger("test_inventory")
+
+STOCK = int(os.getenv("TEST_STOCK", "50"))
+BUYERS = int(os.getenv("TEST_BUYERS", "300"))
+
+# Тесты проверяют горячий режим независимо от окружения контейнера
+inventory.HOT_INVENTORY_ENABLED = True
+
+
+def counter_key(today):
+    return f"inventory:{today.date().isoformat()}:stock"
+
+
+async def attempt(redis_client, goods_id, user_id, now):
+    async with async_session_factory() as db:
+        try:
+            await inventory.reserve(redis_client, db, goods_id, user_id, 1, now)
+            return True
+        except ReservationError:
+            return False
+
+
+async def run_case(case):
+    """Создает товар с остатком STOCK и чистый Redis, после теста удаляет товар"""
+    engine = create_test_engine()
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True, max_connections=BUYERS * 2)
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    goods_id = await create_goods_with_stock(engine, STOCK, today)
+    try:
+        await case(engine, redis_client, goods_id, now, today)
+    finally:
+        await cleanup(engine, goods_id)
+        await redis_client.aclose()
+        await engine.dispose()
+
+
+async def concurrent_claims(engine, redis_client, goods_id, now, today):
+    results = await asyncio.gather(*[
+        attempt(redis_client, goods_id, 10_000_000 + i, now) for i in range(BUYERS)
+    ])
+    successes = sum(results)
+    assert successes == STOCK, f"Успешных бронирований {successes}, ожидалось {STOCK}"
+    assert int(await redis_client.hget(counter_key(today), goods_id)) == 0
+
+    await inventory.flush_pending(redis_client)
+    remaining, reserved = await load_state(engine, goods_id, today)
+    assert reserved == STOCK, f"В базе {reserved} бронирований, ожидалось {STOCK}"
+    assert remaining == 0, f"Остаток после переноса {remaining}, ожидался 0"
+    logger.info(f"{BUYERS} покупателей, остаток {STOCK}: продано {successes}, лишнего не продано")
+
+
+async def release_with_writeback(engine, redis_client, goods_id, now, today):
+    assert await attempt(redis_client, goods_id, 1, now)
+    # Бронирование не записалось в Postgres: списание отменяется и в счетчике, и в pending
+    await inventory.release_stock(redis_client, goods_id, 1, 1, today, writeback=True)
+    assert int(await redis_client.hget(counter_key(today), goods_id)) == STOCK
+    assert not await redis_client.hgetall(inventory.PENDING_KEY), "writeback оставил списание в pending"
+
+    assert await attempt(redis_client, goods_id, 2, now)
+    await inventory.flush_pending(redis_client)
+    remaining, _ = await load_state(engine, goods_id, today)
+    assert remaining == STOCK - 1, f"Остаток {remaining}, ожидался {STOCK - 1}"
+    logger.info("Отмена с writeback вернула остаток, в Postgres перенесено только живое списание")
+
+
+async def flush_then_reload(engine, redis_client, goods_id, now, today):
+    for user_id in range(5):
+        assert await attempt(redis_client, goods_id, user_id, now)
+    await inventory.flush_pending(redis_client)
+    for user_id in range(5, 8):
+        assert await attempt(redis_client, goods_id, user_id, now)
+
+    # Перезагрузка вычитает из Postgres только еще не перенесенные списания
+    await inventory.load_counters(redis_client, now, force=True)
+    assert int(await redis_client.hget(counter_key(today), goods_id)) == STOCK - 8
+
+    # Повтор уже примененного переноса (сбой до удаления inflight) ничего не списывает дважды
+    flush_id = uuid.uuid4().hex
+    await redis_client.rename(inventory.PENDING_KEY, inventory.INFLIGHT_KEY)
+    await redis_client.set(inventory.INFLIGHT_ID_KEY, flush_id)
+    assert await inventory.flush_pending(redis_client) == 1
+    await redis_client.hset(inventory.INFLIGHT_KEY, f"{today.date().isoformat()}:{goods_id}", 3)
+    await redis_client.set(inventory.INFLIGHT_ID_KEY, flush_id)
+    await inventory.load_counters(redis_client, now, force=True)
+    assert int(await redis_client.hget(counter_key(today), goods_id)) == STOCK - 8
+    assert await inventory.flush_pending(redis_client) == 0
+
+    remaining, reserved = await load_state(engine, goods_id, today)
+    assert (remaining, reserved) == (STOCK - 8, 8), f"Остаток {remaining}, бронирований {reserved}"
+    logger.info("Перенос и перезагрузка счетчиков согласованы, повтор переноса не списал дважды")
+
+
+async def kill_switch_transition(engine, redis_client, goods_id, now, today):
+    for user_id in range(3):
+        assert await attempt(redis_client, goods_id, user_id, now)
+
+    # Пока списания не перенесены, бронирование отклоняется, а не уходит в SQL
+    await redis_client.set(inventory.KILL_SWITCH_KEY, "1")
+    assert not await attempt(redis_client, goods_id, 100, now)
+
+    await inventory.set_kill_switch(redis_client, True)
+    assert await inventory.hot_inventory_mode(redis_client) == "sql"
+    assert await attempt(redis_client, goods_id, 101, now)
+    remaining, _ = await load_state(engine, goods_id, today)
+    assert remaining == STOCK - 4, f"Остаток {remaining}, ожидался {STOCK - 4}"
+
+    # После включения счетчики загружаются заново с учетом бронирования через SQL
+    await inventory.set_kill_switch(redis_client, False)
+    assert await attempt(redis_client, goods_id, 102, now)
+    assert int(await redis_client.hget(counter_key(today), goods_id)) == STOCK - 5
+    logger.info("Переключение аварийным ключом не потеряло и не задвоило списания")
+
+
+async def main():
+    # inventory.py работает через движок приложения, поэтому все тесты идут в одном цикле событий
+    try:
+        for case in (concurrent_claims, release_with_writeback, flush_then_reload, kill_switch_transition):
+            await run_case(case)
+    finally:
+        await app_engine.dispose()
+
+
+if __name__ == "__main__":
+    print("Запуск тестов горячих остатков...")
+    asyncio.run(main())
+    print("Тест завершен.")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Нагрузочный тест бронирования: сотни одновременных бронирований одного товара
+не должны продать больше, чем есть в наличии.
+Тест создает свои записи в базе (нужны настоящие параллельные соединения) и удаляет их в конце.
+Запускать в контейнере: docker exec -it wildberries-agregator-backend-1 python test_reservations.py
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import Base
+from models import Goods, DailyAvailability, Reservation
+from reservations import reserve_stock, ReservationError
+from test_support import create_test_engine
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    stream=sys.stdout,
+    force=True
+)
+logging.getLogger("api").setLevel(logging.WARNING)
+logger = logging.getLogger("test_reservations")
+
+STOCK = int(os.getenv("TEST_STOCK", "50"))
+BUYERS = int(os.getenv("TEST_BUYERS", "500"))
+POOL_SIZE = int(os.getenv("TEST_POOL_SIZE", "20"))
+
+
+async def create_goods_with_stock(engine, stock, today):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        goods = Goods(
+            name="Нагрузочный тест",
+            price=1000,
+            article="0",
+            url="",
+            image="",
+            start_date=today - timedelta(days=1),
+            end_date=today + timedelta(days=1),
+        )
+        db.add(goods)
+        await db.flush()
+        db.add(DailyAvailability(goods_id=goods.id, date=today, available_quantity=stock))
+        await db.commit()
+        return goods.id
+
+
+async def cleanup(engine, goods_id):
+    async with AsyncSession(engine) as db:
+        await db.execute(delete(Reservation).where(Reservation.goods_id == goods_id))
+        await db.execute(delete(DailyAvailability).where(DailyAvailability.goods_id == goods_id))
+        await db.execute(delete(Goods).where(Goods.id == goods_id))
+        await db.commit()
+
+
+async def attempt(engine, goods_id, user_id, now):
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        try:
+            await reserve_stock(db, goods_id, user_id, 1, now)
+            return True
+        except ReservationError:
+            return False
+
+
+async def load_state(engine, goods_id, today):
+    async with AsyncSession(engine) as db:
+        remaining = (await db.execute(
+            select(DailyAvailability.available_quantity).where(
+                DailyAvailability.goods_id == goods_id,
+                DailyAvailability.date == today
+            )
+        )).scalar()
+        reserved = (await db.execute(
+            select(func.count(Reservation.id)).where(Reservation.goods_id == goods_id)
+        )).scalar()
+        return remaining, reserved
+
+
+async def test_no_overselling():
+    engine = create_test_engine(pool_size=POOL_SIZE, max_overflow=0)
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    goods_id = await create_goods_with_stock(engine, STOCK, today)
+
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[
+            attempt(engine, goods_id, 10_000_000 + i, now) for i in range(BUYERS)
+        ])
+        elapsed = time.perf_counter() - started
+
+        remaining, reserved = await load_state(engine, goods_id, today)
+        successes = sum(results)
+        assert successes == STOCK, f"Успешных бронирований {successes}, ожидалось {STOCK}"
+        assert reserved == STOCK, f"В базе {reserved} бронирований, ожидалось {STOCK}"
+        assert remaining == 0, f"Остаток {remaining}, ожидался 0"
+        logger.info(
+            f"{BUYERS} покупателей, остаток {STOCK}: продано {successes}, остаток {remaining}. "
+            f"{elapsed:.2f} с, {BUYERS / elapsed:.0f} попыток/с"
+        )
+    finally:
+        await cleanup(engine, goods_id)
+        await engine.dispose()
+
+
+async def test_duplicate_reservation_same_user():
+    engine = create_test_engine(pool_size=POOL_SIZE, max_overflow=0)
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    goods_id = await create_goods_with_stock(engine, STOCK, today)
+
+    try:
+        results = await asyncio.gather(*[attempt(engine, goods_id, 42, now) for _ in range(50)])
+        remaining, reserved = await load_state(engine, goods_id, today)
+        assert sum(results) == 1, f"Пользователь забронировал {sum(results)} раз"
+        assert reserved == 1
+        assert remaining == STOCK - 1, "Отклоненные повторы не вернули остаток"
+        logger.info("Повторное бронирование тем же пользователем отклонено, остаток возвращен")
+    finally:
+        await cleanup(engine, goods_id)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    print("Запуск нагрузочного теста бронирования...")
+    asyncio.run(test_no_overselling())
+    asyncio.run(test_duplicate_reservation_same_user())
+    print("Тест завершен.")
@@ -0,0 +1,71 @@
+"""
+Общие помощники для тестовых скриптов бэкенда.
+Тесты работают с базой из TEST_DATABASE_URL (по умолчанию DATABASE_URL)
+и откатывают все изменения по завершении, поэтому их можно запускать в контейнере.
+"""
+
+import os
+from contextlib import asynccontextmanager
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+from database import Base, DATABASE_URL
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", DATABASE_URL)
+
+
+def create_test_engine(**kwargs):
+    """Создает отдельный движок для тестов"""
+    return create_async_engine(TEST_DATABASE_URL, echo=False, **kwargs)
+
+
+@asynccontextmanager
+async def rollback_session(engine=None):
+    """
+    Сессия внутри внешней транзакции, которая откатывается при выходе.
+    commit() внутри тестируемого кода превращается в сохранение savepoint.
+    """
+    own_engine = engine is None
+    if own_engine:
+        engine = create_test_engine()
+    try:
+        async with engine.connect() as conn:
+            trans = await conn.begin()
+            await conn.run_sync(Base.metadata.create_all)
+            session = AsyncSession(
+                bind=conn,
+                expire_on_commit=False,
+                join_transaction_mode="create_savepoint",
+            )
+            try:
+                yield session
+            finally:
+                await session.close()
+                await trans.rollback()
+    finally:
+        if own_engine:
+            await engine.dispose()
+
+
+class StatementCounter:
+    """Считает SQL-запросы, выполненные через движок"""
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
@@ -1,10 +1,17 @@
 import asyncio
 import logging
-from datetime import datetime, timezone, timedelta
+import os
+from datetime import datetime
+from typing import List, Optional
 from zoneinfo import ZoneInfo
-from sqlalchemy import select, update
+import redis.asyncio as aioredis
+from sqlalchemy import update, and_, or_
 from database import AsyncScopedSession, init_db, close_db
 from models import Goods
+from activation_scheduler import ActivationScheduler
+from retention import run_retention_loop
+from price_refresh import run_price_refresh_loop
+from image_revalidation import run_image_revalidation_loop
 
 # Настраиваем логирование
 logging.basicConfig(
@@ -16,59 +23,52 @@ logger = logging.getLogger('goods_activity_worker')
 # Константа для московского часового пояса
 MOSCOW_TZ = ZoneInfo('Europe/Moscow')
 
-async def update_goods_activity():
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Период обновления активности в минутах; 0 — планировщик по границам дат
+ACTIVITY_UPDATE_INTERVAL = int(os.getenv("ACTIVITY_UPDATE_INTERVAL", "0"))
+
+async def update_goods_activity(goods_ids: Optional[List[int]] = None):
     """
     Обновляет статус активности товаров на основе дат начала и окончания
+    одним UPDATE по всей таблице (или только по goods_ids): меняются только строки,
+    чей статус отличается от нужного. Возвращает id измененных товаров.
     """
     try:
-        logger.info("Обновление статуса активности товаров...")
+        if goods_ids is None:
+            logger.info("Обновление статуса активности товаров...")
         async with AsyncScopedSession() as session:
             # Получаем текущее время в Москве
             current_time = datetime.now(MOSCOW_TZ)
             
-            # Получаем все товары
-            query = select(Goods)
-            result = await session.execute(query)
-            goods_list = result.scalars().all()
-            
-            updated_count = 0
+            # Товар активен, если даты не заданы или текущее время внутри периода
+            should_be_active = and_(
+                or_(Goods.start_date.is_(None), Goods.start_date <= current_time),
+                or_(Goods.end_date.is_(None), Goods.end_date >= current_time)
+            )
+            query = update(Goods).where(Goods.is_active.is_distinct_from(should_be_active))
+            if goods_ids is not None:
+                query = query.where(Goods.id.in_(goods_ids))
+            result = await session.execute(
+                query
+                .values(is_active=should_be_active)
+                .returning(Goods.id, Goods.is_active)
+                .execution_options(synchronize_session=False)
+            )
+            changed = result.all()
+            await session.commit()
             
-            for goods in goods_list:
-                # Определяем, должен ли товар быть активным
-                should_be_active = True
-                
-                # Проверяем start_date если она задана
-                if goods.start_date and goods.start_date > current_time:
-                    should_be_active = False
-                
-                # Проверяем end_date если она задана
-                if goods.end_date and goods.end_date < current_time:
-                    should_be_active = False
-                
-                # Обновляем статус, если он отличается от текущего
-                if goods.is_active != should_be_active:
-                    goods.is_active = should_be_active
-                    updated_count += 1
-            
-            # Сохраняем изменения, если были обновления
-            if updated_count > 0:
-                await session.commit()
-                logger.info(f"Обновлено {updated_count} товаров")
-            else:
+            if changed:
+                activated = [row.id for row in changed if row.is_active]
+                deactivated = [row.id for row in changed if not row.is_active]
+                logger.info(f"Обновлено {len(changed)} товаров: активированы {activated}, деактивированы {deactivated}")
+            elif goods_ids is None:
                 logger.info("Нет товаров для обновления")
+            return [row.id for row in changed]
     
     except Exception as e:
         logger.error(f"Ошибка при обновлении статуса товаров: {e}")
-
-async def wait_until_midnight():
-    """Ждет до следующей полночи по Москве"""
-    now = datetime.now(MOSCOW_TZ)
-    tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-    wait_seconds = (tomorrow - now).total_seconds()
-    
-    logger.info(f"Ожидание до полуночи по МСК: {wait_seconds} секунд")
-    logger.info(f"Следующее обновление в: {tomorrow.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    await asyncio.sleep(wait_seconds)
+        return []
 
 async def run_worker():
     """
@@ -77,22 +77,36 @@ async def run_worker():
     await init_db()
     logger.info("Воркер активности товаров запущен (работает по московскому времени)")
     
+    # Очистка устаревшей доступности работает рядом, по своему расписанию
+    retention_task = asyncio.create_task(run_retention_loop())
+    # Обновление цен с WB — тоже своим циклом
+    price_refresh_task = asyncio.create_task(run_price_refresh_loop())
+    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    # Перепроверка картинок прогревает кэш, которым пользуется notification_worker
+    image_revalidation_task = asyncio.create_task(run_image_revalidation_loop(redis_client))
+    
+    scheduler = None
     try:
-        while True:
-            # Ждем до полуночи по МСК
-            await wait_until_midnight()
-            
-            # Выполняем обновление
-            await update_goods_activity()
-            
-            # Логируем следующее время запуска
-            next_run = datetime.now(MOSCOW_TZ) + timedelta(days=1)
-            next_run = next_run.replace(hour=0, minute=0, second=0, microsecond=0)
-            logger.info(f"Следующее обновление запланировано на: {next_run.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-            
+        if ACTIVITY_UPDATE_INTERVAL > 0:
+            # Обновление дешевое, поэтому можно запускать его каждые несколько минут
+            logger.info(f"Обновление активности каждые {ACTIVITY_UPDATE_INTERVAL} мин")
+            while True:
+                await update_goods_activity()
+                await asyncio.sleep(ACTIVITY_UPDATE_INTERVAL * 60)
+
+        # Просыпаемся к ближайшей дате начала/окончания, правки из API приходят через Redis
+        scheduler = ActivationScheduler(update_goods_activity, redis_client)
+        await scheduler.run()
+
     except asyncio.CancelledError:
         logger.info("Воркер активности товаров остановлен")
     finally:
+        retention_task.cancel()
+        price_refresh_task.cancel()
+        image_revalidation_task.cancel()
+        if scheduler is not None:
+            await scheduler.close()
+        await redis_client.aclose()
         await close_db()
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ import pytz
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.enums import ParseMode
-from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -23,6 +23,9 @@ from fastapi import FastAPI, Request, HTTPException
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import redis.asyncio as aioredis
+
+from rate_limiter import TelegramRateLimiter, PRIORITY_TRANSACTIONAL, PRIORITY_MARKETING, RATE_LIMIT_REDIS_URL
 
 
 # Путь к CSV файлу с пользователями
@@ -34,6 +37,8 @@ SUPER_ADMIN_IDS = os.getenv("SUPER_ADMIN_IDS", "").split(',')
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "")
 TELEGRAM_WEBAPP_URL = os.getenv("TELEGRAM_WEBAPP_URL", "") + "?startapp=1"  # Добавляем параметр для инициализации
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# Пакетная отправка уведомлений: максимум сообщений в одном запросе
+NOTIFICATION_BATCH_MAX = int(os.getenv("NOTIFICATION_BATCH_MAX", "100"))
 
 
 # Настройка логирования
@@ -60,6 +65,11 @@ storage = MemoryStorage()
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 dp = Dispatcher(storage=storage)
 
+# Общий ограничитель скорости для уведомлений о бронированиях и рассылок
+rate_limiter = TelegramRateLimiter(
+    redis_client=aioredis.from_url(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else None
+)
+
 # Определяем московский часовой пояс
 MOSCOW_TZ = pytz.timezone('Europe/Moscow')
 
@@ -580,6 +590,9 @@ async def send_broadcast(broadcast_id: int):
             
             # Пропускаем неактивных пользователей (можно добавить логику)
             
+            # Рассылка ждет своей очереди после уведомлений о бронированиях
+            await rate_limiter.acquire(user_id, PRIORITY_MARKETING)
+            
             # Отправляем сообщение
             if broadcast["photo_file_id"]:
                 await bot.send_photo(
@@ -597,8 +610,10 @@ async def send_broadcast(broadcast_id: int):
             
             successful_sends += 1
             
-            # Небольшая задержка между отправками, чтобы избежать ограничений Telegram
-            await asyncio.sleep(0.05)
+        except TelegramRetryAfter as e:
+            failed_sends += 1
+            await rate_limiter.penalize(user_id, e.retry_after)
+            logger.warning(f"Flood wait при рассылке пользователю {user_id}: {e}")
             
         except TelegramForbiddenError:
             # Пользователь заблокировал бота
@@ -821,10 +836,8 @@ async def back_to_admin_handler(callback: types.CallbackQuery):
         reply_markup=types.InlineKeyboardMarkup(inline_keyboard=keyboard)
     )
 
-# Обработчик запросов от бэкенда о бронировании товаров
-@app.post("/send_notification")
-async def send_reservation_notification(request: Request):
-    data = await request.json()
+async def deliver_reservation_notification(data: dict) -> dict:
+    """Отправляет одно уведомление о бронировании и возвращает статус доставки"""
     user_id = data.get("user_id")
     goods_data = data.get("goods_data", {})
     quantity = data.get("quantity", 1)
@@ -865,6 +878,7 @@ async def send_reservation_notification(request: Request):
     try:
         logger.info(f"Отправка уведомления о бронировании пользователю {user_id}")
         
+        await rate_limiter.acquire(user_id, PRIORITY_TRANSACTIONAL)
         # Сначала отправляем изображение товара, если оно есть
         if goods_image:
             await bot.send_photo(
@@ -887,6 +901,12 @@ async def send_reservation_notification(request: Request):
         error_msg = f"Пользователь {user_id} заблокировал бота"
         logger.warning(error_msg)
         return {"status": "error", "message": error_msg}
+    except TelegramRetryAfter as e:
+        # Flood control: воркер отложит сообщение не меньше чем на retry_after
+        error_msg = f"Flood wait при отправке пользователю {user_id}: {str(e)}"
+        logger.warning(error_msg)
+        await rate_limiter.penalize(user_id, e.retry_after)
+        return {"status": "error", "message": error_msg, "retry_after": e.retry_after}
     except TelegramBadRequest as e:
         # Неверный запрос к API Telegram
         error_msg = f"Ошибка при отправке сообщения пользователю {user_id}: {str(e)}"
@@ -903,6 +923,49 @@ async def send_reservation_notification(request: Request):
         logger.error(error_msg)
         return {"status": "error", "message": error_msg}
 
+# Обработчик запросов от бэкенда о бронировании товаров
+@app.post("/send_notification")
+async def send_reservation_notification(request: Request):
+    data = await request.json()
+    return await deliver_reservation_notification(data)
+
+@app.post("/send_notifications")
+async def send_reservation_notifications(request: Request):
+    """
+    Пакетная отправка уведомлений: принимает массив в формате /send_notification
+    и возвращает статус доставки по каждому элементу в том же порядке.
+    Разные пользователи обслуживаются параллельно, сообщения одного пользователя — по порядку.
+    """
+    items = await request.json()
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив уведомлений")
+    if len(items) > NOTIFICATION_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Не больше {NOTIFICATION_BATCH_MAX} уведомлений за запрос")
+
+    results = [None] * len(items)
+    by_user = {}
+    for index, item in enumerate(items):
+        user_id = item.get("user_id") if isinstance(item, dict) else None
+        by_user.setdefault(user_id, []).append(index)
+
+    async def deliver_user(indexes):
+        for index in indexes:
+            item = items[index]
+            if not isinstance(item, dict):
+                results[index] = {"status": "error", "message": "Уведомление должно быть объектом"}
+                continue
+            results[index] = await deliver_reservation_notification(item)
+
+    await asyncio.gather(*(deliver_user(indexes) for indexes in by_user.values()))
+    delivered = sum(1 for result in results if result.get("delivery_confirmed"))
+    logger.info(f"Пакет уведомлений: доставлено {delivered} из {len(items)}")
+    return {"results": results}
+
+@app.get("/rate_limiter")
+async def rate_limiter_stats():
+    """Настройки ограничителя скорости и число отправок, ждущих в каждой очереди"""
+    return rate_limiter.stats()
+
 @app.post("/notify")
 async def handle_notification(request: NotificationRequest):
     try:
@@ -924,6 +987,7 @@ async def handle_notification(request: NotificationRequest):
             f"Дата: {request.reservation_date}"
         )
         
+        await rate_limiter.acquire(request.user_id, PRIORITY_TRANSACTIONAL)
         await bot.send_message(
             chat_id=request.user_id,
             text=message,
@@ -0,0 +1,217 @@
+"""
+Ограничитель скорости отправки сообщений в Telegram.
+
+Два ведра токенов: общее на бота (TELEGRAM_GLOBAL_RATE сообщений в секунду) и по чату
+(не чаще TELEGRAM_CHAT_RATE сообщений в секунду одному пользователю). Отправители ждут в очереди
+с приоритетами: бронирования (PRIORITY_TRANSACTIONAL) всегда идут раньше рассылок (PRIORITY_MARKETING).
+Если чат первого в очереди еще не готов, токен получает следующий ожидающий с другим чатом.
+
+С RATE_LIMIT_REDIS_URL ведра хранятся в Redis и общие для всех процессов бота;
+при недоступности Redis ограничитель временно считает токены в памяти.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Dict, Tuple
+
+logger = logging.getLogger('telegram_bot')
+
+PRIORITY_TRANSACTIONAL = 0
+PRIORITY_MARKETING = 1
+PRIORITY_NAMES = {PRIORITY_TRANSACTIONAL: "transactional", PRIORITY_MARKETING: "marketing"}
+
+# Telegram допускает около 30 сообщений в секунду на бота и 1 в секунду в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+RATE_LIMIT_PREFIX = "tg:rate"
+# Сколько ожидающих из головы очереди просматривается за один шаг
+RATE_LIMIT_SCAN = 100
+
+# Результат попытки взять токен: (получен, ждать общего ведра, ждать ведра чата) в секундах
+TakeResult = Tuple[bool, float, float]
+
+TAKE_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local chat_interval = 1 / tonumber(ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or rate)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(rate, tokens + (now - updated) * rate)
+if tokens < 1 then
+    return {0, tostring((1 - tokens) / rate), '0'}
+end
+local chat_ready = tonumber(redis.call('GET', KEYS[2]) or 0)
+if chat_ready > now then
+    return {0, '0', tostring(chat_ready - now)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], 60)
+redis.call('SET', KEYS[2], tostring(now + chat_interval), 'PX', math.ceil(chat_interval * 1000) + 1000)
+return {1, '0', '0'}
+"""
+
+PENALIZE_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local seconds = tonumber(ARGV[1])
+redis.call('SET', KEYS[1], tostring(now + seconds), 'PX', math.ceil(seconds * 1000) + 1000)
+"""
+
+
+class LocalBuckets:
+    """Ведра токенов в памяти процесса"""
+
+    def __init__(self, global_rate: float, chat_rate: float):
+        self.global_rate = global_rate
+        self.chat_interval = 1 / chat_rate
+        self.tokens = global_rate
+        self.updated = time.monotonic()
+        self.chat_ready: Dict[int, float] = {}
+
+    async def take(self, chat_id) -> TakeResult:
+        now = time.monotonic()
+        self.tokens = min(self.global_rate, self.tokens + (now - self.updated) * self.global_rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False, (1 - self.tokens) / self.global_rate, 0
+        chat_wait = self.chat_ready.get(chat_id, 0) - now
+        if chat_wait > 0:
+            return False, 0, chat_wait
+        self.tokens -= 1
+        self.chat_ready[chat_id] = now + self.chat_interval
+        if len(self.chat_ready) > 10000:
+            self.chat_ready = {chat: ready for chat, ready in self.chat_ready.items() if ready > now}
+        return True, 0, 0
+
+    async def penalize(self, chat_id, seconds: float) -> None:
+        self.chat_ready[chat_id] = max(self.chat_ready.get(chat_id, 0), time.monotonic() + seconds)
+
+
+class RedisBuckets:
+    """Ведра токенов в Redis, общие для всех процессов бота"""
+
+    def __init__(self, redis_client, global_rate: float, chat_rate: float):
+        self.redis = redis_client
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self._take = redis_client.register_script(TAKE_LUA)
+        self._penalize = redis_client.register_script(PENALIZE_LUA)
+        self.fallback = LocalBuckets(global_rate, chat_rate)
+
+    async def take(self, chat_id) -> TakeResult:
+        try:
+            granted, global_wait, chat_wait = await self._take(
+                keys=[f"{RATE_LIMIT_PREFIX}:global", f"{RATE_LIMIT_PREFIX}:chat:{chat_id}"],
+                args=[self.global_rate, self.chat_rate]
+            )
+        except Exception as e:
+            logger.warning(f"Ограничитель скорости в Redis недоступен, считаем токены в памяти: {e}")
+            return await self.fallback.take(chat_id)
+        return bool(int(granted)), float(global_wait), float(chat_wait)
+
+    async def penalize(self, chat_id, seconds: float) -> None:
+        try:
+            await self._penalize(keys=[f"{RATE_LIMIT_PREFIX}:chat:{chat_id}"], args=[seconds])
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить flood wait чата {chat_id} в Redis: {e}")
+            await self.fallback.penalize(chat_id, seconds)
+
+
+class TelegramRateLimiter:
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 redis_client=None):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        if redis_client is not None:
+            self.backend = "redis"
+            self.buckets = RedisBuckets(redis_client, global_rate, chat_rate)
+        else:
+            self.backend = "local"
+            self.buckets = LocalBuckets(global_rate, chat_rate)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+
+    async def acquire(self, chat_id, priority: int = PRIORITY_TRANSACTIONAL) -> None:
+        """Ждет разрешения отправить одно сообщение в чат chat_id"""
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), chat_id, future))
+        self._wakeup.set()
+        await future
+
+    async def penalize(self, chat_id, seconds: float) -> None:
+        """Telegram вернул flood wait: не отправлять в этот чат seconds секунд"""
+        await self.buckets.penalize(chat_id, seconds)
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                depth[name] = depth.get(name, 0) + 1
+        return depth
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "global_rate": self.global_rate,
+            "chat_rate": self.chat_rate,
+            "queue_depth": self.queue_depth(),
+        }
+
+    def _ensure_dispatcher(self) -> None:
+        # Запускается при первом ожидании: бот стартует и через main(), и через uvicorn main:app
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while True:
+            try:
+                # Отмененные ожидания выбрасываются из головы очереди
+                while self._waiters and self._waiters[0][3].done():
+                    heapq.heappop(self._waiters)
+                if not self._waiters:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                delay = await self._grant_next()
+                if delay > 0:
+                    # Новый ожидающий может оказаться с готовым чатом — просыпаемся и на него
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except Exception as e:
+                logger.error(f"Ошибка в ограничителе скорости: {e}")
+                await asyncio.sleep(0.1)
+
+    async def _grant_next(self) -> float:
+        """Выдает токен первому по приоритету ожидающему с готовым чатом; иначе возвращает, сколько ждать"""
+        chat_waits = []
+        tried = set()
+        for entry in heapq.nsmallest(RATE_LIMIT_SCAN, self._waiters):
+            _, _, chat_id, future = entry
+            if future.done() or chat_id in tried:
+                continue
+            tried.add(chat_id)
+            granted, global_wait, chat_wait = await self.buckets.take(chat_id)
+            if granted:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                return 0
+            if global_wait > 0:
+                return global_wait
+            chat_waits.append(chat_wait)
+        return min(chat_waits) if chat_waits else 0.01
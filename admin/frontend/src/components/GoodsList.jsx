@@ -40,7 +40,7 @@ const GoodsList = () => {
       
       console.log(`Загрузка товаров: reset=${reset}, skipValue=${skipValue}, limit=${limit}`);
       
-      const data = await getGoods({ skip: skipValue, limit });
+      const data = await getGoods({ skip: skipValue, limit, view: 'summary' });
       if (data) {
         const items = Array.isArray(data.items) ? data.items : [];
         console.log(`Получено ${items.length} товаров из ${data.total} всего`);
@@ -171,7 +171,7 @@ const GoodsList = () => {
     setTotal(0);
     setHasMore(true);
     try {
-      const data = await searchGoods(query, { skip: 0, limit: pageSize });
+      const data = await searchGoods(query, { skip: 0, limit: pageSize, view: 'summary' });
       if (data) {
         const items = Array.isArray(data.items) ? data.items : [];
         setGoods(items);
@@ -84,8 +84,8 @@ export const useApi = () => {
 
   // Получение всех товаров с пагинацией
   const getGoods = useCallback(async (params = {}) => {
-    // params: { skip, limit, includeHidden }
-    const { skip = 0, limit = 100, includeHidden = true } = params;
+    // params: { skip, limit, includeHidden, view }
+    const { skip = 0, limit = 100, includeHidden = true, view } = params;
     
     // Добавляем логирование для отладки
     console.log(`Запрос товаров: skip=${skip}, limit=${limit}, includeHidden=${includeHidden}`);
@@ -95,6 +95,9 @@ export const useApi = () => {
     searchParams.append('skip', skip);
     searchParams.append('limit', limit);
     searchParams.append('include_hidden', includeHidden);
+    if (view) {
+      searchParams.append('view', view);
+    }
     
     const url = `/goods/?${searchParams.toString()}`;
     console.log(`URL запроса: ${url}`);
@@ -104,8 +107,9 @@ export const useApi = () => {
 
   // Поиск товаров с пагинацией
   const searchGoods = useCallback(async (query, params = {}) => {
-    const { skip = 0, limit = 100 } = params;
-    return request('get', `/goods/?search=${encodeURIComponent(query)}&skip=${skip}&limit=${limit}`);
+    const { skip = 0, limit = 100, view } = params;
+    const viewParam = view ? `&view=${view}` : '';
+    return request('get', `/goods/?search=${encodeURIComponent(query)}&skip=${skip}&limit=${limit}${viewParam}`);
   }, [request]);
 
   // Получение товара по ID